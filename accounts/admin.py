@@ -1,7 +1,20 @@
 
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import PasswordResetToken, User
+from . import bulk
+from .models import AuthEvent, OutboundEmail, PasswordResetToken, User
+
+
+def _bulk_action(name, description):
+    """Ação do admin que aplica accounts.bulk aos usuários selecionados"""
+    def action(modeladmin, request, queryset):
+        ids = queryset.exclude(pk=request.user.pk).values_list('pk', flat=True)
+        count = bulk.ACTIONS[name](ids)
+        modeladmin.message_user(request, f'{description}: {count} usuário(s).')
+    action.__name__ = f'bulk_{name}'
+    # Só para quem pode alterar usuários (não basta a permissão de ver)
+    return admin.action(description=description,
+                        permissions=['change'])(action)
 
 
 @admin.register(User)
@@ -17,11 +30,47 @@ class CustomUserAdmin(UserAdmin):
     fieldsets = UserAdmin.fieldsets + ((
         'Autenticação de Dois Fatores', {'fields': ('is_2fa_enabled', 'otp_secret')}
     ),)
+    actions = [
+        _bulk_action('activate', 'Ativar usuários selecionados'),
+        _bulk_action('deactivate', 'Desativar usuários selecionados'),
+        _bulk_action('disable_2fa', 'Desativar 2FA dos usuários selecionados'),
+    ]
+
+    def delete_queryset(self, request, queryset):
+        # "Excluir selecionados" em lotes, sem carregar cada usuário
+        bulk.delete(queryset.values_list('pk', flat=True))
 
 
 @admin.register(PasswordResetToken)
 class PasswordResetTokenAdmin(admin.ModelAdmin):
     """Admin configuration for the PasswordResetToken model."""
-    list_display = ('user', 'created_at')
+    list_display = ('user', 'created_at', 'is_used')
     search_fields = ('user__username', 'user__email')
-    readonly_fields = ('created_at',)
+    readonly_fields = ('token_hash', 'created_at')
+
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    """Admin configuration for the outbound email queue."""
+    list_display = ('subject', 'status', 'attempts', 'next_attempt_at',
+                    'sent_at')
+    list_filter = ('status',)
+    readonly_fields = ('created_at', 'sent_at')
+
+
+@admin.register(AuthEvent)
+class AuthEventAdmin(admin.ModelAdmin):
+    """Admin configuration for the authentication audit log (read-only)."""
+    list_display = ('created_at', 'event', 'user_id', 'email', 'ip')
+    list_filter = ('event',)
+    search_fields = ('email',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        # Eventos antigos saem pelo comando prune_auth_events
+        return False
@@ -0,0 +1,176 @@
+"""
+Versões assíncronas (ASGI) das views de autenticação.
+
+Com ASYNC_AUTH_VIEWS habilitado elas substituem as views equivalentes de
+accounts.views nas URLs. O ORM é usado pela API assíncrona, o KDF roda em
+um executor (EmailBackend.aauthenticate) e o envio de e-mail não bloqueia
+o event loop (adispatch_mail). Sob WSGI prefira as views síncronas: cada
+view assíncrona exigiria um event loop por requisição.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.auth import aauthenticate, alogin, alogout
+from django.http import Http404
+from django.shortcuts import redirect, render
+from django.urls import reverse
+
+from . import audit, metrics, ratelimit as rate_limits
+from .decorators import anonymous_required, cacheable_page, ratelimit
+from .forms import LoginForm, PasswordResetRequestForm, TwoFactorLoginForm
+from .mail import adispatch_mail
+from .models import AuthEvent, User
+from .otp import (
+    DEVICE_SESSION_KEY, BackupCodeDevice, backup_codes_remaining,
+    verify_token,
+)
+from .tokens import get_reset_tokens
+from .user_cache import aget_cached_user, aload_credentials
+
+
+async def arender(request, template_name, context=None):
+    """
+    render() para views assíncronas. Carrega o usuário e a sessão antes,
+    já que o template (menu, mensagens) acessa os dois de forma síncrona.
+    """
+    request.user = await request.auser()
+    await request.session.akeys()
+    return render(request, template_name, context)
+
+
+@ratelimit('login', key='ip')
+@ratelimit('login', key='email_ip')
+@anonymous_required
+@cacheable_page
+async def alogin_view(request):
+    if request.method == 'POST':
+        form = LoginForm(request.POST)
+        if form.is_valid():
+            email = form.cleaned_data['email']
+            password = form.cleaned_data['password']
+            user = await aauthenticate(request, email=email,
+                                       password=password)
+
+            if user is not None:
+                await sync_to_async(rate_limits.reset)(
+                    request, 'login', 'email_ip'
+                )
+                if user.is_2fa_enabled:
+                    metrics.LOGIN_ATTEMPTS.inc(result='2fa_required')
+                    await request.session.aset('pre_2fa_user_id', user.id)
+                    return redirect('verify_2fa')
+                metrics.LOGIN_ATTEMPTS.inc(result='success')
+                await alogin(request, user)
+                return redirect(settings.LOGIN_REDIRECT_URL)
+            metrics.LOGIN_ATTEMPTS.inc(result='failure')
+            messages.error(request, 'E-mail ou senha inválidos. Por favor, tente novamente.')
+    else:
+        form = LoginForm()
+    return await arender(request, 'accounts/login.html', {'form': form})
+
+
+@ratelimit('verify_2fa', key='ip')
+@ratelimit('verify_2fa', key='pre_2fa_user')
+async def averify_2fa_view(request):
+    user_id = await request.session.aget('pre_2fa_user_id')
+    if not user_id:
+        messages.error(request, 'Sessão de login inválida. Por favor, faça o login novamente.')
+        return redirect('home')
+
+    user = await aget_cached_user(user_id)
+    if user is None:
+        raise Http404
+    await aload_credentials(user)
+
+    if request.method == 'POST':
+        form = TwoFactorLoginForm(request.POST)
+        if form.is_valid():
+            # UPDATE condicional e cache do último passo, API síncrona
+            device = await sync_to_async(verify_token)(
+                user, form.cleaned_data['token']
+            )
+            metrics.TWO_FACTOR_VERIFICATIONS.inc(
+                result='success' if device is not None else 'failure'
+            )
+            if device is not None:
+                await request.session.apop('pre_2fa_user_id')
+                await alogin(request, user,
+                             backend='accounts.backends.EmailBackend')
+                await request.session.aset(DEVICE_SESSION_KEY, device.name)
+                messages.success(request, 'Login realizado com sucesso!')
+                if device.name == BackupCodeDevice.name:
+                    messages.info(request,
+                        f'Código de backup usado. Restam '
+                        f'{backup_codes_remaining(user)} código(s).')
+                return redirect('dashboard')
+            await audit.arecord(AuthEvent.TWO_FACTOR_FAILED, request, user)
+            messages.error(request, 'Código inválido')
+    else:
+        form = TwoFactorLoginForm()
+
+    return await arender(request, 'accounts/verify_2fa.html', {'form': form})
+
+
+@ratelimit('password_reset', key='ip')
+@ratelimit('password_reset', key='email_ip')
+@cacheable_page
+async def apassword_reset_request_view(request):
+    is_console_backend = 'console' in settings.EMAIL_BACKEND.lower()
+
+    if request.method == 'POST':
+        form = PasswordResetRequestForm(request.POST)
+        if form.is_valid():
+            email = form.cleaned_data['email']
+            user = await User.objects.with_email(email).afirst()
+            # Não revela se o usuário existe ou não
+            if user is not None:
+                token = await get_reset_tokens().amake_token(user)
+                await audit.arecord(AuthEvent.PASSWORD_RESET_REQUESTED,
+                                    request, user)
+                reset_url = request.build_absolute_uri(
+                    reverse('password_reset_confirm', args=[token])
+                )
+                try:
+                    await adispatch_mail(
+                        'Redefinição de Senha',
+                        f'Clique no link para redefinir sua senha: {reset_url}',
+                        settings.DEFAULT_FROM_EMAIL,
+                        [email],
+                    )
+                except Exception as e:
+                    messages.error(request,
+                        f'Erro ao enviar e-mail: {str(e)}. '
+                        'Verifique as configurações de e-mail.')
+                    return await arender(request, 'accounts/password_reset_request.html', {
+                        'form': form,
+                        'is_console_backend': is_console_backend
+                    })
+                if is_console_backend:
+                    messages.info(request,
+                        '⚠️ Modo Desenvolvimento: Email não foi enviado. '
+                        'Verifique o console do servidor ou use o link abaixo.')
+                    return await arender(request, 'accounts/password_reset_request.html', {
+                        'form': form,
+                        'reset_url': reset_url,
+                        'is_console_backend': True
+                    })
+                messages.success(request,
+                    'Email de redefinição de senha enviado com sucesso! '
+                    'Verifique sua caixa de entrada (e a pasta de spam).')
+
+            if not is_console_backend:
+                messages.success(request,
+                    'Se um usuário com esse e-mail existir, um link para redefinição de senha foi enviado.')
+            return redirect('home')
+    else:
+        form = PasswordResetRequestForm()
+
+    return await arender(request, 'accounts/password_reset_request.html', {
+        'form': form,
+        'is_console_backend': is_console_backend
+    })
+
+
+async def alogout_view(request):
+    await alogout(request)
+    return redirect('home')
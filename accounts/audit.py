@@ -0,0 +1,213 @@
+"""
+Registro de eventos de autenticação (AuthEvent).
+
+record() só acrescenta o evento a um buffer em memória do processo; o
+buffer é gravado de uma vez quando chega a AUDIT_LOG['BATCH_SIZE'] eventos
+ou quando passa AUDIT_LOG['FLUSH_INTERVAL'] segundos desde a última
+gravação (verificado a cada evento e ao fim de cada requisição). Com o
+backend 'database' a gravação é um bulk_create; com 'jsonl' os eventos vão
+para um arquivo por dia em AUDIT_LOG['PATH'], com uma única escrita em modo
+append por lote.
+
+Dentro de uma transação de quem chamou record() o buffer não é gravado no
+banco (um rollback dela desfaria os eventos de outras requisições): a
+gravação fica para o próximo evento fora da transação ou para o fim da
+requisição.
+
+Ao sair, o processo grava o que restou no buffer, desde que o banco ainda
+seja aquele em que os eventos foram registrados (nos testes o banco de
+teste já foi destruído e o nome voltou para o do banco real).
+
+Login, falha de login e logout vêm dos sinais do django.contrib.auth, que
+também são enviados pelas views assíncronas; os demais eventos são
+registrados pelas views.
+"""
+import atexit
+import ipaddress
+import json
+import logging
+import os
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.signals import (
+    user_logged_in, user_logged_out, user_login_failed,
+)
+from django.core.signals import request_finished
+from django.db import connections, transaction
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import AuthEvent, event_partition
+from .ratelimit import client_ip
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_buffer = []
+_last_flush = time.monotonic()
+# Banco em que estavam os eventos do buffer (ver _flush_at_exit)
+_buffer_database = None
+
+_EMAIL_MAX_LENGTH = AuthEvent._meta.get_field('email').max_length
+
+
+def _options():
+    return settings.AUDIT_LOG
+
+
+def _database_name():
+    return connections[AuthEvent.objects.db].settings_dict['NAME']
+
+
+def _ip(request):
+    """IP do cliente; None se REMOTE_ADDR não for um IP (ex.: socket)"""
+    if request is None:
+        return None
+    try:
+        return str(ipaddress.ip_address(client_ip(request)))
+    except ValueError:
+        return None
+
+
+def _append(event, request, user, email):
+    """Acrescenta o evento ao buffer; retorna True se é hora de gravar"""
+    global _buffer_database
+    now = timezone.now()
+    # Aceita o usuário ou apenas o id (ações em massa)
+    user_id = getattr(user, 'pk', user)
+    entry = AuthEvent(
+        partition=event_partition(now),
+        created_at=now,
+        event=event,
+        user_id=user_id,
+        # Um valor inválido derrubaria a gravação do lote inteiro
+        email=(email or getattr(user, 'email', '') or '')[:_EMAIL_MAX_LENGTH],
+        ip=_ip(request),
+    )
+    with _lock:
+        if not _buffer:
+            _buffer_database = _database_name()
+        _buffer.append(entry)
+        size = len(_buffer)
+    return size >= _options()['BATCH_SIZE'] or _flush_due()
+
+
+def _flush_due():
+    return time.monotonic() - _last_flush >= _options()['FLUSH_INTERVAL']
+
+
+def _in_transaction():
+    return _options()['BACKEND'] != 'jsonl' and \
+        transaction.get_connection(AuthEvent.objects.db).in_atomic_block
+
+
+def record(event, request=None, user=None, email=''):
+    """Registra um evento (AuthEvent.EVENT_CHOICES) do usuário ou id"""
+    if not _options()['ENABLED']:
+        return
+    if _append(event, request, user, email) and not _in_transaction():
+        flush()
+
+
+async def arecord(event, request=None, user=None, email=''):
+    """Versão assíncrona de record(); só a gravação vai para uma thread"""
+    if not _options()['ENABLED']:
+        return
+    if _append(event, request, user, email):
+        await sync_to_async(flush, thread_sensitive=False)()
+
+
+def _write_jsonl(events):
+    path = _options()['PATH']
+    os.makedirs(path, exist_ok=True)
+    filename = os.path.join(
+        path, f'auth-events-{events[0].created_at:%Y%m%d}.jsonl'
+    )
+    lines = ''.join(json.dumps({
+        'created_at': event.created_at.isoformat(),
+        'event': event.event,
+        'user_id': event.user_id,
+        'email': event.email,
+        'ip': event.ip,
+    }) + '\n' for event in events)
+    # Uma única escrita com O_APPEND: linhas de processos diferentes não
+    # se misturam
+    fd = os.open(filename, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o640)
+    try:
+        os.write(fd, lines.encode())
+    finally:
+        os.close(fd)
+
+
+def flush():
+    """Grava os eventos em buffer deste processo; retorna quantos"""
+    global _last_flush
+    with _lock:
+        events = _buffer[:]
+        _buffer.clear()
+        _last_flush = time.monotonic()
+    if not events:
+        return 0
+    try:
+        if _options()['BACKEND'] == 'jsonl':
+            _write_jsonl(events)
+        else:
+            # Savepoint próprio: uma falha aqui não deixa inutilizável a
+            # transação de quem chamou flush() (ex.: history())
+            with transaction.atomic(using=AuthEvent.objects.db):
+                AuthEvent.objects.bulk_create(
+                    events, batch_size=_options()['BATCH_SIZE']
+                )
+    except Exception:
+        # Uma falha no registro não pode derrubar o login
+        logger.exception('Falha ao gravar %d evento(s) de autenticação',
+                         len(events))
+        return 0
+    return len(events)
+
+
+def history(user, limit=50):
+    """
+    Últimos eventos do usuário. Grava antes o buffer deste processo; eventos
+    ainda em buffer em outros workers aparecem após o próximo flush deles.
+    Requer o backend 'database'.
+    """
+    flush()
+    return list(AuthEvent.objects.for_user(user)[:limit])
+
+
+@receiver(user_logged_in)
+def _logged_in(sender, request, user, **kwargs):
+    record(AuthEvent.LOGIN_SUCCEEDED, request, user)
+
+
+@receiver(user_login_failed)
+def _login_failed(sender, credentials, request=None, **kwargs):
+    record(AuthEvent.LOGIN_FAILED, request,
+           email=credentials.get('email') or credentials.get('username', ''))
+
+
+@receiver(user_logged_out)
+def _logged_out(sender, request, user, **kwargs):
+    if user is not None:
+        record(AuthEvent.LOGOUT, request, user)
+
+
+@receiver(request_finished)
+def _flush_if_due(sender, **kwargs):
+    if _buffer and _flush_due():
+        flush()
+
+
+@atexit.register
+def _flush_at_exit():
+    if _buffer and _options()['BACKEND'] != 'jsonl' \
+            and _buffer_database != _database_name():
+        logger.warning('%d evento(s) de autenticação descartados: o banco '
+                       'mudou desde o registro', len(_buffer))
+        _buffer.clear()
+        return
+    flush()
@@ -1,15 +1,121 @@
+from asgiref.sync import sync_to_async
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import verify_password
+from django.core.exceptions import PermissionDenied
+
+from .credential_cache import get_credential_cache
+from .hashers import hash_is_outdated
+from .metrics import timed
+from .user_cache import aget_cached_user, get_cached_user
 
 UserModel = get_user_model()
 
+
+def offload(func):
+    """
+    Executa func em uma thread do executor. Usado para o KDF nas views
+    assíncronas: o hashlib libera o GIL e o event loop segue atendendo.
+    """
+    return sync_to_async(func, thread_sensitive=False)
+
+
 class EmailBackend(ModelBackend):
+    """
+    Autentica por e-mail com custo constante.
+
+    Um login com falha custa exatamente uma consulta e uma execução do KDF,
+    exista o e-mail ou não, para que o tempo de resposta não revele quais
+    contas existem. Falhas levantam PermissionDenied, o que interrompe a
+    busca em AUTHENTICATION_BACKENDS e evita a segunda consulta do
+    ModelBackend.
+    """
+
+    @staticmethod
+    def _email(email, kwargs):
+        if email is None:
+            # O admin envia o e-mail como `username` (USERNAME_FIELD)
+            email = kwargs.get('username',
+                               kwargs.get(UserModel.USERNAME_FIELD))
+        return email
+
+    def _verify(self, user, password):
+        """
+        Retorna (senha correta, hash desatualizado). Um login repetido com
+        a mesma senha dispensa o KDF se o cache de credenciais estiver
+        habilitado.
+        """
+        credential_cache = get_credential_cache()
+        if credential_cache is not None and \
+                credential_cache.check(user, password):
+            # A senha é conhecida: o hash ainda pode ser atualizado
+            return True, hash_is_outdated(user.password)
+        verified, must_update = verify_password(password, user.password)
+        if verified and not must_update and credential_cache is not None:
+            credential_cache.remember(user, password)
+        return verified, must_update
+
+    @staticmethod
+    def _remember(user, password):
+        credential_cache = get_credential_cache()
+        if credential_cache is not None:
+            credential_cache.remember(user, password)
+
+    @timed('authenticate')
     def authenticate(self, request, email=None, password=None, **kwargs):
-        try:
-            user = UserModel.objects.get(email=email)
-        except UserModel.DoesNotExist:
+        email = self._email(email, kwargs)
+        if email is None or password is None:
             return None
 
-        if user.check_password(password):
+        user = UserModel._default_manager.with_email(email).first()
+        if user is None:
+            # Executa o KDF mesmo assim para igualar o tempo de resposta
+            UserModel().set_password(password)
+            raise PermissionDenied
+
+        verified, must_update = self._verify(user, password)
+        if verified and must_update:
+            # Hash de outro hasher ou custo: refaz com o perfil ativo, como
+            # AbstractBaseUser.check_password()
+            user.set_password(password)
+            user._password = None
+            user.save(update_fields=['password'])
+            self._remember(user, password)
+
+        if verified and self.user_can_authenticate(user):
             return user
-        return None
\ No newline at end of file
+        raise PermissionDenied
+
+    @timed('authenticate')
+    async def aauthenticate(self, request, email=None, password=None,
+                            **kwargs):
+        email = self._email(email, kwargs)
+        if email is None or password is None:
+            return None
+
+        user = await UserModel._default_manager.with_email(email).afirst()
+        if user is None:
+            await offload(UserModel().set_password)(password)
+            raise PermissionDenied
+
+        verified, must_update = await offload(self._verify)(user, password)
+        if verified and must_update:
+            await offload(user.set_password)(password)
+            user._password = None
+            await user.asave(update_fields=['password'])
+            await offload(self._remember)(user, password)
+
+        if verified and self.user_can_authenticate(user):
+            return user
+        raise PermissionDenied
+
+    def get_user(self, user_id):
+        # Chamado a cada requisição autenticada: usa o cache de usuários
+        user = get_cached_user(user_id)
+        return user if user is not None and \
+            self.user_can_authenticate(user) else None
+
+    async def aget_user(self, user_id):
+        user = await aget_cached_user(user_id)
+        return user if user is not None and \
+            self.user_can_authenticate(user) else None
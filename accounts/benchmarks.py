@@ -0,0 +1,1085 @@
+"""
+Cenários de benchmark executados por `python manage.py benchmark`.
+
+Cada cenário recebe as opções do comando e retorna um dicionário
+{nome_da_medição: estatísticas}, onde as estatísticas vêm de measure().
+"""
+import http.cookiejar
+import re
+import statistics
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+SCENARIOS = {}
+# Cenários que também rodam contra um servidor em execução (--live-server)
+LIVE_SCENARIOS = set()
+
+
+def scenario(name, live=False):
+    """Registra uma função de benchmark com o nome informado"""
+    def decorator(func):
+        SCENARIOS[name] = func
+        if live:
+            LIVE_SCENARIOS.add(name)
+        return func
+    return decorator
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def summarize(samples):
+    """Resume uma lista de latências (em segundos) em milissegundos"""
+    total = sum(samples)
+    return {
+        'count': len(samples),
+        'mean_ms': statistics.fmean(samples) * 1000 if samples else 0.0,
+        'p50_ms': percentile(samples, 50) * 1000,
+        'p95_ms': percentile(samples, 95) * 1000,
+        'p99_ms': percentile(samples, 99) * 1000,
+        'ops_per_sec': len(samples) / total if total else 0.0,
+    }
+
+
+def measure(func, iterations):
+    """Executa func() `iterations` vezes e resume as latências"""
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def seed_users(prefix, count, password='bench-pass', two_factor=False,
+               otp_secret=None, **fields):
+    """
+    Cria `count` usuários com bulk_create. O hash da senha é calculado uma
+    única vez e reaproveitado, então semear milhares de usuários não roda o
+    KDF por usuário. Retorna os usuários criados, na ordem do índice.
+    """
+    from django.contrib.auth.hashers import make_password
+
+    from .models import User
+
+    encoded = make_password(password)
+    batch_size = 1000
+    for offset in range(0, count, batch_size):
+        User.objects.bulk_create([
+            User(username=f'{prefix}{index}',
+                 email=f'{prefix}{index}@example.com',
+                 password=encoded, is_2fa_enabled=two_factor,
+                 otp_secret=otp_secret, **fields)
+            for index in range(offset, min(offset + batch_size, count))
+        ])
+    users = User.objects.filter(username__startswith=prefix).order_by('pk')
+    return list(users)
+
+
+class LiveResponse:
+    def __init__(self, status_code, content):
+        self.status_code = status_code
+        self.content = content
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class LiveClient:
+    """
+    Cliente HTTP (urllib) com a parte da interface do Client de teste usada
+    pelos cenários: get(), post() e cookies de sessão. Envia o token CSRF
+    do cookie no cabeçalho X-CSRFToken, obtendo-o de /accounts/csrf/.
+    """
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(self.cookies), _NoRedirect,
+        )
+
+    def _csrf_token(self):
+        from django.conf import settings
+
+        for cookie in self.cookies:
+            if cookie.name == settings.CSRF_COOKIE_NAME:
+                return cookie.value
+        return None
+
+    def _request(self, method, path, data=None):
+        url = self.base_url + path
+        headers, body = {}, None
+        if method == 'POST':
+            if self._csrf_token() is None:
+                self.get('/accounts/csrf/')
+            headers = {
+                'Content-Type': 'application/x-www-form-urlencoded',
+                'X-CSRFToken': self._csrf_token(),
+                'Referer': url,
+            }
+            body = urllib.parse.urlencode(data or {}, doseq=True).encode()
+        request = urllib.request.Request(url, data=body, headers=headers,
+                                         method=method)
+        try:
+            with self.opener.open(request) as response:
+                return LiveResponse(response.status, response.read())
+        except urllib.error.HTTPError as error:
+            return LiveResponse(error.code, error.read())
+
+    def get(self, path, data=None):
+        if data:
+            path += '?' + urllib.parse.urlencode(data, doseq=True)
+        return self._request('GET', path)
+
+    def post(self, path, data=None):
+        return self._request('POST', path, data)
+
+
+_QUERIES_SAMPLE = re.compile(
+    r'^http_request_db_queries_(sum|count)\{view="([^"]*)"\} (\S+)$'
+)
+
+
+def scrape_queries(base_url):
+    """Soma e contagem de consultas por view, lidas de /metrics/"""
+    response = LiveClient(base_url).get('/metrics/')
+    totals = {}
+    for line in response.content.decode().splitlines():
+        match = _QUERIES_SAMPLE.match(line)
+        if match:
+            kind, view, value = match.groups()
+            totals.setdefault(view, {'sum': 0.0, 'count': 0.0})
+            totals[view][kind] = float(value)
+    return totals
+
+
+# Estatísticas comparadas por compare_results(), conforme o sentido em que
+# uma mudança é uma piora
+def _lower_is_better(key):
+    return key.endswith(('_ms', 'queries', '_per_login')) or \
+        key in ('ms', 'inserts', 'errors', 'rejected')
+
+
+def _higher_is_better(key):
+    return key.endswith('per_sec') or key == 'served_from_cache'
+
+
+def compare_results(baseline, current, threshold):
+    """
+    Compara dois resultados ({cenário: {medição: estatísticas}}) e retorna
+    as pioras acima de `threshold` por cento como tuplas
+    (cenário, medição, estatística, antes, depois, variação %).
+    """
+    regressions = []
+    for name, measurements in current.items():
+        for label, stats in measurements.items():
+            before = baseline.get(name, {}).get(label, {})
+            for key, new in stats.items():
+                old = before.get(key)
+                if not isinstance(old, (int, float)) or \
+                        not isinstance(new, (int, float)):
+                    continue
+                if _lower_is_better(key):
+                    worse = new - old
+                elif _higher_is_better(key):
+                    worse = old - new
+                else:
+                    continue
+                if worse <= 0:
+                    continue
+                change = worse / old * 100 if old else float('inf')
+                if change > threshold:
+                    regressions.append((name, label, key, old, new, change))
+    return regressions
+
+
+@scenario('authenticate')
+def authenticate_latency(options):
+    """Latência de authenticate() com e sem o cache de credenciais"""
+    from django.contrib.auth import authenticate
+    from django.test import override_settings
+
+    from .models import User
+
+    User.objects.filter(email='bench@example.com').delete()
+    User.objects.create_user(
+        username='bench', email='bench@example.com', password='bench-pass'
+    )
+
+    def login():
+        user = authenticate(email='bench@example.com', password='bench-pass')
+        assert user is not None
+
+    results = {}
+    for label, enabled in (('uncached', False), ('cached', True)):
+        with override_settings(AUTH_CREDENTIAL_CACHE={'ENABLED': enabled}):
+            results[label] = measure(login, options['iterations'])
+    return results
+
+
+@scenario('login-timing')
+def login_timing(options):
+    """Consultas e tempo de authenticate() para acerto, e-mail inexistente
+    e senha errada"""
+    from django.contrib.auth import authenticate
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    from .models import User
+
+    User.objects.filter(email='timing@example.com').delete()
+    User.objects.create_user(
+        username='timing', email='timing@example.com', password='right-pass'
+    )
+
+    cases = {
+        'hit': ('Timing@Example.com', 'right-pass', True),
+        'miss': ('nobody@example.com', 'right-pass', False),
+        'wrong_password': ('timing@example.com', 'wrong-pass', False),
+    }
+    results = {}
+    for label, (email, password, expected) in cases.items():
+        queries = []
+
+        def login():
+            with CaptureQueriesContext(connection) as captured:
+                user = authenticate(email=email, password=password)
+            assert (user is not None) == expected, label
+            queries.append(len(captured))
+
+        stats = measure(login, options['iterations'])
+        stats['queries'] = max(queries)
+        results[label] = stats
+    return results
+
+
+@scenario('ratelimit-flood')
+def ratelimit_flood(options):
+    """CPU por requisição de login durante um ataque a partir de um IP"""
+    from django.core.cache import cache
+    from django.test import Client, override_settings
+
+    from .models import User
+
+    User.objects.filter(email='victim@example.com').delete()
+    User.objects.create_user(
+        username='victim', email='victim@example.com', password='right-pass'
+    )
+    cache.clear()
+    client = Client(REMOTE_ADDR='203.0.113.7')
+    samples = {200: [], 429: []}
+    with override_settings(RATELIMIT_ENABLED=True):
+        for attempt in range(options['iterations'] * 10):
+            start = time.process_time()
+            response = client.post('/', {
+                'email': f'user{attempt}@example.com', 'password': 'guess',
+            })
+            samples.setdefault(response.status_code, []).append(
+                time.process_time() - start
+            )
+    rejected = samples[429]
+    half = len(rejected) // 2
+    return {
+        'accepted_cpu': summarize(samples[200]),
+        'rejected_cpu_first_half': summarize(rejected[:half]),
+        'rejected_cpu_second_half': summarize(rejected[half:]),
+    }
+
+
+@scenario('totp')
+def totp_throughput(options):
+    """Verificações TOTP por segundo: uma a uma vs em lote"""
+    import pyotp
+    from django.core.cache import cache
+
+    from .models import User
+    from .otp import hotp, current_timestep, secret_bytes, verify_totp, \
+        verify_totp_batch
+
+    count = options['iterations'] * 10
+    User.objects.filter(username__startswith='totp-bench-').delete()
+    User.objects.bulk_create([
+        User(username=f'totp-bench-{i}', email=f'totp-bench-{i}@example.com',
+             otp_secret=pyotp.random_base32(), is_2fa_enabled=True)
+        for i in range(count)
+    ])
+    users = list(User.objects.filter(username__startswith='totp-bench-'))
+    timestep = current_timestep()
+    pairs = [(user, hotp(secret_bytes(user.otp_secret), timestep))
+             for user in users]
+
+    def reset():
+        User.objects.filter(pk__in=[user.pk for user in users]) \
+            .update(otp_last_timestep=None)
+        cache.clear()
+        for user in users:
+            user.otp_last_timestep = None
+
+    reset()
+    start = time.perf_counter()
+    single = [verify_totp(user, token) for user, token in pairs]
+    single_elapsed = time.perf_counter() - start
+    replayed = [verify_totp(user, token) for user, token in pairs]
+
+    reset()
+    start = time.perf_counter()
+    batch = verify_totp_batch(pairs)
+    batch_elapsed = time.perf_counter() - start
+
+    assert all(single) and all(batch) and not any(replayed)
+    return {
+        'single': {'count': count, 'ops_per_sec': count / single_elapsed},
+        'batch': {'count': count, 'ops_per_sec': count / batch_elapsed},
+    }
+
+
+@scenario('reset-token-lookup')
+def reset_token_lookup(options):
+    """Latência da busca do token em password_reset_confirm_view com
+    --rows tokens na tabela"""
+    import random
+    import secrets
+
+    from .models import PasswordResetToken, User, hash_reset_token
+
+    user, _ = User.objects.get_or_create(
+        username='reset-bench', email='reset-bench@example.com'
+    )
+    PasswordResetToken.objects.all().delete()
+    tokens = []
+    batch_size = 10000
+    for offset in range(0, options['rows'], batch_size):
+        batch = [secrets.token_urlsafe(32)
+                 for _ in range(min(batch_size, options['rows'] - offset))]
+        PasswordResetToken.objects.bulk_create([
+            PasswordResetToken(user=user, token_hash=hash_reset_token(token))
+            for token in batch
+        ])
+        tokens.extend(random.sample(batch, min(len(batch), 100)))
+
+    def hit():
+        assert PasswordResetToken.objects.get_valid(random.choice(tokens))
+
+    def miss():
+        assert not PasswordResetToken.objects.get_valid(
+            secrets.token_urlsafe(32)
+        )
+
+    iterations = options['iterations'] * 50
+    return {'hit': measure(hit, iterations), 'miss': measure(miss, iterations)}
+
+
+@scenario('session-flow')
+def session_flow(options):
+    """Consultas por requisição no fluxo login -> 2FA -> dashboard para
+    cada SESSION_ENGINE"""
+    import pyotp
+    from django.core.cache import caches
+    from django.db import connection
+    from django.test import Client, override_settings
+    from django.test.utils import CaptureQueriesContext
+
+    from .models import User
+
+    secret = pyotp.random_base32()
+    User.objects.filter(email='flow@example.com').delete()
+    User.objects.create_user(
+        username='flow', email='flow@example.com', password='flow-pass',
+        otp_secret=secret, is_2fa_enabled=True,
+    )
+    engines = [
+        'django.contrib.sessions.backends.db',
+        'django.contrib.sessions.backends.cached_db',
+        'django.contrib.sessions.backends.signed_cookies',
+        'accounts.sessions',
+    ]
+    steps = [
+        ('login', 'post', '/',
+         {'email': 'flow@example.com', 'password': 'flow-pass'}),
+        ('verify_2fa', 'post', '/accounts/verify-2fa/', None),
+        ('dashboard', 'get', '/accounts/dashboard/', None),
+        ('dashboard_again', 'get', '/accounts/dashboard/', None),
+    ]
+    results = {}
+    for engine in engines:
+        caches['sessions'].clear()
+        queries = {name: [] for name, *_ in steps}
+        # Cache de usuários ligado como em produção (com cache compartilhado)
+        with override_settings(SESSION_ENGINE=engine, RATELIMIT_ENABLED=False,
+                               AUTH_CREDENTIAL_CACHE={'ENABLED': True},
+                               USER_CACHE_TIMEOUT=300):
+            for _ in range(options['iterations']):
+                User.objects.filter(email='flow@example.com') \
+                    .update(otp_last_timestep=None)
+                caches['default'].clear()
+                client = Client()
+                for name, method, url, data in steps:
+                    if name == 'verify_2fa':
+                        data = {'token': pyotp.TOTP(secret).now()}
+                    with CaptureQueriesContext(connection) as captured:
+                        response = getattr(client, method)(url, data)
+                    assert response.status_code in (200, 302), name
+                    queries[name].append(len(captured))
+        results[engine] = {
+            f'{name}_queries': sum(counts) / len(counts)
+            for name, counts in queries.items()
+        }
+    return results
+
+
+@scenario('backup-codes')
+def backup_code_consume(options):
+    """Custo de usar um código de backup em função de quantos existem"""
+    from .models import User
+    from .otp import consume_backup_code, generate_backup_codes
+
+    User.objects.filter(email='backup@example.com').delete()
+    user = User.objects.create_user(
+        username='backup', email='backup@example.com', password='bench-pass',
+        is_2fa_enabled=True,
+    )
+    results = {}
+    for count in (10, 100, 1000):
+        codes = []
+
+        def consume():
+            if not codes:
+                codes.extend(generate_backup_codes(user, count))
+            assert consume_backup_code(user, codes.pop())
+
+        results[f'{count}_codes'] = measure(consume, options['iterations'])
+        assert not consume_backup_code(user, 'invalid-code')
+    return results
+
+
+def database_mode(connection):
+    """Descrição do banco em uso, ex.: 'sqlite/wal' ou 'postgresql/pool'"""
+    if connection.vendor == 'sqlite':
+        if connection.is_in_memory_db():
+            return 'sqlite/memory'
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            return f'sqlite/{cursor.fetchone()[0]}'
+    if connection.settings_dict['OPTIONS'].get('pool'):
+        return f'{connection.vendor}/pool'
+    return f'{connection.vendor}/conn_max_age=' \
+        f'{connection.settings_dict["CONN_MAX_AGE"]}'
+
+
+@scenario('concurrency')
+def concurrent_register_login(options):
+    """Vazão de cadastro e login com clientes em paralelo. Com SQLite use
+    DB_TEST_NAME=<arquivo> para que as threads compartilhem o banco"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    from django.db import connection, connections
+    from django.test import Client, override_settings
+
+    workers = options['workers']
+    if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+        # O banco em memória não suporta escritas concorrentes
+        workers = 1
+    password = 'Bench-pass-2026!'
+
+    def run(worker):
+        client = Client()
+        samples = {'register': [], 'login': []}
+        errors = 0
+        try:
+            for index in range(options['iterations']):
+                name = f'conc{worker}x{index}'
+                requests = (
+                    ('register', '/accounts/register/', {
+                        'username': name, 'email': f'{name}@example.com',
+                        'first_name': 'Bench', 'last_name': 'Mark',
+                        'password1': password, 'password2': password,
+                    }),
+                    ('login', '/', {
+                        'email': f'{name}@example.com', 'password': password,
+                    }),
+                )
+                for label, url, data in requests:
+                    start = time.perf_counter()
+                    try:
+                        response = client.post(url, data)
+                    except Exception:
+                        errors += 1
+                        continue
+                    samples[label].append(time.perf_counter() - start)
+                    if response.status_code != 302:
+                        errors += 1
+                client.cookies.clear()
+        finally:
+            # Cada thread abre a própria conexão
+            connections.close_all()
+        return samples, errors
+
+    # O custo do hasher esconderia a contenção no banco
+    with override_settings(
+        PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+        RATELIMIT_ENABLED=False,
+    ):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            outcomes = list(executor.map(run, range(workers)))
+        elapsed = time.perf_counter() - start
+
+    samples = {'register': [], 'login': []}
+    errors = 0
+    for worker_samples, worker_errors in outcomes:
+        for label, values in worker_samples.items():
+            samples[label].extend(values)
+        errors += worker_errors
+    completed = sum(len(values) for values in samples.values())
+    return {
+        **{label: summarize(values) for label, values in samples.items()},
+        database_mode(connection): {
+            'workers': workers,
+            'requests_per_sec': completed / elapsed if elapsed else 0.0,
+            'errors': errors,
+        },
+    }
+
+
+@scenario('async-views')
+def sync_vs_async_views(options):
+    """Vazão de login, redefinição de senha e logout com as views síncronas
+    (uma thread por cliente) e assíncronas (um event loop), com o mesmo
+    número de clientes. Com SQLite use DB_TEST_NAME=<arquivo>"""
+    import asyncio
+    import types
+    from concurrent.futures import ThreadPoolExecutor
+
+    from django.db import connection, connections
+    from django.test import AsyncClient, Client, override_settings
+
+    from config.urls import build_urlpatterns
+
+    from .models import User
+
+    workers = options['workers']
+    if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+        workers = 1
+    password = 'bench-pass'
+    for worker in range(workers):
+        User.objects.filter(email=f'async{worker}@example.com').delete()
+        User.objects.create_user(username=f'async{worker}',
+                                 email=f'async{worker}@example.com',
+                                 password=password)
+
+    def steps(worker):
+        email = f'async{worker}@example.com'
+        return (
+            ('/', {'email': email, 'password': password}),
+            ('/accounts/password-reset/', {'email': email}),
+            ('/accounts/logout/', {}),
+        )
+
+    def run_sync(worker):
+        client = Client()
+        samples = []
+        try:
+            for _ in range(options['iterations']):
+                for url, data in steps(worker):
+                    start = time.perf_counter()
+                    response = client.post(url, data)
+                    samples.append(time.perf_counter() - start)
+                    assert response.status_code == 302, url
+        finally:
+            connections.close_all()
+        return samples
+
+    async def run_async(worker):
+        client = AsyncClient()
+        samples = []
+        for _ in range(options['iterations']):
+            for url, data in steps(worker):
+                start = time.perf_counter()
+                response = await client.post(url, data)
+                samples.append(time.perf_counter() - start)
+                assert response.status_code == 302, url
+        return samples
+
+    async def run_all_async():
+        return await asyncio.gather(*map(run_async, range(workers)))
+
+    results = {}
+    for mode in ('sync', 'async'):
+        urlconf = types.ModuleType(f'benchmark_{mode}_urls')
+        urlconf.urlpatterns = build_urlpatterns(mode == 'async')
+        with override_settings(ROOT_URLCONF=urlconf, RATELIMIT_ENABLED=False,
+                               AUTH_CREDENTIAL_CACHE={'ENABLED': False}):
+            start = time.perf_counter()
+            if mode == 'sync':
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    outcomes = list(executor.map(run_sync, range(workers)))
+            else:
+                outcomes = asyncio.run(run_all_async())
+            elapsed = time.perf_counter() - start
+        samples = [sample for outcome in outcomes for sample in outcome]
+        results[mode] = {
+            **summarize(samples),
+            'workers': workers,
+            'requests_per_sec': len(samples) / elapsed if elapsed else 0.0,
+        }
+    return results
+
+
+@scenario('hashing-pool')
+def hashing_pool_burst(options):
+    """Rajada de cálculos de hash em --workers threads, no próprio processo
+    e no pool de hashing (latência e rejeições por pool cheio)"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    from django.contrib.auth.hashers import make_password
+    from django.test import override_settings
+
+    from .hashers import HashingPoolSaturated, get_hashing_pool
+
+    def run(_):
+        samples, rejected = [], 0
+        for _ in range(options['iterations']):
+            start = time.perf_counter()
+            try:
+                make_password('bench-pass')
+            except HashingPoolSaturated:
+                rejected += 1
+                continue
+            samples.append(time.perf_counter() - start)
+        return samples, rejected
+
+    modes = {
+        'inline': {'ENABLED': False},
+        'pooled': {'ENABLED': True, 'MAX_PENDING': 0},
+    }
+    results = {}
+    for label, pool_options in modes.items():
+        with override_settings(PASSWORD_HASHING_POOL=pool_options):
+            if get_hashing_pool() is not None:
+                # Sobe os processos antes de medir
+                make_password('warm-up')
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+                outcomes = list(executor.map(run, range(options['workers'])))
+            elapsed = time.perf_counter() - start
+        samples = [sample for outcome, _ in outcomes for sample in outcome]
+        results[label] = {
+            **summarize(samples),
+            'hashes_per_sec': len(samples) / elapsed if elapsed else 0.0,
+            'rejected': sum(rejected for _, rejected in outcomes),
+        }
+    return results
+
+
+@scenario('metrics-overhead')
+def metrics_overhead(options):
+    """Custo de registrar métricas: contador, histograma e exportação"""
+    from . import metrics
+
+    counter = metrics.Counter('benchmark_counter_total', 'benchmark',
+                              ('result',))
+    histogram = metrics.Histogram('benchmark_duration_seconds', 'benchmark',
+                                  ('operation',))
+    batch = 1000
+
+    def increment():
+        for _ in range(batch):
+            counter.inc(result='success')
+
+    def observe():
+        for _ in range(batch):
+            histogram.observe(0.042, operation='authenticate')
+
+    try:
+        results = {
+            f'counter_x{batch}': measure(increment, options['iterations']),
+            f'histogram_x{batch}': measure(observe, options['iterations']),
+            'render': measure(metrics.render, options['iterations']),
+        }
+    finally:
+        del metrics.REGISTRY[counter.name], metrics.REGISTRY[histogram.name]
+    return results
+
+
+@scenario('template-render')
+def template_render(options):
+    """Tempo e consultas por página com o cache de templates e de
+    fragmentos vazios (cold) e preenchidos (warm)"""
+    from django.core.cache import caches
+    from django.db import connection
+    from django.template import engines
+    from django.test import Client, override_settings
+    from django.test.utils import CaptureQueriesContext
+
+    from .models import User
+
+    User.objects.filter(username__startswith='render').delete()
+    staff = User.objects.create_user(
+        username='render', email='render@example.com', password='bench-pass',
+        first_name='Render', is_staff=True,
+    )
+    User.objects.bulk_create([
+        User(username=f'render{index}', email=f'render{index}@example.com',
+             first_name='Render', last_name=str(index))
+        for index in range(min(options['rows'], 1000))
+    ])
+    pages = {
+        'login': (None, '/'),
+        'dashboard': (staff, '/accounts/dashboard/'),
+        'user_list': (staff, '/accounts/users/'),
+    }
+    loaders = engines['django'].engine.template_loaders
+
+    results = {}
+    # Um só processo: o fragmento das linhas vale mesmo sem cache
+    # compartilhado
+    with override_settings(RATELIMIT_ENABLED=False,
+                           USER_LIST_CACHE_TIMEOUT=300):
+        for page, (user, url) in pages.items():
+            client = Client()
+            if user is not None:
+                client.force_login(user)
+            for label, cold in (('cold', True), ('warm', False)):
+                queries = []
+
+                def get():
+                    if cold:
+                        for loader in loaders:
+                            loader.reset()
+                        caches['default'].clear()
+                    with CaptureQueriesContext(connection) as captured:
+                        response = client.get(url)
+                    assert response.status_code == 200, page
+                    queries.append(len(captured))
+
+                get()
+                stats = measure(get, options['iterations'])
+                stats['queries'] = max(queries)
+                results[f'{page}_{label}'] = stats
+    return results
+
+
+@scenario('anonymous-pages')
+def anonymous_pages(options):
+    """Bytes e requisições por login de um visitante que volta à página:
+    HTML completo com token CSRF (baseline) contra página em cache com ETag,
+    compressão e token via /accounts/csrf/ (cacheable)"""
+    import re
+
+    from django.test import Client, override_settings
+
+    from .models import User
+
+    User.objects.filter(email='anon@example.com').delete()
+    User.objects.create_user(username='anon', email='anon@example.com',
+                             password='bench-pass')
+    token_re = re.compile(r'name="csrfmiddlewaretoken" value="(\w+)"')
+    modes = {
+        'baseline': (False, {}),
+        'cacheable': (True, {'HTTP_ACCEPT_ENCODING': 'gzip, br'}),
+    }
+    results = {}
+    for label, (cacheable, headers) in modes.items():
+        client = Client(enforce_csrf_checks=True)
+        etag = None
+        requests = cached = body_bytes = 0
+        samples = []
+
+        def get(url, **extra):
+            nonlocal requests, cached, body_bytes
+            response = client.get(url, **headers, **extra)
+            requests += 1
+            cached += response.status_code == 304
+            body_bytes += len(response.content)
+            return response
+
+        with override_settings(CACHEABLE_PAGES=cacheable,
+                               RATELIMIT_ENABLED=False,
+                               AUTH_CREDENTIAL_CACHE={'ENABLED': True}):
+            for _ in range(options['iterations']):
+                start = time.perf_counter()
+                extra = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+                page = get('/', **extra)
+                if cacheable:
+                    etag = page.get('ETag', etag)
+                    if 'csrftoken' not in client.cookies:
+                        get('/accounts/csrf/')
+                    token = client.cookies['csrftoken'].value
+                else:
+                    token = token_re.search(page.content.decode()).group(1)
+                response = client.post('/', {
+                    'email': 'anon@example.com', 'password': 'bench-pass',
+                    'csrfmiddlewaretoken': token,
+                }, **headers)
+                assert response.status_code == 302, label
+                requests += 1
+                body_bytes += len(response.content)
+                get('/accounts/logout/')
+                samples.append(time.perf_counter() - start)
+        results[label] = {
+            **summarize(samples),
+            'bytes_per_login': body_bytes / options['iterations'],
+            'requests_per_login': requests / options['iterations'],
+            'served_from_cache': cached / requests,
+        }
+    return results
+
+
+@scenario('bulk-actions')
+def bulk_actions(options):
+    """Tempo e consultas das ações em massa de accounts.bulk com 100 e
+    --rows usuários (com tokens de redefinição). As consultas por lote são
+    verificadas em accounts.tests.BulkActionTests"""
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    from . import bulk
+    from .models import PasswordResetToken, User
+
+    results = {}
+    for count in sorted({100, max(options['rows'], 100)}):
+        User.objects.filter(username__startswith='bulk').delete()
+        users = User.objects.bulk_create([
+            User(username=f'bulk{index}', email=f'bulk{index}@example.com',
+                 is_2fa_enabled=True)
+            for index in range(count)
+        ])
+        PasswordResetToken.objects.bulk_create([
+            PasswordResetToken(user=user, token_hash=f'bulk-{user.pk}')
+            for user in users
+        ])
+        ids = [user.pk for user in users]
+        chunks = -(-count // bulk.CHUNK_SIZE)
+        for name in ('deactivate', 'activate', 'disable_2fa', 'delete'):
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                affected = bulk.ACTIONS[name](ids)
+                elapsed = time.perf_counter() - start
+            assert affected == count, name
+            queries = len([
+                query for query in captured.captured_queries
+                if query['sql'].startswith(('SELECT', 'UPDATE', 'DELETE'))
+            ])
+            results[f'{name}_{count}'] = {
+                'ms': elapsed * 1000,
+                'queries': queries,
+                'chunks': chunks,
+            }
+    return results
+
+
+@scenario('audit-log')
+def audit_log(options):
+    """Custo por evento de auditoria: um INSERT por evento contra o buffer
+    de accounts.audit gravado com bulk_create"""
+    from django.conf import settings
+    from django.db import connection
+    from django.test import override_settings
+    from django.test.utils import CaptureQueriesContext
+    from django.utils import timezone
+
+    from . import audit
+    from .models import AuthEvent, event_partition
+
+    events = options['iterations'] * 100
+
+    def direct():
+        now = timezone.now()
+        AuthEvent.objects.create(partition=event_partition(now),
+                                 created_at=now, event=AuthEvent.LOGIN_FAILED,
+                                 email='audit@example.com')
+
+    def buffered():
+        audit.record(AuthEvent.LOGIN_FAILED, email='audit@example.com')
+
+    results = {}
+    with override_settings(AUDIT_LOG={**settings.AUDIT_LOG, 'ENABLED': True,
+                                      'BACKEND': 'database'}):
+        audit.flush()
+        for label, func in (('direct', direct), ('buffered', buffered)):
+            with CaptureQueriesContext(connection) as captured:
+                stats = measure(func, events)
+                audit.flush()
+            stats['inserts'] = len([
+                query for query in captured.captured_queries
+                if query['sql'].startswith('INSERT')
+            ])
+            results[label] = stats
+    AuthEvent.objects.filter(email='audit@example.com').delete()
+    return results
+
+
+@scenario('views', live=True)
+def view_suite(options):
+    """Vazão, latência (p50/p95/p99) e consultas por requisição de cada
+    view de accounts/urls.py no fluxo cadastro -> login -> 2FA -> dashboard,
+    com --rows usuários semeados (metade com 2FA). Com --live-server as
+    requisições vão para o servidor e as consultas vêm de /metrics/"""
+    import itertools
+
+    import pyotp
+    from django.core import mail
+    from django.db import connection
+    from django.test import Client, override_settings
+    from django.test.utils import CaptureQueriesContext
+
+    from . import bulk
+    from .models import User
+    from .tokens import get_reset_tokens
+    from .urls import build_urlpatterns
+
+    live_server = options.get('live_server')
+    iterations = options['iterations']
+    password = 'Bench-pass-2026!'
+    prefix = f'bv{int(time.time())}x'
+    secret = pyotp.random_base32()
+
+    def new_client():
+        if not live_server:
+            return Client()
+        client = LiveClient(live_server)
+        # O cookie CSRF é obtido antes, fora das medições
+        client.get('/accounts/csrf/')
+        return client
+
+    def logged_in(user):
+        client = new_client()
+        response = client.post('/', {'email': user.email,
+                                     'password': password})
+        assert response.status_code == 302, response.status_code
+        return client
+
+    # Usuários suficientes para que cada login com 2FA use um usuário
+    # diferente: um código TOTP só vale uma vez por usuário
+    count = max(options['rows'], 4 * iterations + 10)
+    plain = seed_users(f'{prefix}p', count - count // 2, password)
+    two_factor = iter(seed_users(f'{prefix}t', count // 2, password,
+                                 two_factor=True, otp_secret=secret))
+    staff = seed_users(f'{prefix}s', 1, password, is_staff=True)[0]
+    target = plain[0]
+    registered = itertools.count()
+
+    anonymous = new_client()
+    member = logged_in(plain[1])
+    admin = logged_in(staff)
+
+    def page(client, path, status=200):
+        return lambda: (client, 'get', path, None, status)
+
+    def register():
+        index = next(registered)
+        name = f'{prefix}r{index}'
+        return anonymous, 'post', '/accounts/register/', {
+            'username': name, 'email': f'{name}@example.com',
+            'first_name': 'Bench', 'last_name': 'Mark',
+            'password1': password, 'password2': password,
+        }, 302
+
+    def login():
+        return new_client(), 'post', '/', {
+            'email': plain[2].email, 'password': password,
+        }, 302
+
+    def verify_page():
+        return logged_in(next(two_factor)), 'get', '/accounts/verify-2fa/', \
+            None, 200
+
+    def verify():
+        return logged_in(next(two_factor)), 'post', '/accounts/verify-2fa/', \
+            {'token': pyotp.TOTP(secret).now()}, 302
+
+    def logout():
+        return logged_in(plain[3]), 'get', '/accounts/logout/', None, 302
+
+    def reset_confirm():
+        token = get_reset_tokens().make_token(plain[4])
+        return anonymous, 'get', f'/accounts/password-reset/{token}/', \
+            None, 200
+
+    def bulk_activate():
+        return admin, 'post', '/accounts/users/bulk/', {
+            'action': 'activate', 'ids': [user.pk for user in plain[5:55]],
+        }, 302
+
+    # medição: (nome da view, requisição preparada fora da medição)
+    specs = {
+        'home': ('home', page(anonymous, '/')),
+        'login': ('home', login),
+        'register': ('register', page(anonymous, '/accounts/register/')),
+        'register_post': ('register', register),
+        'csrf_token': ('csrf_token', page(anonymous, '/accounts/csrf/')),
+        'verify_2fa': ('verify_2fa', verify_page),
+        'verify_2fa_post': ('verify_2fa', verify),
+        'dashboard': ('dashboard', page(member, '/accounts/dashboard/')),
+        'setup_2fa': ('setup_2fa', page(member, '/accounts/setup-2fa/')),
+        'setup_2fa_qr': ('setup_2fa_qr',
+                         page(member, '/accounts/setup-2fa/qr/')),
+        'disable_2fa': ('disable_2fa', page(member, '/accounts/disable-2fa/')),
+        'user_list': ('user_list', page(admin, '/accounts/users/')),
+        'user_create': ('user_create', page(admin, '/accounts/users/create/')),
+        'user_update': ('user_update',
+                        page(admin, f'/accounts/users/{target.pk}/edit/')),
+        'user_delete': ('user_delete',
+                        page(admin, f'/accounts/users/{target.pk}/delete/')),
+        'user_bulk_action': ('user_bulk_action', bulk_activate),
+        'password_reset_request': ('password_reset_request',
+                                   page(anonymous, '/accounts/password-reset/')),
+        # 200 quando o servidor usa o backend de e-mail de console
+        'password_reset_request_post': ('password_reset_request', lambda: (
+            anonymous, 'post', '/accounts/password-reset/',
+            {'email': plain[4].email}, (200, 302),
+        )),
+        'password_reset_confirm': ('password_reset_confirm', reset_confirm),
+        'logout': ('logout', logout),
+    }
+    # Uma view nova em accounts/urls.py precisa entrar no benchmark
+    views = {pattern.name for pattern in build_urlpatterns()}
+    missing = views - {view for view, _ in specs.values()}
+    assert not missing, f'Views sem medição: {sorted(missing)}'
+
+    def run(label, view, prepare):
+        samples, queries = [], []
+        before = scrape_queries(live_server) if live_server else None
+        for _ in range(iterations):
+            client, method, path, data, status = prepare()
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = getattr(client, method)(path, data)
+                samples.append(time.perf_counter() - start)
+            assert response.status_code in ((status,) if isinstance(
+                status, int) else status), (label, response.status_code)
+            queries.append(len(captured))
+        stats = summarize(samples)
+        if live_server:
+            after = scrape_queries(live_server).get(view, {})
+            previous = before.get(view, {'sum': 0.0, 'count': 0.0})
+            requests = after.get('count', 0.0) - previous['count']
+            stats['queries'] = (after.get('sum', 0.0) - previous['sum']) \
+                / requests if requests else 0.0
+        else:
+            stats['queries'] = statistics.fmean(queries)
+        return stats
+
+    results = {}
+    try:
+        with override_settings(
+            RATELIMIT_ENABLED=False,
+            EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+        ):
+            for label, (view, prepare) in specs.items():
+                results[label] = run(label, view, prepare)
+                mail.outbox = []
+    finally:
+        bulk.delete(User.objects.filter(username__startswith=prefix)
+                    .values_list('pk', flat=True))
+    return results
@@ -0,0 +1,87 @@
+"""
+Ações em massa sobre usuários (lista de usuários e admin).
+
+Cada ação roda em uma única transação e percorre os ids em lotes de
+CHUNK_SIZE, com um número fixo de consultas por lote: o número de consultas
+depende do número de lotes, não de usuários. Os receptores por instância
+de accounts.signals ficam suspensos; os caches de usuário e a versão dos
+fragmentos da lista são invalidados uma vez por lote, após o commit.
+"""
+from functools import partial
+
+from django.db import transaction
+
+from . import audit, signals
+from .models import AuthEvent, User
+from .rendering import bump_users_version
+from .user_cache import invalidate_users
+
+# Abaixo do limite de parâmetros por consulta do SQLite
+CHUNK_SIZE = 500
+
+
+def _run(ids, operation, chunk_size):
+    ids = list(ids)
+    total = 0
+    with transaction.atomic(), signals.muted():
+        for start in range(0, len(ids), chunk_size):
+            chunk = ids[start:start + chunk_size]
+            total += operation(User.objects.filter(pk__in=chunk))
+            transaction.on_commit(partial(invalidate_users, chunk))
+        if total:
+            transaction.on_commit(bump_users_version)
+    return total
+
+
+def activate(ids, chunk_size=CHUNK_SIZE):
+    return _run(ids, lambda users: users.update(is_active=True), chunk_size)
+
+
+def deactivate(ids, chunk_size=CHUNK_SIZE):
+    return _run(ids, lambda users: users.update(is_active=False), chunk_size)
+
+
+def disable_2fa(ids, chunk_size=CHUNK_SIZE):
+    """
+    Desativa o 2FA como disable_2fa_view, descartando os códigos de backup.
+    Retorna e registra na auditoria só os usuários que tinham o 2FA ativo.
+    """
+    disabled = []
+
+    def operation(users):
+        # As linhas ficam travadas até o UPDATE (no PostgreSQL), então os
+        # ids lidos são exatamente os alterados
+        pks = list(users.filter(is_2fa_enabled=True).select_for_update()
+                   .values_list('pk', flat=True))
+        disabled.extend(pks)
+        return User.objects.filter(pk__in=pks).update(
+            is_2fa_enabled=False, otp_backup_codes=''
+        )
+
+    count = _run(ids, operation, chunk_size)
+    for pk in disabled:
+        audit.record(AuthEvent.TWO_FACTOR_DISABLED, user=pk)
+    return count
+
+
+def _delete(users):
+    # Os receptores de sinais só precisam do pk
+    _, deleted = users.only('pk').delete()
+    return deleted.get(User._meta.label, 0)
+
+
+def delete(ids, chunk_size=CHUNK_SIZE):
+    """
+    Exclui os usuários. Tokens de redefinição, grupos, permissões e o
+    histórico do admin não têm sinais, então o ORM os remove com um DELETE
+    por lote em vez de carregá-los usuário a usuário.
+    """
+    return _run(ids, _delete, chunk_size)
+
+
+ACTIONS = {
+    'activate': activate,
+    'deactivate': deactivate,
+    'disable_2fa': disable_2fa,
+    'delete': delete,
+}
@@ -0,0 +1,36 @@
+"""
+Verificações de configuração (manage.py check e início do servidor).
+"""
+import os
+import stat
+
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+
+@register(Tags.caches, Tags.security)
+def check_session_cache_dir(app_configs, **kwargs):
+    """
+    O cache em arquivo é lido com pickle: um diretório que outro usuário
+    possa escrever (ou que ele tenha criado antes) permite executar código
+    no processo.
+    """
+    path = getattr(settings, 'SESSION_CACHE_DIR', None)
+    if not path or not os.path.exists(path):
+        # O FileBasedCache cria o diretório com permissão 0700
+        return []
+    info = os.lstat(path)
+    if stat.S_ISLNK(info.st_mode) or not stat.S_ISDIR(info.st_mode):
+        problem = 'não é um diretório'
+    elif info.st_uid != os.geteuid():
+        problem = 'pertence a outro usuário'
+    elif info.st_mode & 0o077:
+        problem = 'pode ser acessado por outros usuários'
+    else:
+        return []
+    return [Error(
+        f'SESSION_CACHE_DIR ({path}) {problem}.',
+        hint='Use um diretório exclusivo do usuário do processo, com '
+             'permissão 0700, ou configure REDIS_URL.',
+        id='accounts.E001',
+    )]
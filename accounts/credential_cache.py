@@ -0,0 +1,96 @@
+"""
+Cache opcional de verificação de credenciais.
+
+Depois de um check_password bem-sucedido guardamos um HMAC da senha
+(chaveado pelo SECRET_KEY e pelo hash atual do usuário). Um novo login com
+a mesma senha dentro do TIMEOUT compara apenas o HMAC e evita rodar o KDF
+novamente. A entrada é invalidada quando o hash muda (set_password).
+"""
+import hashlib
+import hmac
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.crypto import salted_hmac
+
+from .cache import LRUCache
+
+KEY_SALT = 'accounts.credential_cache'
+KEY_PREFIX = 'credential-cache'
+
+
+class CredentialCache:
+    def __init__(self, timeout=300, max_entries=10000, cache_alias=None):
+        self.timeout = timeout
+        self.local = LRUCache(max_entries=max_entries, timeout=timeout)
+        self.shared = caches[cache_alias] if cache_alias else None
+
+    @staticmethod
+    def hash_version(user):
+        """Identifica a versão do hash de senha atual do usuário"""
+        return hashlib.sha256(user.password.encode()).hexdigest()[:16]
+
+    @staticmethod
+    def digest(user, password):
+        value = f'{user.pk}:{user.password}:{password}'
+        return salted_hmac(KEY_SALT, value, algorithm='sha256').hexdigest()
+
+    def _get(self, user_id):
+        entry = self.local.get(user_id)
+        if entry is None and self.shared is not None:
+            entry = self.shared.get(f'{KEY_PREFIX}:{user_id}')
+            if entry is not None:
+                self.local.set(user_id, entry)
+        return entry
+
+    def check(self, user, password):
+        """Retorna True se a senha já foi verificada recentemente"""
+        if user.pk is None or not user.password:
+            return False
+        entry = self._get(user.pk)
+        if entry is None:
+            return False
+        version, digest = entry
+        if version != self.hash_version(user):
+            self.invalidate(user.pk)
+            return False
+        return hmac.compare_digest(digest, self.digest(user, password))
+
+    def remember(self, user, password):
+        entry = (self.hash_version(user), self.digest(user, password))
+        self.local.set(user.pk, entry)
+        if self.shared is not None:
+            self.shared.set(f'{KEY_PREFIX}:{user.pk}', entry, self.timeout)
+
+    def invalidate(self, user_id):
+        self.local.delete(user_id)
+        if self.shared is not None:
+            self.shared.delete(f'{KEY_PREFIX}:{user_id}')
+
+
+@lru_cache(maxsize=None)
+def get_credential_cache():
+    """Retorna o cache configurado em AUTH_CREDENTIAL_CACHE ou None"""
+    options = getattr(settings, 'AUTH_CREDENTIAL_CACHE', {})
+    if not options.get('ENABLED'):
+        return None
+    return CredentialCache(
+        timeout=options.get('TIMEOUT', 300),
+        max_entries=options.get('MAX_ENTRIES', 10000),
+        cache_alias=options.get('CACHE_ALIAS'),
+    )
+
+
+def invalidate_credentials(user_id):
+    credential_cache = get_credential_cache()
+    if credential_cache is not None:
+        credential_cache.invalidate(user_id)
+
+
+@receiver(setting_changed)
+def reset_credential_cache(setting, **kwargs):
+    if setting == 'AUTH_CREDENTIAL_CACHE':
+        get_credential_cache.cache_clear()
@@ -1,6 +1,18 @@
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
 from django.contrib.auth.decorators import user_passes_test
+from django.contrib.messages import get_messages
+from django.http import HttpResponse
 from django.shortcuts import redirect
 from django.conf import settings
+from django.utils.cache import (
+    get_conditional_response, patch_cache_control, patch_vary_headers,
+    set_response_etag,
+)
+
+from . import metrics
+from .ratelimit import get_limiter, request_identifier
 
 
 def staff_member_required(view_func):
@@ -20,8 +32,109 @@ def anonymous_required(view_func):
     Decorador para views que só devem ser acessíveis por usuários anônimos (não logados).
     Usuários autenticados são redirecionados para LOGIN_REDIRECT_URL.
     """
-    def wrapper(request, *args, **kwargs):
-        if request.user.is_authenticated:
-            return redirect(settings.LOGIN_REDIRECT_URL)
-        return view_func(request, *args, **kwargs)
-    return wrapper
+    if iscoroutinefunction(view_func):
+        async def wrapper(request, *args, **kwargs):
+            user = await request.auser()
+            if user.is_authenticated:
+                return redirect(settings.LOGIN_REDIRECT_URL)
+            return await view_func(request, *args, **kwargs)
+    else:
+        def wrapper(request, *args, **kwargs):
+            if request.user.is_authenticated:
+                return redirect(settings.LOGIN_REDIRECT_URL)
+            return view_func(request, *args, **kwargs)
+    return wraps(view_func)(wrapper)
+
+
+def _limit(request, scope, key, methods):
+    """Registra a tentativa; retorna a resposta 429 se passou do limite"""
+    if not settings.RATELIMIT_ENABLED or request.method not in methods:
+        return None
+    identifier = request_identifier(request, key)
+    if not identifier:
+        return None
+    allowed, retry_after = get_limiter(scope, key).hit(identifier)
+    if allowed:
+        return None
+    metrics.RATELIMIT_REJECTIONS.inc(scope=scope, key=key)
+    response = HttpResponse(
+        'Muitas tentativas. Tente novamente mais tarde.',
+        status=429,
+        content_type='text/plain; charset=utf-8',
+    )
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+def ratelimit(scope, key, methods=('POST',)):
+    """
+    Decorador que limita tentativas por IP, e-mail ou usuário pré-2FA.
+    Requisições acima do limite recebem 429 antes de qualquer trabalho da
+    view (consultas, KDF, TOTP ou envio de e-mail).
+    """
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            async def wrapper(request, *args, **kwargs):
+                # O contador fica no cache e a chave pode vir da sessão,
+                # ambos com API síncrona
+                response = await sync_to_async(_limit)(
+                    request, scope, key, methods
+                )
+                if response is not None:
+                    return response
+                return await view_func(request, *args, **kwargs)
+        else:
+            def wrapper(request, *args, **kwargs):
+                response = _limit(request, scope, key, methods)
+                if response is not None:
+                    return response
+                return view_func(request, *args, **kwargs)
+        return wraps(view_func)(wrapper)
+    return decorator
+
+
+def _make_cacheable(request, response):
+    """Adiciona ETag e Cache-Control; responde 304 se o ETag bater"""
+    if request.method not in ('GET', 'HEAD') or response.status_code != 200 \
+            or response.streaming or response.cookies:
+        return response
+    # Mensagens exibidas ou token CSRF no HTML: a página é de um usuário
+    if getattr(get_messages(request), 'used', False) \
+            or request.META.get('CSRF_COOKIE_NEEDS_UPDATE'):
+        return response
+    set_response_etag(response)
+    patch_cache_control(response, public=True,
+                        max_age=settings.CACHEABLE_PAGE_MAX_AGE)
+    # Os cookies decidem se há mensagens ou sessão (redirecionamento)
+    patch_vary_headers(response, ('Cookie',))
+    return get_conditional_response(request, etag=response['ETag'],
+                                    response=response)
+
+
+def cacheable_page(view_func):
+    """
+    Decorador para as páginas anônimas (login, cadastro, redefinição de
+    senha). No GET o formulário é renderizado sem o token CSRF, que é
+    preenchido por static/js/csrf.js (ver accounts/csrf_field.html), e o
+    HTML fica igual para todos os visitantes: recebe ETag e Cache-Control
+    e o navegador ou CDN revalida com If-None-Match (304 sem corpo).
+    Para usuários autenticados a página pode trazer dados deles (menu,
+    mensagens) e é servida como nas demais views, sem cache.
+    """
+    if iscoroutinefunction(view_func):
+        async def wrapper(request, *args, **kwargs):
+            if not settings.CACHEABLE_PAGES or \
+                    (await request.auser()).is_authenticated:
+                return await view_func(request, *args, **kwargs)
+            request.csrf_deferred = request.method in ('GET', 'HEAD')
+            response = await view_func(request, *args, **kwargs)
+            return _make_cacheable(request, response)
+    else:
+        def wrapper(request, *args, **kwargs):
+            if not settings.CACHEABLE_PAGES or \
+                    request.user.is_authenticated:
+                return view_func(request, *args, **kwargs)
+            request.csrf_deferred = request.method in ('GET', 'HEAD')
+            response = view_func(request, *args, **kwargs)
+            return _make_cacheable(request, response)
+    return wraps(view_func)(wrapper)
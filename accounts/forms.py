@@ -1,6 +1,11 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
-from .models import User
+from django.db.models import Q
+from django.db.models.functions import Upper
+from django.http import QueryDict
+from .models import User, normalize_email
+
+EMAIL_IN_USE_MESSAGE = "Este e-mail já está em uso."
 
 
 class UserRegistrationForm(UserCreationForm):
@@ -49,9 +54,9 @@ class UserRegistrationForm(UserCreationForm):
         return password2
     
     def clean_email(self):
-        email = self.cleaned_data.get("email")
-        if User.objects.filter(email=email).exists():
-            raise forms.ValidationError("Este e-mail já está em uso.")
+        email = normalize_email(self.cleaned_data.get("email"))
+        if User.objects.with_email(email).exists():
+            raise forms.ValidationError(EMAIL_IN_USE_MESSAGE)
         return email
 
 
@@ -76,6 +81,18 @@ class TwoFactorForm(forms.Form):
     )
 
 
+class TwoFactorLoginForm(TwoFactorForm):
+    # Aceita também códigos de backup (xxxxx-xxxxx)
+    token = forms.CharField(
+        max_length=11,
+        min_length=6,
+        label='Código de verificação',
+        widget=forms.TextInput(attrs={'placeholder': '000000'}),
+        help_text='Digite o código de 6 dígitos do seu aplicativo '
+                  'autenticador ou um código de backup'
+    )
+
+
 class UserUpdateForm(forms.ModelForm):
     username = forms.CharField(label='Nome de usuário')
     email = forms.EmailField(label='E-mail')
@@ -90,6 +107,13 @@ class UserUpdateForm(forms.ModelForm):
         fields = ['username', 'email', 'first_name', 'last_name',
                   'phone', 'is_active', 'is_staff']
 
+    def clean_email(self):
+        email = normalize_email(self.cleaned_data.get("email"))
+        if User.objects.with_email(email).exclude(pk=self.instance.pk) \
+                .exists():
+            raise forms.ValidationError(EMAIL_IN_USE_MESSAGE)
+        return email
+
 
 class PasswordResetRequestForm(forms.Form):
     email = forms.EmailField(
@@ -112,3 +136,92 @@ class PasswordResetConfirmForm(forms.Form):
         if password1 and password2 and password1 != password2:
             raise forms.ValidationError('As senhas não coincidem')
         return cleaned_data
+
+
+class UserFilterForm(forms.Form):
+    BOOLEAN_CHOICES = [('', 'Todos'), ('1', 'Sim'), ('0', 'Não')]
+    ORDER_CHOICES = [('desc', 'Mais recentes'), ('asc', 'Mais antigos')]
+
+    q = forms.CharField(
+        label='Buscar',
+        required=False,
+        max_length=254,
+        widget=forms.TextInput(attrs={'placeholder': 'E-mail ou nome'})
+    )
+    is_active = forms.ChoiceField(
+        label='Ativo', choices=BOOLEAN_CHOICES, required=False
+    )
+    is_staff = forms.ChoiceField(
+        label='Equipe', choices=BOOLEAN_CHOICES, required=False
+    )
+    is_2fa_enabled = forms.ChoiceField(
+        label='2FA', choices=BOOLEAN_CHOICES, required=False
+    )
+    order = forms.ChoiceField(
+        label='Ordenar', choices=ORDER_CHOICES, required=False
+    )
+
+    BOOLEAN_FIELDS = ('is_active', 'is_staff', 'is_2fa_enabled')
+
+    def filter_queryset(self, queryset):
+        """Aplica busca e filtros ao queryset de usuários"""
+        data = self.cleaned_data
+        for name in self.BOOLEAN_FIELDS:
+            if data.get(name):
+                queryset = queryset.filter(**{name: data[name] == '1'})
+
+        term = data.get('q', '').strip()
+        if term:
+            # Busca por prefixo para que os índices possam ser usados: os
+            # e-mails são gravados em minúsculas e os nomes são comparados
+            # em maiúsculas, como nos índices funcionais de User
+            queryset = queryset.alias(first_name_upper=Upper('first_name'),
+                                      last_name_upper=Upper('last_name'))
+            upper = term.upper()
+            query = Q(email__startswith=normalize_email(term)) | \
+                Q(first_name_upper__startswith=upper) | \
+                Q(last_name_upper__startswith=upper)
+            if ' ' in term:
+                first, last = upper.split(' ', 1)
+                query |= Q(first_name_upper=first,
+                           last_name_upper__startswith=last.strip())
+            queryset = queryset.filter(query)
+        return queryset
+
+
+class UserBulkActionForm(forms.Form):
+    ACTION_CHOICES = [
+        ('activate', 'Ativar'),
+        ('deactivate', 'Desativar'),
+        ('disable_2fa', 'Desativar 2FA'),
+        ('delete', 'Excluir'),
+    ]
+
+    action = forms.ChoiceField(label='Ação', choices=ACTION_CHOICES)
+    select_all = forms.BooleanField(
+        label='Aplicar a todos os resultados do filtro', required=False
+    )
+    # Busca e filtros da lista, usados com select_all
+    query = forms.CharField(required=False, widget=forms.HiddenInput)
+
+    def clean(self):
+        data = super().clean()
+        try:
+            data['ids'] = [int(pk) for pk in self.data.getlist('ids')]
+        except ValueError:
+            raise forms.ValidationError('Seleção inválida.')
+        if data.get('select_all'):
+            self.filter_form = UserFilterForm(QueryDict(data.get('query', '')))
+            if not self.filter_form.is_valid():
+                raise forms.ValidationError('Filtro inválido.')
+        elif not data['ids']:
+            raise forms.ValidationError('Selecione ao menos um usuário.')
+        return data
+
+    def selected_ids(self):
+        """Ids dos usuários selecionados (só a coluna id é consultada)"""
+        if self.cleaned_data['select_all']:
+            users = self.filter_form.filter_queryset(User.objects.all())
+        else:
+            users = User.objects.filter(pk__in=self.cleaned_data['ids'])
+        return users.values_list('pk', flat=True)
@@ -0,0 +1,253 @@
+"""
+Hashers de senha: perfis de custo e KDF em um pool de processos.
+
+O perfil ativo (PASSWORD_HASHER_PROFILE) define o hasher preferido e seus
+parâmetros de custo; PASSWORD_HASHER_OPTIONS ajusta esses parâmetros por
+ambiente (veja o comando calibrate_hasher). Hashes feitos com outro hasher
+ou outro custo são refeitos no próximo login (EmailBackend).
+
+Cadastro, login e redefinição de senha chamam o KDF dentro do worker web;
+uma rajada de logins ocupa todos os workers e as demais páginas param de
+responder. Com PASSWORD_HASHING_POOL habilitado o cálculo vai para um pool
+de processos de tamanho fixo, com um limite de cálculos em espera. Quando
+o pool está cheio a chamada falha imediatamente com HashingPoolSaturated,
+que o HashingOverloadMiddleware transforma em 503. Os três hashers deste
+módulo (PBKDF2, Argon2 e scrypt) usam o pool; os hashers do Django mantidos
+só para verificar hashes antigos (PBKDF2-SHA1, bcrypt) rodam no worker.
+"""
+import base64
+import hashlib
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.encoding import force_bytes
+from django.utils.module_loading import import_string
+
+
+class HashingPoolSaturated(Exception):
+    """Não há vaga no pool para mais um cálculo de hash"""
+
+
+# Funções executadas nos processos do pool: não dependem das settings do
+# Django
+
+def _pbkdf2(digest_name, password, salt, iterations):
+    return hashlib.pbkdf2_hmac(digest_name, password, salt, iterations)
+
+
+def _scrypt(password, salt, n, r, p, maxmem):
+    return hashlib.scrypt(password, salt=salt, n=n, r=r, p=p, maxmem=maxmem,
+                          dklen=64)
+
+
+def _argon2(password, salt, time_cost, memory_cost, parallelism, hash_len,
+            variant):
+    from argon2 import low_level
+    return low_level.hash_secret(
+        password, salt, time_cost=time_cost, memory_cost=memory_cost,
+        parallelism=parallelism, hash_len=hash_len, type=variant,
+    )
+
+
+def _argon2_verify(encoded, password):
+    import argon2
+    try:
+        return argon2.PasswordHasher().verify(encoded, password)
+    except argon2.exceptions.VerificationError:
+        return False
+
+
+class HashingPool:
+    """
+    Pool de processos com limite de fila. No máximo `workers + max_pending`
+    cálculos ficam no pool ao mesmo tempo; acima disso run() espera até
+    `timeout` segundos por uma vaga e então levanta HashingPoolSaturated.
+    """
+
+    def __init__(self, workers=None, max_pending=None, timeout=0.0):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = self.workers * 2 if max_pending is None \
+            else max_pending
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(
+            self.workers + self.max_pending
+        )
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    def _get_executor(self):
+        with self._lock:
+            # Um processo criado por fork (ex.: gunicorn --preload) não pode
+            # reaproveitar o pool do processo pai
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+                self._pid = os.getpid()
+            return self._executor
+
+    def run(self, func, *args):
+        if self.timeout:
+            acquired = self._slots.acquire(timeout=self.timeout)
+        else:
+            acquired = self._slots.acquire(blocking=False)
+        if not acquired:
+            raise HashingPoolSaturated
+        try:
+            return self._get_executor().submit(func, *args).result()
+        except BrokenProcessPool:
+            # Um processo do pool morreu: o próximo cálculo cria outro pool
+            with self._lock:
+                self._executor = None
+            raise
+        finally:
+            self._slots.release()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+@lru_cache(maxsize=None)
+def get_hashing_pool():
+    """Retorna o pool configurado em PASSWORD_HASHING_POOL ou None"""
+    options = getattr(settings, 'PASSWORD_HASHING_POOL', {})
+    if not options.get('ENABLED'):
+        return None
+    return HashingPool(
+        workers=options.get('WORKERS'),
+        max_pending=options.get('MAX_PENDING'),
+        timeout=options.get('TIMEOUT', 0.0),
+    )
+
+
+@receiver(setting_changed)
+def reset_hashing_pool(setting, **kwargs):
+    if setting == 'PASSWORD_HASHING_POOL':
+        pool = get_hashing_pool()
+        if pool is not None:
+            pool.shutdown()
+        get_hashing_pool.cache_clear()
+
+
+def hasher_profile(name=None):
+    """
+    Retorna (caminho do hasher, parâmetros de custo) do perfil informado ou
+    do ativo. PASSWORD_HASHER_OPTIONS só se aplica ao perfil ativo.
+    """
+    active = settings.PASSWORD_HASHER_PROFILE
+    name = name or active
+    profile = settings.PASSWORD_HASHER_PROFILES[name]
+    options = dict(profile.get('OPTIONS', {}))
+    if name == active:
+        options.update(settings.PASSWORD_HASHER_OPTIONS)
+    return profile['HASHER'], options
+
+
+def hash_is_outdated(encoded):
+    """
+    Indica, sem executar o KDF, se o hash deve ser refeito com o hasher e o
+    custo do perfil ativo.
+    """
+    preferred = hashers.get_hasher('default')
+    try:
+        hasher = hashers.identify_hasher(encoded)
+    except ValueError:
+        return False
+    return hasher.algorithm != preferred.algorithm or \
+        preferred.must_update(encoded)
+
+
+@receiver(setting_changed)
+def reset_hashers(setting, **kwargs):
+    if setting in ('PASSWORD_HASHER_PROFILE', 'PASSWORD_HASHER_PROFILES',
+                   'PASSWORD_HASHER_OPTIONS'):
+        hashers.get_hashers.cache_clear()
+        hashers.get_hashers_by_algorithm.cache_clear()
+
+
+class ProfileHasherMixin:
+    """Usa os parâmetros de custo do perfil ativo se for o hasher dele"""
+
+    def __init__(self):
+        super().__init__()
+        path, options = hasher_profile()
+        if import_string(path) is type(self):
+            for name, value in options.items():
+                setattr(self, name, value)
+
+
+class PooledPBKDF2PasswordHasher(ProfileHasherMixin,
+                                 hashers.PBKDF2PasswordHasher):
+    """
+    PBKDF2PasswordHasher que calcula o hash em get_hashing_pool(). Usa o
+    mesmo algorithm, então os hashes existentes continuam válidos. Sem pool
+    configurado o cálculo é feito no próprio processo.
+    """
+
+    def encode(self, password, salt, iterations=None):
+        pool = get_hashing_pool()
+        if pool is None:
+            return super().encode(password, salt, iterations)
+        self._check_encode_args(password, salt)
+        iterations = iterations or self.iterations
+        hash = pool.run(_pbkdf2, self.digest().name, force_bytes(password),
+                        force_bytes(salt), iterations)
+        hash = base64.b64encode(hash).decode('ascii').strip()
+        return '%s$%d$%s$%s' % (self.algorithm, iterations, salt, hash)
+
+
+class Argon2PasswordHasher(ProfileHasherMixin, hashers.Argon2PasswordHasher):
+    """
+    Argon2 com custo do perfil, calculado em get_hashing_pool() (requer
+    argon2-cffi). A verificação do Django não passa por encode(), então
+    também é enviada ao pool.
+    """
+
+    def encode(self, password, salt):
+        pool = get_hashing_pool()
+        if pool is None:
+            return super().encode(password, salt)
+        params = self.params()
+        data = pool.run(_argon2, password.encode(), salt.encode(),
+                        params.time_cost, params.memory_cost,
+                        params.parallelism, params.hash_len, params.type)
+        return self.algorithm + data.decode('ascii')
+
+    def verify(self, password, encoded):
+        pool = get_hashing_pool()
+        if pool is None:
+            return super().verify(password, encoded)
+        self._load_library()
+        algorithm, rest = encoded.split('$', 1)
+        assert algorithm == self.algorithm
+        return pool.run(_argon2_verify, '$' + rest, password)
+
+
+class ScryptPasswordHasher(ProfileHasherMixin, hashers.ScryptPasswordHasher):
+    """scrypt com custo do perfil, calculado em get_hashing_pool()"""
+
+    def encode(self, password, salt, n=None, r=None, p=None):
+        pool = get_hashing_pool()
+        if pool is None:
+            return super().encode(password, salt, n, r, p)
+        self._check_encode_args(password, salt)
+        n = n or self.work_factor
+        r = r or self.block_size
+        p = p or self.parallelism
+        hash = pool.run(_scrypt, password.encode(), salt.encode(), n, r, p,
+                        self.maxmem)
+        hash = base64.b64encode(hash).decode('ascii').strip()
+        return '%s$%d$%s$%d$%d$%s' % (self.algorithm, n, salt, r, p, hash)
@@ -0,0 +1,155 @@
+"""
+Fila de envio de e-mails.
+
+Com MAIL_QUEUE_ENABLED as views apenas gravam um OutboundEmail e respondem
+imediatamente; o comando send_queued_mail envia os e-mails em lotes,
+reaproveitando uma conexão SMTP por lote e reagendando falhas com backoff
+exponencial.
+
+O texto dos e-mails de redefinição contém o link com o token, então a
+mensagem é apagada assim que o e-mail sai da fila (enviado ou com falha
+definitiva) e as linhas antigas são removidas por purge_processed().
+"""
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection, send_mail
+from django.db import transaction
+from django.utils import timezone
+
+from .metrics import timed
+from .models import OutboundEmail
+
+
+@timed('send_mail')
+def dispatch_mail(subject, message, from_email, recipient_list):
+    """Envia o e-mail agora ou o coloca na fila, conforme as settings"""
+    if not settings.MAIL_QUEUE_ENABLED:
+        return send_mail(subject, message, from_email, recipient_list,
+                         fail_silently=False)
+    OutboundEmail.objects.create(subject=subject, body=message,
+                                 from_email=from_email, to=recipient_list)
+    return len(recipient_list)
+
+
+@timed('send_mail')
+async def adispatch_mail(subject, message, from_email, recipient_list):
+    """
+    Versão assíncrona de dispatch_mail(). O envio por SMTP roda em uma
+    thread do executor para não bloquear o event loop.
+    """
+    if not settings.MAIL_QUEUE_ENABLED:
+        return await sync_to_async(send_mail, thread_sensitive=False)(
+            subject, message, from_email, recipient_list, fail_silently=False
+        )
+    await OutboundEmail.objects.acreate(subject=subject, body=message,
+                                        from_email=from_email,
+                                        to=recipient_list)
+    return len(recipient_list)
+
+
+def claim_batch(batch_size):
+    """
+    Reserva até `batch_size` e-mails vencidos. A reserva adia
+    next_attempt_at por MAIL_QUEUE_LEASE segundos, de modo que outros
+    workers não peguem os mesmos e-mails e um worker que morrer no meio do
+    lote não os perca.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        batch = list(
+            OutboundEmail.objects
+            .select_for_update(skip_locked=True)
+            .filter(status=OutboundEmail.STATUS_PENDING,
+                    next_attempt_at__lte=now)
+            .order_by('next_attempt_at')[:batch_size]
+        )
+        if batch:
+            OutboundEmail.objects.filter(
+                pk__in=[email.pk for email in batch]
+            ).update(next_attempt_at=now + timedelta(
+                seconds=settings.MAIL_QUEUE_LEASE
+            ))
+    return batch
+
+
+def retry_delay(attempts):
+    return settings.MAIL_QUEUE_RETRY_DELAY * 2 ** (attempts - 1)
+
+
+def record_failure(email, exc):
+    email.last_error = str(exc)
+    if email.attempts >= settings.MAIL_QUEUE_MAX_ATTEMPTS:
+        email.status = OutboundEmail.STATUS_FAILED
+        email.body = ''
+    else:
+        email.next_attempt_at = timezone.now() + timedelta(
+            seconds=retry_delay(email.attempts)
+        )
+
+
+def deliver_batch(batch, connection=None):
+    """Envia o lote usando uma única conexão. Retorna (enviados, falhas)"""
+    connection = connection or get_connection()
+    sent = failed = 0
+    for email in batch:
+        email.attempts += 1
+    try:
+        connection.open()
+    except Exception as exc:
+        # Sem conexão o lote inteiro é reagendado
+        for email in batch:
+            record_failure(email, exc)
+        failed = len(batch)
+    else:
+        try:
+            for email in batch:
+                try:
+                    EmailMessage(email.subject, email.body, email.from_email,
+                                 email.to, connection=connection).send()
+                except Exception as exc:
+                    failed += 1
+                    record_failure(email, exc)
+                else:
+                    sent += 1
+                    email.status = OutboundEmail.STATUS_SENT
+                    email.sent_at = timezone.now()
+                    email.last_error = ''
+                    email.body = ''
+        finally:
+            connection.close()
+    OutboundEmail.objects.bulk_update(
+        batch,
+        ['attempts', 'status', 'sent_at', 'next_attempt_at', 'last_error',
+         'body'],
+    )
+    return sent, failed
+
+
+def process_queue(batch_size=50):
+    """Esvazia a fila de e-mails vencidos. Retorna (enviados, falhas)"""
+    total_sent = total_failed = 0
+    while batch := claim_batch(batch_size):
+        sent, failed = deliver_batch(batch)
+        total_sent += sent
+        total_failed += failed
+    return total_sent, total_failed
+
+
+def purge_processed(retention=None, batch_size=1000):
+    """
+    Remove, em lotes, os e-mails enviados ou com falha definitiva há mais
+    de `retention` segundos (MAIL_QUEUE_RETENTION). Retorna quantos.
+    """
+    retention = settings.MAIL_QUEUE_RETENTION if retention is None \
+        else retention
+    processed = OutboundEmail.objects.filter(
+        status__in=[OutboundEmail.STATUS_SENT, OutboundEmail.STATUS_FAILED],
+        created_at__lt=timezone.now() - timedelta(seconds=retention),
+    )
+    total = 0
+    while ids := list(processed.values_list('pk', flat=True)[:batch_size]):
+        deleted, _ = OutboundEmail.objects.filter(pk__in=ids).delete()
+        total += deleted
+    return total
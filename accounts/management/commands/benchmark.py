@@ -0,0 +1,156 @@
+import json
+import logging
+import platform
+import subprocess
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (
+    setup_test_environment, teardown_test_environment,
+)
+from django.utils import timezone
+
+from accounts.benchmarks import (
+    LIVE_SCENARIOS, SCENARIOS, compare_results, database_mode,
+)
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+            text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Executa cenários de benchmark em um banco de dados temporário'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*',
+                            help='Cenários a executar (padrão: todos)')
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--rows', type=int, default=100000,
+                            help='Tamanho das tabelas nos cenários que '
+                                 'medem consultas em volume')
+        parser.add_argument('--workers', type=int, default=8,
+                            help='Clientes simultâneos nos cenários de '
+                                 'concorrência')
+        parser.add_argument('--list', action='store_true',
+                            help='Lista os cenários disponíveis')
+        parser.add_argument('--json', metavar='ARQUIVO',
+                            help='Grava os resultados em JSON')
+        parser.add_argument('--compare', metavar='ARQUIVO',
+                            help='JSON de uma execução anterior; falha se '
+                                 'alguma medição piorar além de --threshold')
+        parser.add_argument('--threshold', type=float, default=10,
+                            help='Piora tolerada em %% com --compare')
+        parser.add_argument('--live-server', metavar='URL',
+                            help='Mede um servidor em execução (ex.: '
+                                 'http://127.0.0.1:8000) em vez do cliente '
+                                 'de teste. Usa o banco configurado, o mesmo '
+                                 'do servidor, que deve ser exclusivo de '
+                                 'benchmark (BENCHMARK_LIVE_DATABASE=True); '
+                                 'rode-o com RATELIMIT_ENABLED=False')
+
+    def handle(self, *args, **options):
+        if options['list']:
+            for name, func in SCENARIOS.items():
+                live = ' [live]' if name in LIVE_SCENARIOS else ''
+                self.stdout.write(f'{name}{live}: {func.__doc__}')
+            return
+
+        live_server = options['live_server']
+        default = LIVE_SCENARIOS if live_server else SCENARIOS
+        names = options['scenarios'] or [name for name in SCENARIOS
+                                         if name in default]
+        unknown = set(names) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(
+                f'Cenários desconhecidos: {", ".join(sorted(unknown))}'
+            )
+        if live_server and set(names) - LIVE_SCENARIOS:
+            raise CommandError(
+                'Com --live-server só é possível executar: '
+                + ', '.join(sorted(LIVE_SCENARIOS))
+            )
+        if live_server and not settings.BENCHMARK_LIVE_DATABASE:
+            # Os usuários semeados vão para o banco configurado, o mesmo do
+            # servidor: nunca em um banco com dados reais
+            raise CommandError(
+                '--live-server grava e exclui usuários no banco '
+                f'{connection.settings_dict["NAME"]}. Aponte o servidor e '
+                'este comando para um banco exclusivo de benchmark e defina '
+                'BENCHMARK_LIVE_DATABASE=True.'
+            )
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as file:
+                baseline = json.load(file)
+
+        # Respostas 4xx esperadas (ex.: 429) não devem poluir a saída
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+
+        # Nunca mede contra o banco real: cria um banco de teste descartável.
+        # Com --live-server os usuários semeados vão para o banco do
+        # servidor e são removidos ao final
+        setup_test_environment()
+        old_name = None
+        if not live_server:
+            old_name = connection.creation.create_test_db(
+                verbosity=0, autoclobber=True
+            )
+        report = {
+            'meta': {
+                'created_at': timezone.now().isoformat(),
+                'revision': git_revision(),
+                'database': database_mode(connection),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'live_server': live_server,
+                **{key: options[key]
+                   for key in ('iterations', 'rows', 'workers')},
+            },
+            'results': {},
+        }
+        try:
+            for name in names:
+                self.stdout.write(self.style.MIGRATE_HEADING(name))
+                results = SCENARIOS[name](options)
+                report['results'][name] = results
+                for label, stats in results.items():
+                    self.stdout.write(f'  {label}: ' + ', '.join(
+                        f'{key}={value:.2f}' for key, value in stats.items()
+                    ))
+        finally:
+            if old_name is not None:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        if options['json']:
+            with open(options['json'], 'w') as file:
+                json.dump(report, file, indent=2)
+            self.stdout.write(f'Resultados gravados em {options["json"]}')
+
+        if baseline is not None:
+            regressions = compare_results(baseline['results'],
+                                          report['results'],
+                                          options['threshold'])
+            for name, label, key, old, new, change in regressions:
+                self.stdout.write(self.style.ERROR(
+                    f'  {name}/{label} {key}: {old:.2f} -> {new:.2f} '
+                    f'(piora de {change:.0f}%)'
+                ))
+            if regressions:
+                raise CommandError(
+                    f'{len(regressions)} medição(ões) piorou(aram) mais de '
+                    f'{options["threshold"]:.0f}% em relação a '
+                    f'{options["compare"]}'
+                )
+            self.stdout.write(self.style.SUCCESS(
+                f'Sem regressões em relação a {options["compare"]}'
+            ))
@@ -0,0 +1,88 @@
+import json
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
+
+from accounts.hashers import hasher_profile
+
+# Parâmetro de custo ajustado para cada algoritmo e como ele escala:
+# 'linear' (tempo proporcional ao valor) ou 'power_of_two' (scrypt)
+COST_PARAMETERS = {
+    'pbkdf2_sha256': ('iterations', 'linear', 1000),
+    'argon2': ('time_cost', 'linear', 1),
+    'scrypt': ('work_factor', 'power_of_two', 2),
+}
+
+
+class Command(BaseCommand):
+    help = ('Mede o custo do hasher de senha nesta máquina e recomenda '
+            'parâmetros para um tempo alvo')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profile',
+                            help='Perfil de PASSWORD_HASHER_PROFILES '
+                                 '(padrão: o ativo)')
+        parser.add_argument('--target-ms', type=float, default=250,
+                            help='Tempo alvo por hash, em milissegundos')
+        parser.add_argument('--samples', type=int, default=3,
+                            help='Medições por configuração (usa a mediana)')
+
+    def measure(self, hasher, options, samples):
+        for name, value in options.items():
+            setattr(hasher, name, value)
+        timings = []
+        for _ in range(samples):
+            start = time.perf_counter()
+            hasher.encode('calibrate-hasher', hasher.salt())
+            timings.append(time.perf_counter() - start)
+        return statistics.median(timings) * 1000
+
+    def handle(self, *args, **options):
+        name = options['profile'] or settings.PASSWORD_HASHER_PROFILE
+        if name not in settings.PASSWORD_HASHER_PROFILES:
+            raise CommandError(f'Perfil desconhecido: {name}')
+        path, profile_options = hasher_profile(name)
+        hasher = import_string(path)()
+        if hasher.library:
+            try:
+                hasher._load_library()
+            except ValueError as exc:
+                # Ex.: argon2-cffi não instalado
+                raise CommandError(str(exc))
+
+        if hasher.algorithm not in COST_PARAMETERS:
+            raise CommandError(
+                f'Calibração não suportada para {hasher.algorithm}'
+            )
+        parameter, scaling, minimum = COST_PARAMETERS[hasher.algorithm]
+        current = profile_options.get(parameter, getattr(hasher, parameter))
+        target = options['target_ms']
+        samples = options['samples']
+
+        elapsed = self.measure(hasher, {**profile_options}, samples)
+        self.stdout.write(
+            f'{name}: {parameter}={current} -> {elapsed:.1f} ms'
+        )
+
+        estimate = current * target / elapsed
+        if scaling == 'power_of_two':
+            recommended = minimum
+            while recommended * 2 <= estimate:
+                recommended *= 2
+        else:
+            recommended = max(minimum, round(estimate / minimum) * minimum)
+
+        recommended_options = {**profile_options, parameter: recommended}
+        elapsed = self.measure(hasher, recommended_options, samples)
+        self.stdout.write(
+            f'{name}: {parameter}={recommended} -> {elapsed:.1f} ms '
+            f'(alvo: {target:.0f} ms)'
+        )
+        self.stdout.write(self.style.SUCCESS('Configuração recomendada:'))
+        self.stdout.write(f'PASSWORD_HASHER_PROFILE={name}')
+        self.stdout.write(
+            f"PASSWORD_HASHER_OPTIONS='{json.dumps({parameter: recommended})}'"
+        )
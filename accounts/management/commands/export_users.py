@@ -0,0 +1,52 @@
+import csv
+import json
+import sys
+
+from django.core.management.base import BaseCommand
+
+from accounts.models import User
+
+FIELDS = ['id', 'username', 'email', 'first_name', 'last_name', 'phone',
+          'is_active', 'is_staff', 'is_2fa_enabled', 'date_joined']
+
+
+class Command(BaseCommand):
+    help = 'Exporta usuários para CSV ou JSONL com uso de memória constante'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='-',
+                            help="Arquivo de saída ('-' = stdout)")
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            default='csv')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--include-password-hash', action='store_true',
+                            help='Inclui a coluna password (hash), '
+                                 'reimportável com import_users --prehashed')
+
+    def handle(self, *args, **options):
+        fields = list(FIELDS)
+        if options['include_password_hash']:
+            fields.append('password')
+
+        rows = User.objects.order_by('pk').values_list(*fields).iterator(
+            chunk_size=options['chunk_size']
+        )
+        output = sys.stdout if options['output'] == '-' else \
+            open(options['output'], 'w', newline='', encoding='utf-8')
+        count = 0
+        try:
+            if options['format'] == 'csv':
+                writer = csv.writer(output)
+                writer.writerow(fields)
+                for row in rows:
+                    writer.writerow(row)
+                    count += 1
+            else:
+                for row in rows:
+                    output.write(json.dumps(dict(zip(fields, row)),
+                                            default=str) + '\n')
+                    count += 1
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        self.stderr.write(f'{count} usuário(s) exportado(s)')
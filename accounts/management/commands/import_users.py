@@ -0,0 +1,188 @@
+import csv
+import json
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import django
+from django import forms
+from django.contrib.auth.hashers import (
+    identify_hasher, is_password_usable, make_password,
+)
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from accounts.forms import EMAIL_IN_USE_MESSAGE
+from accounts.models import User, normalize_email
+from accounts.rendering import bump_users_version
+
+REQUIRED_FIELDS = ('username', 'email', 'first_name', 'last_name')
+BOOLEAN_FIELDS = ('is_active', 'is_staff')
+# Validados com as regras do modelo (tamanho, caracteres do username): um
+# valor inválido faria o bulk_create do lote inteiro falhar no banco
+MODEL_FIELDS = ('username', 'email', 'first_name', 'last_name', 'phone')
+
+
+def init_worker():
+    # Processos iniciados com spawn/forkserver precisam configurar o Django
+    django.setup()
+
+
+def hash_password(password):
+    return make_password(password or None)
+
+
+def read_rows(stream, file_format):
+    """Lê o arquivo linha a linha, sem carregá-lo inteiro na memória"""
+    if file_format == 'csv':
+        yield from csv.DictReader(stream)
+    else:
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+
+
+class Command(BaseCommand):
+    help = 'Importa usuários de um arquivo CSV ou JSONL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Arquivo de entrada ('-' = stdin)")
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help='Padrão: deduzido pela extensão')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Processos para gerar os hashes de senha')
+        parser.add_argument('--prehashed', action='store_true',
+                            help='A coluna password já contém hashes '
+                                 'no formato do Django')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or \
+            ('jsonl' if path.endswith(('.jsonl', '.json')) else 'csv')
+        self.prehashed = options['prehashed']
+        self.email_field = forms.EmailField()
+        self.seen_emails = set()
+        self.seen_usernames = set()
+        created = skipped = 0
+
+        stream = sys.stdin if path == '-' else \
+            open(path, newline='', encoding='utf-8')
+        pool = None if self.prehashed else ProcessPoolExecutor(
+            max_workers=options['workers'], initializer=init_worker
+        )
+        try:
+            rows = enumerate(read_rows(stream, file_format), start=1)
+            while batch := list(islice(rows, options['batch_size'])):
+                users, errors = self.build_batch(batch, pool)
+                with transaction.atomic():
+                    User.objects.bulk_create(users)
+                if users:
+                    # bulk_create não dispara post_save: invalida os
+                    # fragmentos da lista de usuários a cada lote gravado
+                    bump_users_version()
+                created += len(users)
+                skipped += len(errors)
+                for line, message in errors:
+                    self.stderr.write(f'Linha {line}: {message}')
+        except (OSError, ValueError) as exc:
+            raise CommandError(str(exc))
+        finally:
+            if pool is not None:
+                pool.shutdown()
+            if stream is not sys.stdin:
+                stream.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{created} usuário(s) importado(s), {skipped} ignorado(s)'
+        ))
+
+    def build_batch(self, batch, pool):
+        errors = []
+        valid = []
+        for line, row in batch:
+            try:
+                valid.append((line, self.clean_row(row)))
+            except ValidationError as exc:
+                errors.append((line, ' '.join(exc.messages)))
+
+        # Mesma regra de UserRegistrationForm.clean_email, em uma consulta
+        emails = [row['email'] for _, row in valid]
+        usernames = [row['username'] for _, row in valid]
+        taken_emails = set(User.objects.with_emails(emails)
+                           .values_list('email', flat=True))
+        taken_usernames = set(User.objects.filter(username__in=usernames)
+                              .values_list('username', flat=True))
+        rows = []
+        for line, row in valid:
+            if row['email'] in taken_emails:
+                errors.append((line, EMAIL_IN_USE_MESSAGE))
+            elif row['username'] in taken_usernames:
+                errors.append((line, 'Nome de usuário já está em uso.'))
+            else:
+                rows.append(row)
+
+        passwords = [row['password'] for row in rows]
+        if pool is not None:
+            passwords = pool.map(hash_password, passwords, chunksize=16)
+        return [
+            User(
+                username=row['username'],
+                email=row['email'],
+                first_name=row['first_name'],
+                last_name=row['last_name'],
+                phone=row.get('phone') or None,
+                password=password,
+                **{field: row[field] for field in BOOLEAN_FIELDS
+                   if field in row},
+            )
+            for row, password in zip(rows, passwords)
+        ], errors
+
+    def clean_row(self, row):
+        row = {key: (value or '').strip() if isinstance(value, str)
+               else value for key, value in row.items()}
+        missing = [field for field in REQUIRED_FIELDS if not row.get(field)]
+        if missing:
+            raise ValidationError(
+                f'Campos obrigatórios ausentes: {", ".join(missing)}'
+            )
+        row['email'] = normalize_email(self.email_field.clean(row['email']))
+        errors = []
+        # Com --prehashed a coluna password vai para o banco como está
+        fields = MODEL_FIELDS + (('password',) if self.prehashed else ())
+        for name in fields:
+            if not row.get(name):
+                continue
+            try:
+                User._meta.get_field(name).clean(row[name], None)
+            except ValidationError as exc:
+                errors.extend(f'{name}: {message}'
+                              for message in exc.messages)
+        if errors:
+            raise ValidationError(errors)
+        for field in BOOLEAN_FIELDS:
+            if row.get(field) in ('', None):
+                row.pop(field, None)
+            elif isinstance(row[field], str):
+                row[field] = row[field].lower() in ('1', 'true', 'sim')
+
+        if row['email'] in self.seen_emails:
+            raise ValidationError('E-mail repetido no arquivo.')
+        if row['username'] in self.seen_usernames:
+            raise ValidationError('Nome de usuário repetido no arquivo.')
+        self.seen_emails.add(row['email'])
+        self.seen_usernames.add(row['username'])
+
+        if self.prehashed:
+            if not row.get('password'):
+                row['password'] = make_password(None)
+            elif is_password_usable(row['password']):
+                # Senhas inutilizáveis ('!...', ex.: exportadas de contas
+                # sem senha) são mantidas como estão
+                try:
+                    identify_hasher(row['password'])
+                except ValueError:
+                    raise ValidationError('Hash de senha não reconhecido.')
+        return row
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from accounts.models import User
+
+
+class Command(BaseCommand):
+    help = ('Grava os e-mails dos usuários normalizados (minúsculas), em '
+            'lotes; rode antes da migração 0009 em tabelas grandes')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Usuários lidos e atualizados por lote')
+
+    def handle(self, *args, **options):
+        updated, conflicts = User.objects.normalize_stored_emails(
+            batch_size=options['batch_size']
+        )
+        self.stdout.write(f'{updated} e-mail(s) normalizado(s)')
+        for pk, email in conflicts:
+            self.stderr.write(
+                f'Conflito: {email} (id {pk}) já existe em minúsculas'
+            )
+        if conflicts:
+            self.stderr.write(self.style.ERROR(
+                f'{len(conflicts)} conflito(s) precisam ser resolvidos '
+                f'manualmente antes da migração'
+            ))
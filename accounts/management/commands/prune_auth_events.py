@@ -0,0 +1,55 @@
+import os
+import re
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from accounts.models import AuthEvent, event_partition
+
+JSONL_NAME = re.compile(r'^auth-events-(\d{8})\.jsonl$')
+
+
+class Command(BaseCommand):
+    help = ('Remove os eventos de autenticação mais antigos que a retenção, '
+            'por partição (mês) inteira')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int,
+                            default=settings.AUDIT_LOG['RETENTION_DAYS'],
+                            help='Dias de eventos mantidos')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Linhas removidas por transação')
+        parser.add_argument('--sleep', type=float, default=0,
+                            help='Pausa em segundos entre os lotes')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        # Só meses inteiros: o mês do corte é mantido até acabar
+        partition = event_partition(cutoff)
+        old = AuthEvent.objects.before_partition(partition)
+        total = 0
+        while True:
+            # O índice de partition entrega os ids sem varrer a tabela
+            ids = list(old.values_list('pk', flat=True)
+                       [:options['batch_size']])
+            if not ids:
+                break
+            deleted, _ = AuthEvent.objects.filter(pk__in=ids).delete()
+            total += deleted
+            if options['sleep']:
+                time.sleep(options['sleep'])
+        self.stdout.write(f'{total} evento(s) anteriores a {partition} '
+                          f'removido(s)')
+
+        path = settings.AUDIT_LOG['PATH']
+        if os.path.isdir(path):
+            files = 0
+            for name in os.listdir(path):
+                match = JSONL_NAME.match(name)
+                if match and match.group(1) < f'{cutoff:%Y%m%d}':
+                    os.remove(os.path.join(path, name))
+                    files += 1
+            self.stdout.write(f'{files} arquivo(s) JSONL removido(s)')
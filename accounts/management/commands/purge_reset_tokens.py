@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from accounts.models import PasswordResetToken
+
+
+class Command(BaseCommand):
+    help = 'Remove tokens de redefinição de senha expirados em lotes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Linhas removidas por transação')
+        parser.add_argument('--sleep', type=float, default=0,
+                            help='Pausa em segundos entre os lotes')
+
+    def handle(self, *args, **options):
+        expired = PasswordResetToken.objects.expired()
+        total = 0
+        while True:
+            # Lotes pequenos mantêm cada DELETE curto, sem travar a tabela
+            ids = list(expired.values_list('pk', flat=True)
+                       [:options['batch_size']])
+            if not ids:
+                break
+            deleted, _ = PasswordResetToken.objects.filter(
+                pk__in=ids
+            ).delete()
+            total += deleted
+            if options['sleep']:
+                time.sleep(options['sleep'])
+        self.stdout.write(f'{total} token(s) removido(s)')
@@ -0,0 +1,30 @@
+import time
+
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = ('Remove sessões expiradas em lotes (alternativa ao '
+            'clearsessions, que apaga tudo em um único DELETE)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--sleep', type=float, default=0,
+                            help='Pausa em segundos entre os lotes')
+
+    def handle(self, *args, **options):
+        # As entradas de cache expiram sozinhas; só a tabela precisa de limpeza
+        expired = Session.objects.filter(expire_date__lt=timezone.now())
+        total = 0
+        while True:
+            keys = list(expired.values_list('session_key', flat=True)
+                        [:options['batch_size']])
+            if not keys:
+                break
+            deleted, _ = Session.objects.filter(session_key__in=keys).delete()
+            total += deleted
+            if options['sleep']:
+                time.sleep(options['sleep'])
+        self.stdout.write(f'{total} sessão(ões) removida(s)')
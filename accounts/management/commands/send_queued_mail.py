@@ -0,0 +1,51 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from accounts.mail import process_queue, purge_processed
+
+
+def worker(batch_size):
+    try:
+        return process_queue(batch_size)
+    finally:
+        # Cada thread tem sua própria conexão com o banco
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = 'Envia os e-mails pendentes da fila (OutboundEmail)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50,
+                            help='E-mails enviados por conexão SMTP')
+        parser.add_argument('--workers', type=int, default=2,
+                            help='Threads enviando lotes em paralelo')
+        parser.add_argument('--loop', action='store_true',
+                            help='Continua verificando a fila')
+        parser.add_argument('--interval', type=float, default=5,
+                            help='Segundos entre verificações com --loop')
+
+    def handle(self, *args, **options):
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            while True:
+                close_old_connections()
+                results = list(pool.map(
+                    worker, [options['batch_size']] * options['workers']
+                ))
+                sent = sum(result[0] for result in results)
+                failed = sum(result[1] for result in results)
+                if sent or failed:
+                    self.stdout.write(
+                        f'{sent} e-mail(s) enviado(s), {failed} falha(s)'
+                    )
+                purged = purge_processed()
+                if purged:
+                    self.stdout.write(
+                        f'{purged} e-mail(s) processado(s) removido(s)'
+                    )
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
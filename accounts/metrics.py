@@ -0,0 +1,326 @@
+"""
+Métricas no formato de texto do Prometheus.
+
+Contadores e histogramas são agregados sem locks: cada thread grava em seu
+próprio shard (um dict) e a exportação soma os shards. Quando uma thread
+termina, o shard dela é somado a um shard base e deixa de ser percorrido.
+Com vários processos (gunicorn) defina METRICS_MULTIPROC_DIR: cada processo
+grava periodicamente um snapshot em <dir>/<pid>-<id>.json, com um id
+aleatório por processo para que pids reutilizados (ex.: containers
+reiniciados) não se sobrescrevam, e o endpoint soma os arquivos de todos.
+O processo apaga o próprio arquivo ao sair, e collect() descarta os de
+pids que não existem mais (workers mortos sem passar pelo atexit).
+"""
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+import weakref
+from bisect import bisect_left
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0)
+
+REGISTRY = {}
+
+_local = threading.local()
+# Shards das threads vivas, por id(); os das que terminaram vão para _base
+_shards = {}
+_base = {}
+_lock = threading.Lock()
+_last_flush = 0.0
+_process_id = uuid.uuid4().hex[:12]
+
+
+class _ShardOwner:
+    """Guardado no threading.local: é coletado quando a thread termina"""
+
+
+def _merge_into(target, shard):
+    for key, value in shard.items():
+        metric = REGISTRY.get(key[0])
+        if metric is not None:
+            target[key] = metric.merge(target.get(key), value)
+
+
+def _retire(shard):
+    with _lock:
+        if _shards.pop(id(shard), None) is not None:
+            _merge_into(_base, shard)
+
+
+def _shard():
+    shard = getattr(_local, 'shard', None)
+    if shard is None:
+        shard = {}
+        owner = _ShardOwner()
+        with _lock:
+            _shards[id(shard)] = shard
+        _local.shard, _local.owner = shard, owner
+        weakref.finalize(owner, _retire, shard)
+    return shard
+
+
+def _reset_after_fork():
+    global _local, _shards, _base, _lock, _last_flush, _process_id
+    _local = threading.local()
+    _shards = {}
+    _base = {}
+    _lock = threading.Lock()
+    _last_flush = 0.0
+    _process_id = uuid.uuid4().hex[:12]
+
+
+if hasattr(os, 'register_at_fork'):
+    # Um worker criado por fork não herda as contagens do processo pai
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        REGISTRY[name] = self
+
+    def _key(self, labels):
+        return (self.name,) + tuple(str(labels[label])
+                                    for label in self.labelnames)
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        shard = _shard()
+        key = self._key(labels)
+        shard[key] = shard.get(key, 0) + amount
+
+    @staticmethod
+    def merge(total, value):
+        return (total or 0) + value
+
+    def samples(self, labels, value):
+        yield self.name, labels, value
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(),
+                 buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        shard = _shard()
+        key = self._key(labels)
+        # [contagem por bucket (não acumulada)..., +Inf, soma]
+        state = shard.get(key)
+        if state is None:
+            state = shard[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        state[bisect_left(self.buckets, value)] += 1
+        state[-1] += value
+
+    @staticmethod
+    def merge(total, value):
+        if total is None:
+            return list(value)
+        return [a + b for a, b in zip(total, value)]
+
+    def samples(self, labels, value):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), value[:-1]):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            yield f'{self.name}_bucket', labels + (('le', le),), cumulative
+        yield f'{self.name}_sum', labels, value[-1]
+        yield f'{self.name}_count', labels, cumulative
+
+
+def collect_local():
+    """Soma os shards deste processo: {chave: valor}"""
+    with _lock:
+        # Sob o lock um shard está ou em _shards ou já somado em _base
+        shards = list(_shards.values())
+        totals = dict(_base)
+    for shard in shards:
+        # dict.copy() roda inteiro com o GIL: não vê escritas pela metade
+        _merge_into(totals, shard.copy())
+    return totals
+
+
+def _snapshot_path(directory):
+    return os.path.join(directory, f'{os.getpid()}-{_process_id}.json')
+
+
+def flush(directory=None):
+    """Grava o snapshot deste processo em METRICS_MULTIPROC_DIR"""
+    global _last_flush
+    directory = directory or settings.METRICS_MULTIPROC_DIR
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    data = [[list(key), value] for key, value in collect_local().items()]
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w') as stream:
+        json.dump(data, stream)
+    # Troca atômica: quem lê nunca vê um arquivo pela metade
+    os.replace(temp_path, _snapshot_path(directory))
+    _last_flush = time.monotonic()
+
+
+def maybe_flush():
+    if settings.METRICS_MULTIPROC_DIR and \
+            time.monotonic() - _last_flush >= settings.METRICS_FLUSH_INTERVAL:
+        flush()
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Existe, mas pertence a outro usuário
+        return True
+    return True
+
+
+def _prune(directory, name):
+    """Apaga o snapshot se o processo que o gravou já terminou"""
+    pid = name.split('-', 1)[0]
+    if not pid.isdigit() or _pid_alive(int(pid)):
+        return False
+    try:
+        os.remove(os.path.join(directory, name))
+    except FileNotFoundError:
+        pass
+    return True
+
+
+def collect():
+    """Valores de todos os processos (ou só deste, sem diretório)"""
+    directory = settings.METRICS_MULTIPROC_DIR
+    if not directory:
+        return collect_local()
+    flush(directory)
+    totals = {}
+    for name in os.listdir(directory):
+        if not name.endswith('.json') or _prune(directory, name):
+            continue
+        try:
+            with open(os.path.join(directory, name)) as stream:
+                data = json.load(stream)
+        except (OSError, ValueError):
+            continue
+        for key, value in data:
+            key = tuple(key)
+            metric = REGISTRY.get(key[0])
+            if metric is not None:
+                totals[key] = metric.merge(totals.get(key), value)
+    return totals
+
+
+def _escape(value):
+    return value.replace('\\', r'\\').replace('\n', r'\n') \
+        .replace('"', r'\"')
+
+
+def _format(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    """Exporta todas as métricas no formato de texto do Prometheus"""
+    values = {}
+    for key, value in collect().items():
+        values.setdefault(key[0], []).append((key[1:], value))
+    lines = []
+    for name, metric in REGISTRY.items():
+        lines.append(f'# HELP {name} {metric.documentation}')
+        lines.append(f'# TYPE {name} {metric.type}')
+        for label_values, value in sorted(values.get(name, [])):
+            labels = tuple(zip(metric.labelnames, label_values))
+            for sample, sample_labels, sample_value in \
+                    metric.samples(labels, value):
+                label_text = ','.join(f'{label}="{_escape(text)}"'
+                                      for label, text in sample_labels)
+                if label_text:
+                    sample = f'{sample}{{{label_text}}}'
+                lines.append(f'{sample} {_format(sample_value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def timed(operation):
+    """Registra a duração da função em OPERATION_LATENCY"""
+    def decorator(func):
+        if iscoroutinefunction(func):
+            async def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    OPERATION_LATENCY.observe(time.perf_counter() - start,
+                                              operation=operation)
+        else:
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    OPERATION_LATENCY.observe(time.perf_counter() - start,
+                                              operation=operation)
+        return wraps(func)(wrapper)
+    return decorator
+
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Tempo de resposta por view',
+    ('view', 'method'),
+)
+REQUESTS = Counter(
+    'http_requests_total', 'Requisições por view e status',
+    ('view', 'method', 'status'),
+)
+REQUEST_QUERIES = Histogram(
+    'http_request_db_queries', 'Consultas ao banco por requisição',
+    ('view',), buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+)
+OPERATION_LATENCY = Histogram(
+    'auth_operation_duration_seconds',
+    'Duração de authenticate, verificação TOTP, QR Code e envio de e-mail',
+    ('operation',),
+)
+LOGIN_ATTEMPTS = Counter(
+    'auth_login_attempts_total',
+    'Tentativas de login (success, failure, 2fa_required)', ('result',),
+)
+TWO_FACTOR_VERIFICATIONS = Counter(
+    'auth_2fa_verifications_total', 'Verificações de 2FA', ('result',),
+)
+RATELIMIT_REJECTIONS = Counter(
+    'auth_ratelimit_rejections_total', 'Requisições bloqueadas (429)',
+    ('scope', 'key'),
+)
+
+
+@atexit.register
+def _remove_at_exit():
+    """As contagens deste processo morrem com ele: apaga o snapshot"""
+    directory = settings.configured and getattr(
+        settings, 'METRICS_MULTIPROC_DIR', None)
+    if directory:
+        try:
+            os.remove(_snapshot_path(directory))
+        except FileNotFoundError:
+            pass
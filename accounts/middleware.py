@@ -0,0 +1,200 @@
+import time
+from functools import partial
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.http import HttpResponse
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.functional import SimpleLazyObject
+from django.utils.regex_helper import _lazy_re_compile
+
+from . import metrics
+from .hashers import HashingPoolSaturated
+from .otp import DEVICE_SESSION_KEY, get_device
+
+try:
+    import brotli
+except ImportError:  # extra opcional: uv sync --extra brotli
+    brotli = None
+
+re_accepts_brotli = _lazy_re_compile(r'\bbr\b')
+
+
+class OTPMiddleware:
+    """
+    Substitui o django_otp.middleware.OTPMiddleware.
+
+    Adiciona request.user.otp_device e request.user.is_verified(). O
+    dispositivo só é resolvido quando a sessão foi verificada no 2FA, a
+    partir da linha do usuário já carregada: nenhuma consulta extra.
+    Funciona em WSGI e ASGI; no modo assíncrono request.auser() também
+    devolve o usuário com esses atributos.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        self._wrap_user(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        self._wrap_user(request)
+        auser = getattr(request, 'auser', None)
+        if auser is not None:
+            request.auser = partial(self._averify_user, request, auser)
+        return await self.get_response(request)
+
+    def _wrap_user(self, request):
+        user = getattr(request, 'user', None)
+        if user is not None:
+            request.user = SimpleLazyObject(
+                partial(self._verify_user, request, user)
+            )
+
+    @staticmethod
+    def _set_device(user, name):
+        user.otp_device = None
+        user.is_verified = partial(is_verified, user)
+        if user.is_authenticated and name:
+            user.otp_device = get_device(user, name)
+        return user
+
+    @classmethod
+    def _verify_user(cls, request, user):
+        name = request.session.get(DEVICE_SESSION_KEY) \
+            if user.is_authenticated else None
+        return cls._set_device(user, name)
+
+    @classmethod
+    async def _averify_user(cls, request, auser):
+        user = await auser()
+        name = await request.session.aget(DEVICE_SESSION_KEY) \
+            if user.is_authenticated else None
+        return cls._set_device(user, name)
+
+
+def is_verified(user):
+    return user.otp_device is not None
+
+
+class HashingOverloadMiddleware(MiddlewareMixin):
+    """
+    Responde 503 quando o pool de hashing está cheio (HashingPoolSaturated),
+    em vez de deixar a requisição esperando por um worker livre.
+    """
+
+    def process_exception(self, request, exception):
+        if not isinstance(exception, HashingPoolSaturated):
+            return None
+        response = HttpResponse(
+            'Servidor sobrecarregado. Tente novamente em instantes.',
+            status=503,
+            content_type='text/plain; charset=utf-8',
+        )
+        response['Retry-After'] = str(
+            settings.PASSWORD_HASHING_POOL.get('RETRY_AFTER', 1)
+        )
+        return response
+
+
+class QueryCounter:
+    """execute_wrapper que conta as consultas feitas na requisição"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class MetricsMiddleware:
+    """
+    Registra tempo de resposta, status e número de consultas por view
+    (accounts.metrics). Deve ser o primeiro da lista de MIDDLEWARE.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        queries = QueryCounter()
+        start = time.perf_counter()
+        with connection.execute_wrapper(queries):
+            response = self.get_response(request)
+        self._record(request, response, time.perf_counter() - start,
+                     queries.count)
+        return response
+
+    async def __acall__(self, request):
+        queries = QueryCounter()
+        start = time.perf_counter()
+        # A conexão é local ao contexto, então o wrapper vale também para
+        # o ORM executado pelas views assíncronas via sync_to_async
+        with connection.execute_wrapper(queries):
+            response = await self.get_response(request)
+        self._record(request, response, time.perf_counter() - start,
+                     queries.count)
+        return response
+
+    @staticmethod
+    def _record(request, response, elapsed, query_count):
+        match = getattr(request, 'resolver_match', None)
+        # Só nomes de views: URLs não encontradas não criam novas séries
+        view = match.view_name if match is not None else '<unresolved>'
+        metrics.REQUEST_LATENCY.observe(elapsed, view=view,
+                                        method=request.method)
+        metrics.REQUESTS.inc(view=view, method=request.method,
+                             status=response.status_code)
+        metrics.REQUEST_QUERIES.observe(query_count, view=view)
+        metrics.maybe_flush()
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    GZipMiddleware com suporte a brotli quando o pacote está instalado e o
+    navegador o aceita. Respostas com o token CSRF no HTML continuam em
+    gzip, que recebe o preenchimento aleatório do Django contra o BREACH.
+    """
+    brotli_quality = 5
+
+    def process_response(self, request, response):
+        if brotli is None or response.streaming \
+                or len(response.content) < 200 \
+                or response.has_header('Content-Encoding') \
+                or request.META.get('CSRF_COOKIE_NEEDS_UPDATE') \
+                or not re_accepts_brotli.search(
+                    request.META.get('HTTP_ACCEPT_ENCODING', '')):
+            return super().process_response(request, response)
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        compressed = brotli.compress(response.content,
+                                     quality=self.brotli_quality)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response.headers['Content-Length'] = str(len(compressed))
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = 'br'
+        return response
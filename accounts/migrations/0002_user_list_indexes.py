@@ -0,0 +1,84 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:49
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='passwordresettoken',
+            options={'verbose_name': 'Token de Redefinição de Senha', 'verbose_name_plural': 'Tokens de Redefinição de Senha'},
+        ),
+        migrations.AlterField(
+            model_name='passwordresettoken',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, verbose_name='Criado em'),
+        ),
+        migrations.AlterField(
+            model_name='passwordresettoken',
+            name='is_used',
+            field=models.BooleanField(default=False, verbose_name='Usado'),
+        ),
+        migrations.AlterField(
+            model_name='passwordresettoken',
+            name='token',
+            field=models.CharField(max_length=100, unique=True, verbose_name='Token'),
+        ),
+        migrations.AlterField(
+            model_name='passwordresettoken',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Usuário'),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='email',
+            field=models.EmailField(max_length=254, unique=True, verbose_name='E-mail'),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='is_2fa_enabled',
+            field=models.BooleanField(default=False, verbose_name='2FA Habilitado'),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='otp_secret',
+            field=models.CharField(blank=True, max_length=32, null=True, verbose_name='Segredo OTP'),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='phone',
+            field=models.CharField(blank=True, max_length=20, null=True, verbose_name='Telefone'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['-date_joined', '-id'], name='user_joined_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['is_active', '-date_joined', '-id'], name='user_active_joined_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['is_staff', '-date_joined', '-id'], name='user_staff_joined_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['is_2fa_enabled', '-date_joined', '-id'], name='user_2fa_joined_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['first_name', 'last_name'], name='user_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['last_name'], name='user_last_name_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_outboundemail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='otp_last_timestep',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Último passo TOTP usado'),
+        ),
+    ]
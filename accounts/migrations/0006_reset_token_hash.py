@@ -0,0 +1,51 @@
+import hashlib
+
+from django.db import migrations, models
+
+
+def hash_existing_tokens(apps, schema_editor):
+    PasswordResetToken = apps.get_model('accounts', 'PasswordResetToken')
+    tokens = PasswordResetToken.objects.only('token').iterator(chunk_size=2000)
+    batch = []
+    for reset_token in tokens:
+        reset_token.token_hash = hashlib.sha256(
+            reset_token.token.encode()
+        ).hexdigest()
+        batch.append(reset_token)
+        if len(batch) == 2000:
+            PasswordResetToken.objects.bulk_update(batch, ['token_hash'])
+            batch = []
+    PasswordResetToken.objects.bulk_update(batch, ['token_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_user_otp_last_timestep'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='passwordresettoken',
+            name='token_hash',
+            field=models.CharField(max_length=64, null=True, verbose_name='Hash do token'),
+        ),
+        migrations.RunPython(hash_existing_tokens, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='passwordresettoken',
+            name='token',
+        ),
+        migrations.AlterField(
+            model_name='passwordresettoken',
+            name='token_hash',
+            field=models.CharField(max_length=64, unique=True, verbose_name='Hash do token'),
+        ),
+        migrations.AddIndex(
+            model_name='passwordresettoken',
+            index=models.Index(fields=['user', 'is_used'], name='reset_token_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='passwordresettoken',
+            index=models.Index(fields=['created_at'], name='reset_token_created_idx'),
+        ),
+    ]
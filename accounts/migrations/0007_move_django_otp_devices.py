@@ -0,0 +1,51 @@
+import base64
+import binascii
+
+from django.db import migrations, models
+
+TOTP_DEVICE_TABLE = 'otp_totp_totpdevice'
+
+
+def move_totp_devices(apps, schema_editor):
+    """
+    Copia os segredos dos TOTPDevice confirmados do django_otp (app
+    removido) para User.otp_secret, quando o usuário ainda não tem um.
+    """
+    connection = schema_editor.connection
+    if TOTP_DEVICE_TABLE not in connection.introspection.table_names():
+        return
+
+    User = apps.get_model('accounts', 'User')
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT user_id, key FROM {TOTP_DEVICE_TABLE} '
+            'WHERE confirmed = %s AND step = 30 AND digits = 6 '
+            'ORDER BY id',
+            [True],
+        )
+        devices = cursor.fetchall()
+
+    for user_id, key in devices:
+        try:
+            secret = base64.b32encode(binascii.unhexlify(key)).decode()
+        except (binascii.Error, ValueError):
+            continue
+        User.objects.filter(pk=user_id, otp_secret__isnull=True).update(
+            otp_secret=secret.rstrip('='), is_2fa_enabled=True
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_reset_token_hash'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='otp_secret',
+            field=models.CharField(blank=True, max_length=64, null=True, verbose_name='Segredo OTP'),
+        ),
+        migrations.RunPython(move_totp_devices, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_move_django_otp_devices'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='otp_backup_codes',
+            field=models.TextField(blank=True, default='', verbose_name='Códigos de backup'),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:10
+
+import accounts.models
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+def normalize_emails(apps, schema_editor):
+    # Em tabelas grandes rode `manage.py normalize_emails` antes: aqui só
+    # sobra o que foi gravado depois dele. Não usa o UserManager atual (que
+    # também mexe nos caches): a normalização e os conflitos ficam aqui
+    User = apps.get_model('accounts', 'User')
+    users = User._base_manager.using(schema_editor.connection.alias)
+    conflicts = []
+    last_pk = 0
+    while True:
+        batch = list(users.filter(pk__gt=last_pk).order_by('pk')
+                     .only('pk', 'email')[:1000])
+        if not batch:
+            break
+        last_pk = batch[-1].pk
+        changed = [user for user in batch
+                   if user.email != user.email.strip().lower()]
+        if not changed:
+            continue
+        taken = set(users.filter(
+            email__in={user.email.strip().lower() for user in changed}
+        ).values_list('email', flat=True))
+        normalized = []
+        for user in changed:
+            email = user.email.strip().lower()
+            if email in taken:
+                conflicts.append((user.pk, user.email))
+                continue
+            taken.add(email)
+            user.email = email
+            normalized.append(user)
+        users.bulk_update(normalized, ['email'])
+    if conflicts:
+        raise RuntimeError(
+            'E-mails que só diferem em maiúsculas e minúsculas: '
+            + ', '.join(f'{email} (id {pk})' for pk, email in conflicts)
+            + '. Altere um deles e execute a migração novamente.'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0008_user_otp_backup_codes'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AlterModelManagers(
+            name='user',
+            managers=[
+                ('objects', accounts.models.UserManager()),
+            ],
+        ),
+        migrations.RunPython(normalize_emails, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='user',
+            name='user_email_upper_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='user',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('email'), name='user_email_ci_unique'),
+        ),
+    ]
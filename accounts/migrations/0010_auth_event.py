@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0009_normalize_user_emails'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('partition', models.PositiveIntegerField(verbose_name='Partição (AAAAMM)')),
+                ('created_at', models.DateTimeField(verbose_name='Data')),
+                ('event', models.CharField(choices=[('login_succeeded', 'Login'), ('login_failed', 'Falha de login'), ('logout', 'Logout'), ('2fa_failed', 'Código 2FA inválido'), ('2fa_enabled', '2FA ativado'), ('2fa_disabled', '2FA desativado'), ('password_reset_requested', 'Redefinição de senha solicitada'), ('password_reset_completed', 'Senha redefinida')], max_length=32, verbose_name='Evento')),
+                ('user_id', models.BigIntegerField(blank=True, null=True, verbose_name='Usuário')),
+                ('email', models.CharField(blank=True, max_length=254, verbose_name='E-mail')),
+                ('ip', models.GenericIPAddressField(blank=True, null=True, verbose_name='IP')),
+            ],
+            options={
+                'verbose_name': 'Evento de Autenticação',
+                'verbose_name_plural': 'Eventos de Autenticação',
+                'indexes': [models.Index(fields=['user_id', '-created_at'], name='auth_event_user_idx'), models.Index(fields=['partition'], name='auth_event_partition_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:36
+
+import accounts.models
+import django.db.models.functions.text
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0010_auth_event'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='user',
+            name='user_name_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='user',
+            name='user_last_name_idx',
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=accounts.models.PrefixIndex(django.db.models.functions.text.Upper('first_name'), django.db.models.functions.text.Upper('last_name'), name='user_name_upper_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=accounts.models.PrefixIndex(django.db.models.functions.text.Upper('last_name'), name='user_last_name_upper_idx'),
+        ),
+    ]
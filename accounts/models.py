@@ -1,30 +1,176 @@
-from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.contrib.auth.models import AbstractUser, UserManager as DjangoUserManager
+from django.db import models, transaction
+from django.db.models.functions import Lower, Upper
 import pyotp
-import qrcode
-from io import BytesIO
 import base64
+import hashlib
+import secrets
+from django.conf import settings
 from django.utils import timezone
 from datetime import timedelta
 
+from . import otp
+from .credential_cache import invalidate_credentials
+from .qr import CONTENT_TYPES as QR_CONTENT_TYPES, qr_key, render_qr
+from .rendering import bump_users_version
+from .user_cache import invalidate_users
+
+
+def normalize_email(email):
+    """Forma gravada do e-mail: sem espaços nas pontas e em minúsculas"""
+    return (email or '').strip().lower()
+
+
+class PrefixIndex(models.Index):
+    """
+    Índice funcional para buscas por prefixo (LIKE 'abc%'). No PostgreSQL
+    as expressões recebem a classe de operadores text_pattern_ops, sem a
+    qual o LIKE não usa o índice em bancos com collation diferente de C.
+    """
+
+    def create_sql(self, model, schema_editor, using='', **kwargs):
+        if schema_editor.connection.vendor == 'postgresql':
+            from django.contrib.postgres.indexes import OpClass
+            index = self.clone()
+            index.expressions = tuple(
+                OpClass(expression, name='text_pattern_ops')
+                for expression in self.expressions
+            )
+            return super(PrefixIndex, index).create_sql(
+                model, schema_editor, using=using, **kwargs
+            )
+        return super().create_sql(model, schema_editor, using=using,
+                                  **kwargs)
+
+
+class UserQuerySet(models.QuerySet):
+    def with_email(self, email):
+        """
+        Busca pelo e-mail normalizado. Como os e-mails são gravados
+        normalizados, a comparação exata usa o índice único de email.
+        """
+        return self.filter(email=normalize_email(email))
+
+    def with_emails(self, emails):
+        return self.filter(email__in={normalize_email(email)
+                                      for email in emails})
+
+
+class UserManager(DjangoUserManager.from_queryset(UserQuerySet)):
+    @classmethod
+    def normalize_email(cls, email):
+        # Usado por create_user() e AbstractUser.clean()
+        return normalize_email(email)
+
+    def normalize_stored_emails(self, batch_size=1000):
+        """
+        Normaliza os e-mails gravados, em lotes por pk. Um e-mail que
+        colidiria com outro já normalizado não é alterado. Retorna
+        (quantidade atualizada, lista de (pk, e-mail) em conflito).
+        """
+        updated = 0
+        conflicts = []
+        last_pk = 0
+        while True:
+            batch = list(self.filter(pk__gt=last_pk).order_by('pk')
+                         .only('pk', 'email')[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            changed = [user for user in batch
+                       if user.email != normalize_email(user.email)]
+            if not changed:
+                continue
+            taken = set(self.with_emails(user.email for user in changed)
+                        .values_list('email', flat=True))
+            normalized = []
+            for user in changed:
+                email = normalize_email(user.email)
+                if email in taken:
+                    conflicts.append((user.pk, user.email))
+                    continue
+                taken.add(email)
+                user.email = email
+                normalized.append(user)
+            self.bulk_update(normalized, ['email'])
+            invalidate_users([user.pk for user in normalized])
+            updated += len(normalized)
+        if updated:
+            # bulk_update não dispara post_save
+            bump_users_version()
+        return updated, conflicts
+
 
 class User(AbstractUser):
     email = models.EmailField(unique=True, verbose_name='E-mail')
     phone = models.CharField(max_length=20, blank=True, null=True, verbose_name='Telefone')
     is_2fa_enabled = models.BooleanField(default=False, verbose_name='2FA Habilitado')
-    otp_secret = models.CharField(max_length=32, blank=True, null=True, verbose_name='Segredo OTP')
+    otp_secret = models.CharField(max_length=64, blank=True, null=True, verbose_name='Segredo OTP')
+    otp_last_timestep = models.PositiveIntegerField(blank=True, null=True, verbose_name='Último passo TOTP usado')
+    otp_backup_codes = models.TextField(blank=True, default='', verbose_name='Códigos de backup')
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username']
 
+    objects = UserManager()
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Paginação por cursor em user_list_view
+            models.Index(fields=['-date_joined', '-id'],
+                         name='user_joined_idx'),
+            models.Index(fields=['is_active', '-date_joined', '-id'],
+                         name='user_active_joined_idx'),
+            models.Index(fields=['is_staff', '-date_joined', '-id'],
+                         name='user_staff_joined_idx'),
+            models.Index(fields=['is_2fa_enabled', '-date_joined', '-id'],
+                         name='user_2fa_joined_idx'),
+            # Busca por prefixo de nome, sem diferenciar maiúsculas
+            # (ver UserFilterForm.filter_queryset)
+            PrefixIndex(Upper('first_name'), Upper('last_name'),
+                        name='user_name_upper_idx'),
+            PrefixIndex(Upper('last_name'), name='user_last_name_upper_idx'),
+        ]
+        constraints = [
+            # Garante a unicidade sem diferenciar maiúsculas mesmo para
+            # gravações que não passem por normalize_email()
+            models.UniqueConstraint(Lower('email'),
+                                    name='user_email_ci_unique'),
+        ]
+
     def __str__(self):
         return self.email
 
+    def save(self, *args, **kwargs):
+        self.email = normalize_email(self.email)
+        super().save(*args, **kwargs)
+
+    # (hash, hashes das chaves antigas) vindos de accounts.user_cache, que
+    # não guarda o hash da senha
+    session_auth_hashes = None
+
+    def get_session_auth_hash(self):
+        if self.session_auth_hashes is not None:
+            return self.session_auth_hashes[0]
+        return super().get_session_auth_hash()
+
+    def get_session_auth_fallback_hash(self):
+        if self.session_auth_hashes is not None:
+            yield from self.session_auth_hashes[1]
+            return
+        yield from super().get_session_auth_fallback_hash()
+
+    def set_password(self, raw_password):
+        super().set_password(raw_password)
+        self.session_auth_hashes = None
+        if self.pk is not None:
+            invalidate_credentials(self.pk)
+
     def generate_otp_secret(self):
         """Gera um novo segredo OTP"""
         if not self.otp_secret:
             self.otp_secret = pyotp.random_base32()
-            self.save()
+            self.save(update_fields=['otp_secret'])
         return self.otp_secret
 
     def get_totp_uri(self):
@@ -35,36 +181,186 @@ class User(AbstractUser):
         )
 
     def verify_totp(self, token):
-        """Verifica token TOTP"""
-        totp = pyotp.TOTP(self.otp_secret)
-        return totp.verify(token, valid_window=1)
+        """Verifica token TOTP (cada código só pode ser usado uma vez)"""
+        return otp.verify_totp(self, token)
 
-    def get_qr_code(self):
+    def get_qr_code(self, image_format='png'):
         """Gera QR Code em base64"""
-        qr = qrcode.QRCode(version=1, box_size=10, border=5)
-        qr.add_data(self.get_totp_uri())
-        qr.make(fit=True)
-        img = qr.make_image(fill_color="black", back_color="white")
+        image = render_qr(self.get_totp_uri(), image_format)
+        img_str = base64.b64encode(image).decode()
+        return f"data:{QR_CONTENT_TYPES[image_format]};base64,{img_str}"
+
+    def get_qr_code_version(self, image_format=None):
+        """Identifica a imagem atual do QR Code (muda junto com o segredo)"""
+        return qr_key(self.get_totp_uri(),
+                      image_format or settings.QR_CODE_FORMAT)
+
+
+def reset_token_lifetime():
+    """Validade dos tokens de redefinição (PASSWORD_RESET_TIMEOUT)"""
+    return timedelta(seconds=settings.PASSWORD_RESET_TIMEOUT)
+
+
+def hash_reset_token(token):
+    """Chave de busca do token; o valor original nunca é gravado"""
+    return hashlib.sha256(token.encode()).hexdigest()
 
-        buffer = BytesIO()
-        img.save(buffer, format='PNG')
-        buffer.seek(0)
-        img_str = base64.b64encode(buffer.getvalue()).decode()
-        return f"data:image/png;base64,{img_str}"
+
+class PasswordResetTokenManager(models.Manager):
+    def issue(self, user):
+        """Cria um token para o usuário, invalidando os anteriores"""
+        token = secrets.token_urlsafe(32)
+        with transaction.atomic():
+            self.filter(user=user, is_used=False).update(is_used=True)
+            self.create(user=user, token_hash=hash_reset_token(token))
+        return token
+
+    def get_valid(self, token):
+        """Retorna o token ainda válido (com o usuário) ou None"""
+        return self.select_related('user').filter(
+            token_hash=hash_reset_token(token),
+            is_used=False,
+            created_at__gte=timezone.now() - reset_token_lifetime(),
+        ).first()
+
+    def expired(self):
+        cutoff = timezone.now() - reset_token_lifetime()
+        return self.filter(created_at__lt=cutoff)
 
 
 class PasswordResetToken(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='Usuário')
-    token = models.CharField(max_length=100, unique=True, verbose_name='Token')
+    token_hash = models.CharField(max_length=64, unique=True, verbose_name='Hash do token')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Criado em')
     is_used = models.BooleanField(default=False, verbose_name='Usado')
-    
+
+    objects = PasswordResetTokenManager()
+
     class Meta:
         verbose_name = 'Token de Redefinição de Senha'
         verbose_name_plural = 'Tokens de Redefinição de Senha'
+        indexes = [
+            # Invalidação dos tokens anteriores do usuário em issue()
+            models.Index(fields=['user', 'is_used'],
+                         name='reset_token_user_idx'),
+            # Remoção em lotes dos tokens expirados
+            models.Index(fields=['created_at'],
+                         name='reset_token_created_idx'),
+        ]
 
     def is_valid(self):
-        """Verifica se token ainda é válido (24 horas)"""
+        """Verifica se token ainda é válido (PASSWORD_RESET_TIMEOUT)"""
         return not self.is_used and \
-            (timezone.now() - self.created_at) < timedelta(hours=24)
+            (timezone.now() - self.created_at) < reset_token_lifetime()
+
+    def mark_used(self):
+        """Marca o token como usado; retorna False se já tinha sido usado"""
+        updated = PasswordResetToken.objects.filter(
+            pk=self.pk, is_used=False
+        ).update(is_used=True)
+        self.is_used = True
+        return bool(updated)
 
+
+class OutboundEmail(models.Model):
+    """E-mail aguardando envio pelo comando send_queued_mail"""
+    STATUS_PENDING = 'pending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pendente'),
+        (STATUS_SENT, 'Enviado'),
+        (STATUS_FAILED, 'Falhou'),
+    ]
+
+    subject = models.CharField(max_length=255, verbose_name='Assunto')
+    body = models.TextField(verbose_name='Mensagem')
+    from_email = models.CharField(max_length=254, verbose_name='Remetente')
+    to = models.JSONField(verbose_name='Destinatários')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES,
+                              default=STATUS_PENDING, verbose_name='Status')
+    attempts = models.PositiveSmallIntegerField(default=0,
+                                                verbose_name='Tentativas')
+    next_attempt_at = models.DateTimeField(default=timezone.now,
+                                           verbose_name='Próxima tentativa')
+    last_error = models.TextField(blank=True, verbose_name='Último erro')
+    created_at = models.DateTimeField(auto_now_add=True,
+                                      verbose_name='Criado em')
+    sent_at = models.DateTimeField(blank=True, null=True,
+                                   verbose_name='Enviado em')
+
+    class Meta:
+        verbose_name = 'E-mail na Fila'
+        verbose_name_plural = 'E-mails na Fila'
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'],
+                         name='outbound_email_due_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.subject} -> {", ".join(self.to)}'
+
+
+class AuthEventQuerySet(models.QuerySet):
+    def for_user(self, user):
+        """Eventos do usuário (ou id), do mais recente ao mais antigo"""
+        user_id = getattr(user, 'pk', user)
+        return self.filter(user_id=user_id).order_by('-created_at', '-id')
+
+    def before_partition(self, partition):
+        return self.filter(partition__lt=partition)
+
+
+def event_partition(moment):
+    """Partição (AAAAMM) de um instante"""
+    return moment.year * 100 + moment.month
+
+
+class AuthEvent(models.Model):
+    """
+    Evento de autenticação (accounts.audit). Só recebe INSERTs em lote;
+    `partition` agrupa os eventos por mês para que a retenção remova meses
+    inteiros pelo índice.
+    """
+    LOGIN_SUCCEEDED = 'login_succeeded'
+    LOGIN_FAILED = 'login_failed'
+    LOGOUT = 'logout'
+    TWO_FACTOR_FAILED = '2fa_failed'
+    TWO_FACTOR_ENABLED = '2fa_enabled'
+    TWO_FACTOR_DISABLED = '2fa_disabled'
+    PASSWORD_RESET_REQUESTED = 'password_reset_requested'
+    PASSWORD_RESET_COMPLETED = 'password_reset_completed'
+    EVENT_CHOICES = [
+        (LOGIN_SUCCEEDED, 'Login'),
+        (LOGIN_FAILED, 'Falha de login'),
+        (LOGOUT, 'Logout'),
+        (TWO_FACTOR_FAILED, 'Código 2FA inválido'),
+        (TWO_FACTOR_ENABLED, '2FA ativado'),
+        (TWO_FACTOR_DISABLED, '2FA desativado'),
+        (PASSWORD_RESET_REQUESTED, 'Redefinição de senha solicitada'),
+        (PASSWORD_RESET_COMPLETED, 'Senha redefinida'),
+    ]
+
+    partition = models.PositiveIntegerField(verbose_name='Partição (AAAAMM)')
+    created_at = models.DateTimeField(verbose_name='Data')
+    event = models.CharField(max_length=32, choices=EVENT_CHOICES,
+                             verbose_name='Evento')
+    # Sem chave estrangeira: o histórico sobrevive à exclusão do usuário e
+    # as exclusões de usuários não precisam tocar esta tabela
+    user_id = models.BigIntegerField(blank=True, null=True,
+                                     verbose_name='Usuário')
+    email = models.CharField(max_length=254, blank=True, verbose_name='E-mail')
+    ip = models.GenericIPAddressField(blank=True, null=True, verbose_name='IP')
+
+    objects = AuthEventQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Evento de Autenticação'
+        verbose_name_plural = 'Eventos de Autenticação'
+        indexes = [
+            # Histórico por usuário (AuthEvent.objects.for_user)
+            models.Index(fields=['user_id', '-created_at'],
+                         name='auth_event_user_idx'),
+            # Retenção por partição (prune_auth_events)
+            models.Index(fields=['partition'], name='auth_event_partition_idx'),
+        ]
@@ -0,0 +1,252 @@
+"""
+Camada de dispositivos de 2FA e verificação de códigos TOTP.
+
+Há uma única implementação de 2FA: os dados ficam na própria linha do
+usuário (otp_secret, otp_last_timestep, is_2fa_enabled), já carregada pela
+autenticação, e cada tipo de dispositivo em DEVICE_CLASSES sabe verificar
+seus códigos a partir dela.
+
+O último passo de tempo aceito de cada usuário fica em
+User.otp_last_timestep (e em cache), então um código só vale uma vez mesmo
+dentro da janela de tolerância. Os segredos base32 decodificados ficam em um
+LRU para não decodificá-los a cada verificação.
+"""
+import base64
+import hmac
+import struct
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q, Value
+from django.db.models.functions import Replace
+from django.utils.crypto import get_random_string, salted_hmac
+
+from .cache import LRUCache
+from .metrics import timed
+from .user_cache import invalidate_user
+
+DIGITS = 6
+INTERVAL = 30
+VALID_WINDOW = 1
+# Depois disso o código já saiu da janela e o cache não é mais necessário
+CACHE_TIMEOUT = INTERVAL * (VALID_WINDOW + 2)
+
+BACKUP_CODE_SALT = 'accounts.otp.backup_codes'
+
+_secret_bytes = LRUCache(max_entries=4096)
+
+
+def secret_bytes(secret):
+    """Decodifica o segredo base32, reaproveitando decodificações recentes"""
+    key = _secret_bytes.get(secret)
+    if key is None:
+        padded = secret.upper() + '=' * (-len(secret) % 8)
+        key = base64.b32decode(padded)
+        _secret_bytes.set(secret, key)
+    return key
+
+
+def hotp(key, counter):
+    digest = hmac.digest(key, struct.pack('>Q', counter), 'sha1')
+    offset = digest[-1] & 0x0F
+    code = struct.unpack('>I', digest[offset:offset + 4])[0] & 0x7FFFFFFF
+    return str(code % 10 ** DIGITS).zfill(DIGITS)
+
+
+def current_timestep(now=None):
+    return int((time.time() if now is None else now) // INTERVAL)
+
+
+def match_timestep(secret, token, now=None):
+    """Passo de tempo em que o token é válido, ou None"""
+    if not secret or not token or len(token) != DIGITS:
+        return None
+    key = secret_bytes(secret)
+    timestep = current_timestep(now)
+    for candidate in range(timestep - VALID_WINDOW,
+                           timestep + VALID_WINDOW + 1):
+        if hmac.compare_digest(hotp(key, candidate), token):
+            return candidate
+    return None
+
+
+def _cache_key(user_id):
+    return f'otp-last-timestep:{user_id}'
+
+
+def _consume(user, timestep, cached):
+    """
+    Registra o passo de tempo como usado. O UPDATE condicional garante que
+    duas requisições simultâneas com o mesmo código não passem ambas.
+    """
+    last_used = max((value for value in (cached, user.otp_last_timestep)
+                     if value is not None), default=None)
+    if last_used is not None and timestep <= last_used:
+        return False
+
+    updated = type(user).objects.filter(
+        Q(otp_last_timestep__isnull=True) | Q(otp_last_timestep__lt=timestep),
+        pk=user.pk,
+    ).update(otp_last_timestep=timestep)
+    if not updated:
+        return False
+    user.otp_last_timestep = timestep
+    invalidate_user(user.pk)
+    return True
+
+
+@timed('verify_totp')
+def verify_totp(user, token, now=None):
+    """Verifica o token do usuário e impede que seja usado novamente"""
+    timestep = match_timestep(user.otp_secret, token, now)
+    if timestep is None:
+        return False
+    if not _consume(user, timestep, cache.get(_cache_key(user.pk))):
+        return False
+    cache.set(_cache_key(user.pk), timestep, CACHE_TIMEOUT)
+    return True
+
+
+def verify_totp_batch(pairs, now=None):
+    """
+    Verifica vários pares (usuário, token) de uma vez. Retorna uma lista de
+    booleanos na mesma ordem. Os cálculos de HMAC são feitos antes de abrir
+    a transação, que só contém os UPDATEs dos tokens válidos.
+    """
+    now = time.time() if now is None else now
+    timesteps = [match_timestep(user.otp_secret, token, now)
+                 for user, token in pairs]
+    results = [False] * len(pairs)
+    cached = cache.get_many([_cache_key(user.pk) for user, _ in pairs])
+    consumed = {}
+    with transaction.atomic():
+        for index, ((user, _), timestep) in enumerate(zip(pairs, timesteps)):
+            if timestep is None:
+                continue
+            key = _cache_key(user.pk)
+            last_used = consumed.get(key, cached.get(key))
+            if _consume(user, timestep, last_used):
+                results[index] = True
+                consumed[key] = timestep
+    cache.set_many(consumed, CACHE_TIMEOUT)
+    return results
+
+
+class TOTPDevice:
+    """Aplicativo autenticador (Google Authenticator, Authy etc.)"""
+    name = 'totp'
+
+    def __init__(self, user):
+        self.user = user
+
+    def is_configured(self):
+        return bool(self.user.is_2fa_enabled and self.user.otp_secret)
+
+    def verify(self, token):
+        return verify_totp(self.user, token)
+
+
+BACKUP_CODE_COUNT = 10
+BACKUP_CODE_ALPHABET = 'abcdefghjkmnpqrstuvwxyz23456789'
+BACKUP_CODE_LENGTH = 10
+
+
+def normalize_backup_code(code):
+    return code.replace('-', '').replace(' ', '').lower()
+
+
+def backup_code_digest(user, code):
+    """
+    HMAC do código (chaveado pelo SECRET_KEY e pelo id do usuário). Os
+    códigos são aleatórios, então um hash rápido basta: verificar não
+    exige uma execução do KDF por código.
+    """
+    value = f'{user.pk}:{normalize_backup_code(code)}'
+    return salted_hmac(BACKUP_CODE_SALT, value,
+                       algorithm='sha256').hexdigest()[:16]
+
+
+def generate_backup_codes(user, count=BACKUP_CODE_COUNT):
+    """
+    Gera novos códigos de backup, substituindo os anteriores, e retorna os
+    códigos em texto para serem exibidos uma única vez.
+    """
+    codes = [get_random_string(BACKUP_CODE_LENGTH, BACKUP_CODE_ALPHABET)
+             for _ in range(count)]
+    # Formato compacto: ',d1,d2,...,' (ver consume_backup_code)
+    stored = ',' + ''.join(
+        backup_code_digest(user, code) + ',' for code in codes
+    )
+    user.__class__.objects.filter(pk=user.pk).update(otp_backup_codes=stored)
+    user.otp_backup_codes = stored
+    invalidate_user(user.pk)
+    half = BACKUP_CODE_LENGTH // 2
+    return [f'{code[:half]}-{code[half:]}' for code in codes]
+
+
+def consume_backup_code(user, code):
+    """
+    Usa o código com um único UPDATE condicional: a linha só é alterada se
+    o hash ainda estiver na lista, e o hash é removido no mesmo comando.
+    O custo não depende de quantos códigos o usuário tem.
+    """
+    needle = f',{backup_code_digest(user, code)},'
+    updated = user.__class__.objects.filter(
+        pk=user.pk, otp_backup_codes__contains=needle
+    ).update(otp_backup_codes=Replace(
+        'otp_backup_codes', Value(needle), Value(',')
+    ))
+    if not updated:
+        return False
+    user.otp_backup_codes = (user.otp_backup_codes or '').replace(needle, ',')
+    invalidate_user(user.pk)
+    return True
+
+
+def backup_codes_remaining(user):
+    return len([digest for digest in (user.otp_backup_codes or '').split(',')
+                if digest])
+
+
+class BackupCodeDevice:
+    """Códigos de uso único para quando o autenticador não está disponível"""
+    name = 'backup'
+
+    def __init__(self, user):
+        self.user = user
+
+    def is_configured(self):
+        return bool(self.user.is_2fa_enabled and
+                    backup_codes_remaining(self.user))
+
+    def verify(self, token):
+        return consume_backup_code(self.user, token)
+
+
+DEVICE_CLASSES = {
+    device_class.name: device_class
+    for device_class in (TOTPDevice, BackupCodeDevice)
+}
+
+# Chave da sessão com o nome do dispositivo usado no login
+DEVICE_SESSION_KEY = 'otp_device'
+
+
+def get_device(user, name):
+    device_class = DEVICE_CLASSES.get(name)
+    return device_class(user) if device_class is not None else None
+
+
+def devices_for(user):
+    """Dispositivos de 2FA configurados para o usuário"""
+    devices = (device_class(user) for device_class in DEVICE_CLASSES.values())
+    return [device for device in devices if device.is_configured()]
+
+
+def verify_token(user, token):
+    """Verifica o token em cada dispositivo; retorna o que o aceitou"""
+    for device in devices_for(user):
+        if device.verify(token):
+            return device
+    return None
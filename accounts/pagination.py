@@ -0,0 +1,80 @@
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(date_joined, pk):
+    """Codifica a posição (date_joined, id) em um cursor opaco"""
+    raw = f'{date_joined.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decodifica um cursor gerado por encode_cursor"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        date_joined, pk = raw.split('|')
+        return datetime.fromisoformat(date_joined), int(pk)
+    except (ValueError, UnicodeDecodeError) as exc:
+        raise InvalidCursor(cursor) from exc
+
+
+class KeysetPage:
+    """
+    Página de resultados paginada por chave (date_joined, id).
+
+    Ao contrário de OFFSET, o custo de cada página é constante: o banco
+    continua a varredura do índice a partir da última linha vista.
+    """
+
+    def __init__(self, queryset, cursor=None, per_page=50, descending=True):
+        self.per_page = per_page
+        self.descending = descending
+        self.cursor = cursor
+        self.queryset = self._slice(queryset, cursor)
+        self._rows = None
+
+    def _slice(self, queryset, cursor):
+        if self.descending:
+            ordering = ('-date_joined', '-id')
+        else:
+            ordering = ('date_joined', 'id')
+        queryset = queryset.order_by(*ordering)
+        if cursor:
+            date_joined, pk = decode_cursor(cursor)
+            if self.descending:
+                queryset = queryset.filter(
+                    Q(date_joined__lt=date_joined)
+                    | Q(date_joined=date_joined, id__lt=pk)
+                )
+            else:
+                queryset = queryset.filter(
+                    Q(date_joined__gt=date_joined)
+                    | Q(date_joined=date_joined, id__gt=pk)
+                )
+        # Uma linha extra indica se existe próxima página
+        return queryset[:self.per_page + 1]
+
+    @property
+    def rows(self):
+        if self._rows is None:
+            self._rows = list(self.queryset)
+        return self._rows[:self.per_page]
+
+    @property
+    def has_next(self):
+        self.rows
+        return len(self._rows) > self.per_page
+
+    @property
+    def next_cursor(self):
+        if not self.has_next:
+            return None
+        last = self.rows[-1]
+        return encode_cursor(last['date_joined'], last['id'])
@@ -0,0 +1,66 @@
+"""
+Renderização do QR Code de configuração do 2FA com cache.
+
+A chave do cache é um hash da URI de provisionamento, que contém o segredo
+OTP: quando o segredo muda a chave muda junto e a imagem antiga deixa de ser
+usada (e sai do LRU com o tempo). O formato SVG é gerado sem o Pillow.
+"""
+import hashlib
+from io import BytesIO
+
+import qrcode
+import qrcode.image.svg
+from django.conf import settings
+from django.core.cache import caches
+
+from .cache import LRUCache
+from .metrics import timed
+
+CONTENT_TYPES = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+
+_local_cache = LRUCache(max_entries=256)
+
+
+def qr_key(uri, image_format):
+    """Identificador estável da imagem; usado também como ETag"""
+    return hashlib.sha256(f'{image_format}:{uri}'.encode()).hexdigest()
+
+
+def _build(uri, image_format):
+    qr = qrcode.QRCode(version=1, box_size=10, border=5)
+    qr.add_data(uri)
+    qr.make(fit=True)
+    if image_format == 'svg':
+        img = qr.make_image(image_factory=qrcode.image.svg.SvgPathImage)
+        return img.to_string(encoding='unicode').encode()
+    img = qr.make_image(fill_color="black", back_color="white")
+    buffer = BytesIO()
+    img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+@timed('render_qr')
+def render_qr(uri, image_format=None):
+    """Retorna os bytes da imagem do QR Code, usando o cache se possível"""
+    image_format = image_format or settings.QR_CODE_FORMAT
+    if image_format not in CONTENT_TYPES:
+        raise ValueError(f'Formato de QR Code inválido: {image_format}')
+
+    key = qr_key(uri, image_format)
+    image = _local_cache.get(key)
+    if image is not None:
+        return image
+
+    shared = caches[settings.QR_CODE_CACHE_ALIAS] \
+        if settings.QR_CODE_CACHE_ALIAS else None
+    if shared is not None:
+        image = shared.get(f'qr:{key}')
+    if image is None:
+        image = _build(uri, image_format)
+        if shared is not None:
+            shared.set(f'qr:{key}', image, settings.QR_CODE_CACHE_TIMEOUT)
+    _local_cache.set(key, image, settings.QR_CODE_CACHE_TIMEOUT)
+    return image
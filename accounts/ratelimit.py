@@ -0,0 +1,196 @@
+"""
+Limitação de tentativas por janela deslizante.
+
+Cada identificador (IP, e-mail + IP, usuário pré-2FA) tem um contador por janela
+fixa; a janela deslizante é aproximada somando o contador atual com a fração
+ainda válida da janela anterior. Só são feitos incr/get no cache, então uma
+tentativa bloqueada não toca no banco nem no KDF.
+"""
+import hashlib
+import ipaddress
+import threading
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+RATE_PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+# Limites padrão por `escopo:chave`; podem ser sobrescritos em RATELIMITS
+DEFAULT_RATES = {
+    'login:ip': '30/m',
+    # O e-mail é combinado com o IP: um limite só por e-mail permitiria que
+    # qualquer pessoa bloqueasse a conta (ou os e-mails de redefinição) de
+    # outra com algumas requisições
+    'login:email_ip': '5/15m',
+    'verify_2fa:ip': '30/m',
+    'verify_2fa:pre_2fa_user': '5/5m',
+    'password_reset:ip': '10/h',
+    'password_reset:email_ip': '3/h',
+}
+
+
+def parse_rate(rate):
+    """Converte '5/m' em (5, 60) e '5/15m' em (5, 900)"""
+    limit, period = rate.split('/')
+    multiplier = int(period[:-1]) if period[:-1] else 1
+    return int(limit), multiplier * RATE_PERIODS[period[-1]]
+
+
+class CacheStore:
+    """Contadores no framework de cache do Django (compartilhados)"""
+
+    def __init__(self, alias='default'):
+        self.cache = caches[alias]
+
+    def incr(self, key, timeout):
+        if self.cache.add(key, 1, timeout):
+            return 1
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            # A chave expirou entre o add e o incr
+            self.cache.set(key, 1, timeout)
+            return 1
+
+    def get_many(self, keys):
+        return self.cache.get_many(keys)
+
+    def delete_many(self, keys):
+        self.cache.delete_many(keys)
+
+
+class MemoryStore:
+    """Contadores em memória local, para testes e processo único"""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def incr(self, key, timeout):
+        now = time.monotonic()
+        with self._lock:
+            count, expires_at = self._data.get(key, (0, 0))
+            if expires_at < now:
+                count, expires_at = 0, now + timeout
+            self._data[key] = (count + 1, expires_at)
+            return count + 1
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                key: self._data[key][0] for key in keys
+                if key in self._data and self._data[key][1] >= now
+            }
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+
+class SlidingWindowLimiter:
+    def __init__(self, store, limit, period, prefix='rl'):
+        self.store = store
+        self.limit = limit
+        self.period = period
+        self.prefix = prefix
+
+    def _keys(self, identifier, now):
+        window = int(now // self.period)
+        # E-mails podem conter caracteres inválidos para chaves de cache
+        digest = hashlib.sha1(identifier.encode()).hexdigest()
+        return (
+            f'{self.prefix}:{digest}:{window}',
+            f'{self.prefix}:{digest}:{window - 1}',
+        )
+
+    def hit(self, identifier):
+        """
+        Registra uma tentativa. Retorna (permitido, segundos_para_tentar).
+        """
+        now = time.time()
+        current_key, previous_key = self._keys(identifier, now)
+        current = self.store.incr(current_key, self.period * 2)
+        previous = self.store.get_many([previous_key]).get(previous_key, 0)
+        elapsed = (now % self.period) / self.period
+        estimated = previous * (1 - elapsed) + current
+        if estimated <= self.limit:
+            return True, 0
+        return False, int(self.period - now % self.period) + 1
+
+    def reset(self, identifier):
+        self.store.delete_many(self._keys(identifier, time.time()))
+
+
+@lru_cache(maxsize=None)
+def get_store():
+    store_class = import_string(
+        getattr(settings, 'RATELIMIT_STORE', 'accounts.ratelimit.CacheStore')
+    )
+    options = getattr(settings, 'RATELIMIT_STORE_OPTIONS', {})
+    return store_class(**options)
+
+
+def get_limiter(scope, key):
+    """Limitador para `scope:key`, respeitando RATELIMITS nas settings"""
+    name = f'{scope}:{key}'
+    rate = getattr(settings, 'RATELIMITS', {}).get(name, DEFAULT_RATES[name])
+    limit, period = parse_rate(rate)
+    return SlidingWindowLimiter(get_store(), limit, period,
+                                prefix=f'rl:{scope}:{key}')
+
+
+def _valid_ip(value):
+    try:
+        return str(ipaddress.ip_address(value.strip()))
+    except ValueError:
+        return None
+
+
+def client_ip(request):
+    """
+    IP do cliente. Atrás de proxies confiáveis usa o X-Forwarded-For, mas
+    só a entrada acrescentada pelo proxy mais externo: cada proxy adiciona
+    o endereço de quem o chamou ao final, e tudo à esquerda disso veio do
+    próprio cliente e pode ser forjado.
+    """
+    remote_addr = request.META.get('REMOTE_ADDR', '')
+    if getattr(settings, 'RATELIMIT_TRUST_X_FORWARDED_FOR', False):
+        hops = getattr(settings, 'RATELIMIT_TRUSTED_PROXY_COUNT', 1)
+        forwarded = request.META.get('HTTP_X_FORWARDED_FOR', '').split(',')
+        if hops > 0 and len(forwarded) >= hops:
+            ip = _valid_ip(forwarded[-hops])
+            if ip is not None:
+                return ip
+    return remote_addr
+
+
+def request_identifier(request, key):
+    """Extrai o identificador usado para limitar a requisição"""
+    if key == 'ip':
+        return client_ip(request)
+    if key == 'email_ip':
+        email = request.POST.get('email', '').strip().lower()
+        return f'{email}|{client_ip(request)}' if email else ''
+    if key == 'pre_2fa_user':
+        return str(request.session.get('pre_2fa_user_id') or '')
+    raise ValueError(f'Chave de rate limit desconhecida: {key}')
+
+
+def reset(request, scope, key):
+    """Zera o contador (ex.: após um login bem-sucedido)"""
+    identifier = request_identifier(request, key)
+    if identifier:
+        get_limiter(scope, key).reset(identifier)
+
+
+@receiver(setting_changed)
+def reset_store(setting, **kwargs):
+    if setting in ('RATELIMIT_STORE', 'RATELIMIT_STORE_OPTIONS'):
+        get_store.cache_clear()
@@ -0,0 +1,67 @@
+"""
+Apoio à renderização dos templates: versão da lista de usuários para o
+cache de fragmentos e pré-compilação dos templates no loader em cache.
+
+Os fragmentos com dados de usuários ({% cache %} em user_list.html) usam
+users_version() na chave. A versão fica no cache compartilhado
+(USER_CACHE_ALIAS) e é incrementada pelos sinais de User quando uma
+coluna exibida muda, então os fragmentos antigos deixam de ser usados em
+todos os workers sem precisar apagá-los. Sem cache compartilhado cada
+worker teria a sua versão, e o fragmento fica desligado
+(USER_LIST_CACHE_TIMEOUT = 0).
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.template import engines
+
+VERSION_KEY = 'auth-users-version'
+
+# Colunas de User exibidas nos fragmentos em cache (lista e navegação)
+RENDERED_FIELDS = frozenset({
+    'email', 'first_name', 'last_name', 'is_active', 'is_staff',
+    'is_2fa_enabled', 'date_joined',
+})
+
+
+def _cache():
+    return caches[settings.USER_CACHE_ALIAS]
+
+
+def users_version():
+    version = _cache().get(VERSION_KEY)
+    if version is None:
+        version = 1
+        _cache().add(VERSION_KEY, version, None)
+    return version
+
+
+def bump_users_version():
+    try:
+        _cache().incr(VERSION_KEY)
+    except ValueError:
+        # Chave ausente (cache limpo ou expirado): recomeça acima de 1
+        _cache().set(VERSION_KEY, 2, None)
+
+
+def template_settings(request):
+    """
+    Context processor com as settings usadas pelos templates: tempo de vida
+    dos fragmentos em cache e o cookie lido por static/js/csrf.js
+    """
+    return {
+        'FRAGMENT_CACHE_TIMEOUT': settings.TEMPLATE_FRAGMENT_CACHE_TIMEOUT,
+        'USER_LIST_CACHE_TIMEOUT': settings.USER_LIST_CACHE_TIMEOUT,
+        'CSRF_COOKIE_NAME': settings.CSRF_COOKIE_NAME,
+    }
+
+
+def preload_templates(names=None):
+    """
+    Compila os templates no loader em cache antes da primeira requisição.
+    Retorna quantos templates foram carregados.
+    """
+    names = settings.TEMPLATE_PRELOAD if names is None else names
+    engine = engines['django']
+    for name in names:
+        engine.get_template(name)
+    return len(names)
@@ -0,0 +1,110 @@
+"""
+Engine de sessão para o fluxo de autenticação (SESSION_ENGINE).
+
+É o cached_db do Django (grava no cache e no banco, lê do cache) com uma
+diferença: save() não faz nada quando os dados e a expiração não mudaram
+desde o carregamento, mesmo que a sessão tenha sido marcada como
+modificada. Com um cache compartilhado (Redis ou arquivo) as requisições
+autenticadas não consultam a tabela de sessões.
+
+Com SESSION_SAVE_EVERY_REQUEST a sessão é sempre gravada: é o que renova a
+expiração no cache e no banco junto com a do cookie.
+"""
+from django.conf import settings
+from django.contrib.sessions.backends.base import VALID_KEY_CHARS
+from django.contrib.sessions.backends.cached_db import (
+    SessionStore as CachedDBStore,
+)
+from django.utils.crypto import get_random_string
+
+
+class SessionStore(CachedDBStore):
+    cache_key_prefix = 'accounts.sessions'
+
+    def __init__(self, session_key=None):
+        super().__init__(session_key)
+        self._saved_state = None
+
+    def _get_new_session_key(self):
+        # Colisões são detectadas pelo INSERT (CreateError em create());
+        # dispensa o SELECT de existência feito a cada nova sessão
+        return get_random_string(32, VALID_KEY_CHARS)
+
+    async def _aget_new_session_key(self):
+        return self._get_new_session_key()
+
+    def _state(self, data):
+        return self.serializer().dumps(data), data.get('_session_expiry')
+
+    def load(self):
+        data = super().load()
+        if self.session_key is not None:
+            self._saved_state = self._state(data)
+        return data
+
+    async def aload(self):
+        data = await super().aload()
+        if self.session_key is not None:
+            self._saved_state = self._state(data)
+        return data
+
+    def _unchanged(self, must_create):
+        return not must_create and self.session_key is not None and \
+            not settings.SESSION_SAVE_EVERY_REQUEST and \
+            self._saved_state == self._state(self._get_session())
+
+    def save(self, must_create=False):
+        if self._unchanged(must_create):
+            return
+        super().save(must_create)
+        self._saved_state = self._state(self._get_session())
+
+    async def asave(self, must_create=False):
+        if self._unchanged(must_create):
+            return
+        await super().asave(must_create)
+        self._saved_state = self._state(self._get_session())
+
+    def delete(self, session_key=None):
+        if session_key is None:
+            if self.session_key is None:
+                return
+            session_key = self.session_key
+        if session_key == self.session_key:
+            self._saved_state = None
+        self._cache.delete(self.cache_key_prefix + session_key)
+        # DELETE direto, sem o SELECT que o backend db faz antes
+        self.model.objects.filter(session_key=session_key).delete()
+
+    async def adelete(self, session_key=None):
+        if session_key is None:
+            if self.session_key is None:
+                return
+            session_key = self.session_key
+        if session_key == self.session_key:
+            self._saved_state = None
+        await self._cache.adelete(self.cache_key_prefix + session_key)
+        await self.model.objects.filter(session_key=session_key).adelete()
+
+    def cycle_key(self):
+        """
+        Troca a chave sem gravar a sessão agora: a nova chave é criada no
+        save() do SessionMiddleware, junto com os dados do login, em vez de
+        um INSERT seguido de um UPDATE.
+        """
+        data = self._session
+        key = self.session_key
+        self._session_key = None
+        self._session_cache = data
+        self.modified = True
+        if key:
+            self.delete(key)
+
+    async def acycle_key(self):
+        data = await self._aget_session()
+        key = self.session_key
+        self._session_key = None
+        self._session_cache = data
+        self.modified = True
+        if key:
+            await self.adelete(key)
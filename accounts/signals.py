@@ -0,0 +1,42 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import User
+from .rendering import RENDERED_FIELDS, bump_users_version
+from .user_cache import invalidate_user
+
+_muted = ContextVar('accounts_signals_muted', default=False)
+
+
+@contextmanager
+def muted():
+    """
+    Suspende os receptores abaixo. Usado pelas ações em massa
+    (accounts.bulk), que invalidam os caches uma vez por lote.
+    """
+    token = _muted.set(True)
+    try:
+        yield
+    finally:
+        _muted.reset(token)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    if not _muted.get():
+        invalidate_user(instance.pk)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def bump_rendered_users(sender, instance, update_fields=None, **kwargs):
+    if _muted.get():
+        return
+    # O login grava só last_login: não invalida os fragmentos em cache
+    if update_fields and not RENDERED_FIELDS.intersection(update_fields):
+        return
+    bump_users_version()
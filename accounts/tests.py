@@ -1,3 +1,1619 @@
-from django.test import TestCase
+import importlib.util
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import pyotp
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import make_password, verify_password
+from django.contrib.auth.models import AnonymousUser, Permission
+from django.contrib.sessions.models import Session
+from django.core import mail as django_mail
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import (
+    RequestFactory, TestCase, TransactionTestCase, override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from config.urls import build_urlpatterns as project_urlpatterns
+
+from . import async_views, audit, bulk, mail, metrics, otp, qr
+from .benchmarks import compare_results
+from .cache import LRUCache
+from .credential_cache import get_credential_cache
+from .hashers import (
+    Argon2PasswordHasher, HashingPool, HashingPoolSaturated,
+    PooledPBKDF2PasswordHasher, ScryptPasswordHasher, get_hashing_pool,
+    hash_is_outdated, hasher_profile,
+)
+from .middleware import OTPMiddleware
+from .forms import UserFilterForm
+from .models import (
+    AuthEvent, OutboundEmail, PasswordResetToken, User, hash_reset_token,
+)
+from .pagination import InvalidCursor, KeysetPage, decode_cursor, encode_cursor
+from .ratelimit import MemoryStore, SlidingWindowLimiter, client_ip
+from .sessions import SessionStore
+from .tokens import DatabaseResetTokens, SignedResetTokens, get_reset_tokens
+
+# KDF barato nos testes; o custo não muda o comportamento verificado
+FAST_HASHING = override_settings(
+    PASSWORD_HASHER_OPTIONS={'iterations': 1000},
+)
+
+
+def clear_caches():
+    for alias in settings.CACHES:
+        caches[alias].clear()
+
+
+class AccountsTestCase(TestCase):
+    """
+    Começa com os caches vazios (limites de tentativas, códigos TOTP usados,
+    fragmentos) e grava os eventos de auditoria ainda no buffer antes do
+    rollback do teste, para que não passem para o teste seguinte.
+    """
+
+    def setUp(self):
+        clear_caches()
+        self.addCleanup(audit.flush)
+
+
+class KeysetPaginationTests(AccountsTestCase):
+    def setUp(self):
+        super().setUp()
+        joined = timezone.now()
+        # Dois usuários por date_joined: o id desempata
+        self.users = User.objects.bulk_create([
+            User(username=f'page{index}', email=f'page{index}@example.com',
+                 first_name=f'Nome{index}', last_name='Silva',
+                 date_joined=joined - timedelta(days=index // 2))
+            for index in range(7)
+        ])
+
+    def walk(self, per_page, descending=True):
+        pages, cursor = [], None
+        while True:
+            page = KeysetPage(User.objects.values('id', 'date_joined'),
+                              cursor=cursor, per_page=per_page,
+                              descending=descending)
+            pages.append([row['id'] for row in page.rows])
+            cursor = page.next_cursor
+            if cursor is None:
+                return pages
+
+    def test_pages_cover_every_row_once_in_order(self):
+        expected = [user.pk for user in sorted(
+            self.users, key=lambda user: (user.date_joined, user.pk),
+            reverse=True,
+        )]
+        pages = self.walk(per_page=3)
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual(sum(pages, []), expected)
+        self.assertEqual(sum(self.walk(per_page=3, descending=False), []),
+                         expected[::-1])
+
+    def test_each_page_is_one_query(self):
+        page = KeysetPage(User.objects.values('id', 'date_joined'),
+                          per_page=3)
+        with self.assertNumQueries(1):
+            self.assertTrue(page.has_next)
+            self.assertEqual(len(page.rows), 3)
+            page.next_cursor
+
+    def test_cursor_round_trip(self):
+        user = self.users[3]
+        self.assertEqual(decode_cursor(encode_cursor(user.date_joined,
+                                                     user.pk)),
+                         (user.date_joined, user.pk))
+
+    def test_invalid_cursors(self):
+        truncated = encode_cursor(timezone.now(), 1)[:-4]
+        # 'bm90LWEtZGF0ZXwx' é 'not-a-date|1'
+        for cursor in ('garbage', 'Zm9v', truncated, 'bm90LWEtZGF0ZXwx',
+                       '\xff'):
+            with self.subTest(cursor=cursor), \
+                    self.assertRaises(InvalidCursor):
+                decode_cursor(cursor)
+
+    def test_view_redirects_on_invalid_cursor(self):
+        staff = User.objects.create(username='admin',
+                                    email='admin@example.com', is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(reverse('user_list'), {'cursor': 'bad'})
+        self.assertRedirects(response, reverse('user_list'),
+                             fetch_redirect_response=False)
+
+    def test_name_search_is_a_case_insensitive_prefix(self):
+        form = UserFilterForm({'q': 'nome3'})
+        self.assertTrue(form.is_valid())
+        found = form.filter_queryset(User.objects.values_list('username',
+                                                              flat=True))
+        self.assertEqual(list(found), ['page3'])
+        form = UserFilterForm({'q': 'NOME1 sil'})
+        self.assertTrue(form.is_valid())
+        self.assertEqual(list(form.filter_queryset(
+            User.objects.values_list('username', flat=True)
+        )), ['page1'])
+
+
+@FAST_HASHING
+@override_settings(AUTH_CREDENTIAL_CACHE={'ENABLED': True, 'TIMEOUT': 300,
+                                          'MAX_ENTRIES': 100})
+class CredentialCacheTests(AccountsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(
+            username='cached', email='cached@example.com', password='pass-1',
+        )
+        get_credential_cache().local.clear()
+        patcher = mock.patch('accounts.backends.verify_password',
+                             side_effect=verify_password)
+        self.kdf = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def login(self, password):
+        return authenticate(email='cached@example.com', password=password)
+
+    def test_repeated_login_skips_the_kdf(self):
+        self.assertEqual(self.login('pass-1'), self.user)
+        self.assertEqual(self.login('pass-1'), self.user)
+        self.assertEqual(self.kdf.call_count, 1)
+
+    def test_wrong_password_is_not_served_from_cache(self):
+        self.login('pass-1')
+        self.assertIsNone(self.login('pass-2'))
+        self.assertEqual(self.kdf.call_count, 2)
+
+    def test_password_change_invalidates_entry(self):
+        self.login('pass-1')
+        self.user.set_password('pass-2')
+        self.user.save(update_fields=['password'])
+        self.assertIsNone(self.login('pass-1'))
+        self.assertEqual(self.login('pass-2'), self.user)
+        self.assertEqual(self.kdf.call_count, 3)
+
+    def test_entry_does_not_contain_the_password(self):
+        self.login('pass-1')
+        entry = get_credential_cache().local.get(self.user.pk)
+        self.assertNotIn('pass-1', repr(entry))
+
+    @override_settings(AUTH_CREDENTIAL_CACHE={'ENABLED': False})
+    def test_disabled_by_default_setting(self):
+        self.assertIsNone(get_credential_cache())
+        self.login('pass-1')
+        self.login('pass-1')
+        self.assertEqual(self.kdf.call_count, 2)
+
+
+class LRUCacheTests(TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(max_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(len(cache), 2)
+
+    def test_entries_expire(self):
+        cache = LRUCache(timeout=10)
+        cache.set('a', 1)
+        with mock.patch('accounts.cache.time.monotonic',
+                        return_value=time.monotonic() + 11):
+            self.assertIsNone(cache.get('a'))
+
+
+@FAST_HASHING
+class FailedLoginCostTests(AccountsTestCase):
+    """Falhas de login custam uma consulta e um KDF, exista o e-mail ou não"""
+
+    def setUp(self):
+        super().setUp()
+        User.objects.create_user(username='cost', email='cost@example.com',
+                                 password='right-pass')
+
+    def assert_one_query_one_kdf(self, email, password):
+        encode = PooledPBKDF2PasswordHasher.encode
+        with mock.patch.object(PooledPBKDF2PasswordHasher, 'encode',
+                               autospec=True, side_effect=encode) as kdf:
+            with self.assertNumQueries(1):
+                self.assertIsNone(authenticate(email=email,
+                                               password=password))
+        self.assertEqual(kdf.call_count, 1)
+
+    def test_wrong_password(self):
+        self.assert_one_query_one_kdf('cost@example.com', 'wrong-pass')
+
+    def test_unknown_email(self):
+        self.assert_one_query_one_kdf('nobody@example.com', 'wrong-pass')
+
+    def test_email_is_case_insensitive(self):
+        self.assertIsNotNone(authenticate(email=' COST@Example.com',
+                                          password='right-pass'))
+
+
+class SlidingWindowLimiterTests(TestCase):
+    def hit(self, limiter, at):
+        with mock.patch('accounts.ratelimit.time.time', return_value=at):
+            return limiter.hit('203.0.113.7')
+
+    def test_window_slides(self):
+        limiter = SlidingWindowLimiter(MemoryStore(), limit=2, period=60)
+        start = 6000.0  # início de uma janela
+        self.assertEqual(self.hit(limiter, start), (True, 0))
+        self.assertEqual(self.hit(limiter, start + 1), (True, 0))
+        self.assertEqual(self.hit(limiter, start + 2), (False, 59))
+        # Nova janela fixa, mas a anterior ainda pesa 55/60
+        self.assertFalse(self.hit(limiter, start + 65)[0])
+        # Duas janelas depois só a tentativa de start + 65 conta (5/60)
+        self.assertTrue(self.hit(limiter, start + 125)[0])
+
+    def test_identifiers_are_independent(self):
+        limiter = SlidingWindowLimiter(MemoryStore(), limit=1, period=60)
+        self.assertTrue(limiter.hit('a@example.com|203.0.113.7')[0])
+        self.assertFalse(limiter.hit('a@example.com|203.0.113.7')[0])
+        self.assertTrue(limiter.hit('a@example.com|198.51.100.1')[0])
+        limiter.reset('a@example.com|203.0.113.7')
+        self.assertTrue(limiter.hit('a@example.com|203.0.113.7')[0])
+
+
+class ClientIPTests(TestCase):
+    def request(self, forwarded=None):
+        headers = {'REMOTE_ADDR': '10.0.0.2'}
+        if forwarded is not None:
+            headers['HTTP_X_FORWARDED_FOR'] = forwarded
+        return RequestFactory().get('/', **headers)
+
+    def test_header_is_ignored_unless_trusted(self):
+        self.assertEqual(client_ip(self.request('127.0.0.1')), '10.0.0.2')
+
+    @override_settings(RATELIMIT_TRUST_X_FORWARDED_FOR=True)
+    def test_uses_the_entry_added_by_the_trusted_proxy(self):
+        # O cliente enviou '127.0.0.1, 1.2.3.4'; o proxy acrescentou o IP
+        # de onde a conexão veio
+        request = self.request('127.0.0.1, 1.2.3.4, 203.0.113.7')
+        self.assertEqual(client_ip(request), '203.0.113.7')
+        with self.settings(RATELIMIT_TRUSTED_PROXY_COUNT=2):
+            self.assertEqual(client_ip(request), '1.2.3.4')
+
+    @override_settings(RATELIMIT_TRUST_X_FORWARDED_FOR=True)
+    def test_falls_back_to_remote_addr(self):
+        for forwarded in ('', 'not-an-ip', '203.0.113.7, '):
+            with self.subTest(forwarded=forwarded):
+                self.assertEqual(client_ip(self.request(forwarded)),
+                                 '10.0.0.2')
+        with self.settings(RATELIMIT_TRUSTED_PROXY_COUNT=3):
+            self.assertEqual(client_ip(self.request('1.2.3.4, 5.6.7.8')),
+                             '10.0.0.2')
+
+
+@FAST_HASHING
+@override_settings(RATELIMITS={'login:email_ip': '2/m',
+                               'verify_2fa:pre_2fa_user': '2/m'})
+class RateLimitViewTests(AccountsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(
+            username='limited', email='limited@example.com',
+            password='right-pass',
+        )
+
+    def login(self, password='wrong-pass', ip='203.0.113.7'):
+        return self.client.post(reverse('home'), {
+            'email': 'limited@example.com', 'password': password,
+        }, REMOTE_ADDR=ip)
+
+    def test_login_over_the_limit_gets_429(self):
+        for _ in range(2):
+            self.assertEqual(self.login().status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.login('right-pass')
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+    def test_email_limit_is_per_ip(self):
+        for _ in range(3):
+            self.login()
+        self.assertEqual(self.login(ip='198.51.100.1').status_code, 200)
+
+    def test_successful_login_resets_the_email_counter(self):
+        self.login()
+        self.assertEqual(self.login('right-pass').status_code, 302)
+        self.client.logout()
+        for _ in range(2):
+            self.assertEqual(self.login().status_code, 200)
+
+    def test_verify_2fa_is_limited_per_pre_2fa_user(self):
+        self.user.otp_secret = pyotp.random_base32()
+        self.user.is_2fa_enabled = True
+        self.user.save()
+        self.assertRedirects(self.login('right-pass'), reverse('verify_2fa'),
+                             fetch_redirect_response=False)
+        url = reverse('verify_2fa')
+        for ip in ('203.0.113.7', '198.51.100.1'):
+            self.assertEqual(self.client.post(url, {'token': '000000'},
+                                              REMOTE_ADDR=ip).status_code,
+                             200)
+        # Trocar de IP não dá novas tentativas para o mesmo login
+        response = self.client.post(url, {'token': '000000'},
+                                    REMOTE_ADDR='192.0.2.1')
+        self.assertEqual(response.status_code, 429)
+
+    @override_settings(RATELIMIT_ENABLED=False)
+    def test_can_be_disabled(self):
+        for _ in range(4):
+            self.assertEqual(self.login().status_code, 200)
+
+
+@override_settings(MAIL_QUEUE_ENABLED=True, MAIL_QUEUE_MAX_ATTEMPTS=2,
+                   MAIL_QUEUE_RETRY_DELAY=60, MAIL_QUEUE_LEASE=300)
+class MailQueueTests(AccountsTestCase):
+    def queue(self, count=1):
+        for index in range(count):
+            mail.dispatch_mail('Assunto', f'link secreto {index}',
+                               'noreply@example.com', ['to@example.com'])
+
+    def test_dispatch_only_queues(self):
+        self.queue()
+        self.assertEqual(django_mail.outbox, [])
+        email = OutboundEmail.objects.get()
+        self.assertEqual(email.status, OutboundEmail.STATUS_PENDING)
+        self.assertEqual(email.to, ['to@example.com'])
+
+    @override_settings(MAIL_QUEUE_ENABLED=False)
+    def test_dispatch_sends_directly_when_disabled(self):
+        self.queue()
+        self.assertEqual(len(django_mail.outbox), 1)
+        self.assertFalse(OutboundEmail.objects.exists())
+
+    def test_claim_leases_the_batch(self):
+        self.queue(3)
+        batch = mail.claim_batch(2)
+        self.assertEqual(len(batch), 2)
+        # Os reservados ficam para depois; só sobra o terceiro
+        self.assertEqual(len(mail.claim_batch(10)), 1)
+        self.assertEqual(mail.claim_batch(10), [])
+        leased = OutboundEmail.objects.get(pk=batch[0].pk)
+        self.assertGreater(leased.next_attempt_at,
+                           timezone.now() + timedelta(seconds=290))
+        # Lease vencido (worker morreu): os e-mails voltam para a fila
+        OutboundEmail.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(len(mail.claim_batch(10)), 3)
+
+    def test_process_queue_sends_and_clears_the_body(self):
+        self.queue(3)
+        self.assertEqual(mail.process_queue(batch_size=2), (3, 0))
+        bodies = sorted(message.body for message in django_mail.outbox)
+        self.assertEqual(bodies, ['link secreto 0', 'link secreto 1',
+                                  'link secreto 2'])
+        self.assertFalse(OutboundEmail.objects.exclude(
+            status=OutboundEmail.STATUS_SENT, body='',
+        ).exists())
+
+    def test_failures_back_off_then_give_up(self):
+        self.queue()
+        connection = mock.Mock(**{'open.side_effect': OSError('down')})
+        with mock.patch('accounts.mail.get_connection',
+                        return_value=connection):
+            self.assertEqual(mail.process_queue(), (0, 1))
+            email = OutboundEmail.objects.get()
+            self.assertEqual(email.attempts, 1)
+            self.assertEqual(email.status, OutboundEmail.STATUS_PENDING)
+            self.assertEqual(email.last_error, 'down')
+            self.assertGreater(email.next_attempt_at,
+                               timezone.now() + timedelta(seconds=50))
+
+            OutboundEmail.objects.update(next_attempt_at=timezone.now())
+            self.assertEqual(mail.process_queue(), (0, 1))
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutboundEmail.STATUS_FAILED)
+        self.assertEqual(email.body, '')
+        self.assertEqual(django_mail.outbox, [])
+
+    def test_purge_processed_keeps_pending_and_recent(self):
+        self.queue(4)
+        mail.process_queue(batch_size=2)
+        pending = OutboundEmail.objects.create(
+            subject='s', body='b', from_email='f@example.com', to=['t'],
+        )
+        old = timezone.now() - timedelta(days=2)
+        OutboundEmail.objects.update(created_at=old)
+        recent = OutboundEmail.objects.filter(
+            status=OutboundEmail.STATUS_SENT,
+        ).first()
+        OutboundEmail.objects.filter(pk=recent.pk).update(
+            created_at=timezone.now(),
+        )
+        self.assertEqual(mail.purge_processed(retention=86400,
+                                              batch_size=2), 3)
+        self.assertCountEqual(OutboundEmail.objects.values_list('pk',
+                                                                flat=True),
+                              [pending.pk, recent.pk])
+
+
+class QRCodeTests(AccountsTestCase):
+    def setUp(self):
+        super().setUp()
+        qr._local_cache.clear()
+        self.user = User.objects.create(username='qr', email='qr@example.com',
+                                        otp_secret=pyotp.random_base32())
+        self.client.force_login(self.user)
+        self.url = reverse('setup_2fa_qr')
+
+    def test_image_is_private_and_revalidated_with_304(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/svg+xml')
+        self.assertIn('private', response['Cache-Control'])
+        etag = response['ETag']
+        self.assertEqual(etag, f'"{self.user.get_qr_code_version()}"')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_new_secret_changes_the_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        self.user.otp_secret = pyotp.random_base32()
+        self.user.save(update_fields=['otp_secret'])
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_no_image_once_2fa_is_enabled(self):
+        etag = self.client.get(self.url)['ETag']
+        self.user.is_2fa_enabled = True
+        self.user.save(update_fields=['is_2fa_enabled'])
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 404)
+
+    def test_requires_login(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+
+    def test_rendering_is_cached_per_uri(self):
+        uri = self.user.get_totp_uri()
+        with mock.patch('accounts.qr._build', return_value=b'img') as build:
+            self.assertEqual(qr.render_qr(uri, 'png'), b'img')
+            self.assertEqual(qr.render_qr(uri, 'png'), b'img')
+            qr.render_qr(uri + 'x', 'png')
+        self.assertEqual(build.call_count, 2)
+        with self.assertRaises(ValueError):
+            qr.render_qr(uri, 'gif')
+
+
+class TOTPReplayTests(AccountsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.secret = pyotp.random_base32()
+        self.user = User.objects.create(
+            username='totp', email='totp@example.com',
+            otp_secret=self.secret, is_2fa_enabled=True,
+        )
+        self.now = time.time()
+        self.token = pyotp.TOTP(self.secret).at(self.now)
+
+    def test_code_is_accepted_once(self):
+        self.assertTrue(otp.verify_totp(self.user, self.token, self.now))
+        self.assertFalse(otp.verify_totp(self.user, self.token, self.now))
+
+    def test_replay_is_rejected_by_another_worker(self):
+        self.assertTrue(otp.verify_totp(self.user, self.token, self.now))
+        # Outro processo: sem o cache e com a linha lida antes do uso
+        clear_caches()
+        stale = User.objects.get(pk=self.user.pk)
+        stale.otp_last_timestep = None
+        self.assertFalse(otp.verify_totp(stale, self.token, self.now))
+
+    def test_older_code_is_rejected_after_newer_one(self):
+        newer = pyotp.TOTP(self.secret).at(self.now + otp.INTERVAL)
+        self.assertTrue(otp.verify_totp(self.user, newer, self.now))
+        self.assertFalse(otp.verify_totp(self.user, self.token, self.now))
+
+
+@FAST_HASHING
+class ImportExportUsersTests(AccountsTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def import_users(self, path, *args):
+        stdout, stderr = StringIO(), StringIO()
+        call_command('import_users', path, *args, stdout=stdout,
+                     stderr=stderr)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_import_csv_hashes_passwords(self):
+        path = self.write('users.csv', (
+            'username,email,first_name,last_name,password,is_staff\n'
+            'ana,Ana@Example.com,Ana,Silva,senha-ana,sim\n'
+            'bia,bia@example.com,Bia,Souza,,\n'
+        ))
+        stdout, _ = self.import_users(path, '--workers', '1')
+        self.assertIn('2 usuário(s) importado(s), 0 ignorado(s)', stdout)
+        ana = User.objects.get(username='ana')
+        self.assertEqual(ana.email, 'ana@example.com')
+        self.assertTrue(ana.is_staff)
+        self.assertTrue(ana.check_password('senha-ana'))
+        bia = User.objects.get(username='bia')
+        self.assertFalse(bia.has_usable_password())
+
+    def test_invalid_rows_are_skipped(self):
+        User.objects.create(username='taken', email='taken@example.com')
+        rows = [
+            {'username': 'ok', 'email': 'ok@example.com'},
+            {'username': 'x' * 151, 'email': 'long@example.com'},
+            {'username': 'bad name!', 'email': 'chars@example.com'},
+            {'username': 'phone', 'email': 'phone@example.com',
+             'phone': '1' * 21},
+            {'username': 'first', 'email': 'first@example.com',
+             'first_name': 'x' * 151},
+            {'username': 'dup', 'email': 'TAKEN@example.com'},
+            {'username': 'again', 'email': 'ok@example.com'},
+            {'username': 'missing', 'email': 'missing@example.com',
+             'last_name': ''},
+        ]
+        path = self.write('users.jsonl', ''.join(
+            json.dumps({'first_name': 'Nome', 'last_name': 'Sobrenome',
+                        'password': '', **row}) + '\n'
+            for row in rows
+        ))
+        stdout, stderr = self.import_users(path, '--batch-size', '3',
+                                           '--workers', '1')
+        self.assertIn('1 usuário(s) importado(s), 7 ignorado(s)', stdout)
+        for line, field in ((2, 'username'), (3, 'username'), (4, 'phone'),
+                            (5, 'first_name')):
+            self.assertIn(f'Linha {line}: {field}: ', stderr)
+        self.assertIn('Linha 6: ', stderr)
+        self.assertIn('Linha 7: E-mail repetido no arquivo.', stderr)
+        self.assertIn('Linha 8: Campos obrigatórios ausentes: last_name',
+                      stderr)
+        self.assertCountEqual(User.objects.values_list('username', flat=True),
+                              ['taken', 'ok'])
+
+    def round_trip(self, file_format):
+        User.objects.create_user(
+            username='round', email='round@example.com', password='senha-1',
+            first_name='Ida', last_name='Volta', phone='+5511999999999',
+            is_staff=True,
+        )
+        User.objects.create_user(username='trip', email='trip@example.com',
+                                 first_name='Só', last_name='Ida')
+        fields = ('username', 'email', 'first_name', 'last_name', 'phone',
+                  'is_active', 'is_staff', 'password')
+        before = list(User.objects.order_by('pk').values_list(*fields))
+
+        path = os.path.join(self.directory, f'users.{file_format}')
+        call_command('export_users', '--output', path, '--format',
+                     file_format, '--include-password-hash',
+                     stderr=StringIO())
+        User.objects.all().delete()
+        stdout, stderr = self.import_users(path, '--prehashed')
+        self.assertIn('2 usuário(s) importado(s), 0 ignorado(s)', stdout)
+        self.assertEqual(stderr, '')
+        self.assertEqual(
+            list(User.objects.order_by('pk').values_list(*fields)), before,
+        )
+        self.assertTrue(User.objects.get(username='round')
+                        .check_password('senha-1'))
+
+    def test_round_trip_jsonl(self):
+        self.round_trip('jsonl')
+
+    def test_round_trip_csv(self):
+        self.round_trip('csv')
+
+    def test_prehashed_rejects_unknown_hashes(self):
+        path = self.write('users.csv', (
+            'username,email,first_name,last_name,password\n'
+            'plain,plain@example.com,Plain,Text,senha-em-texto\n'
+        ))
+        stdout, stderr = self.import_users(path, '--prehashed')
+        self.assertIn('0 usuário(s) importado(s), 1 ignorado(s)', stdout)
+        self.assertIn('Hash de senha não reconhecido.', stderr)
+
+
+@FAST_HASHING
+class DatabaseResetTokenTests(AccountsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(
+            username='reset', email='reset@example.com', password='old-pass',
+        )
+        self.tokens = DatabaseResetTokens()
+
+    def test_token_is_stored_hashed(self):
+        token = self.tokens.make_token(self.user)
+        stored = PasswordResetToken.objects.get(user=self.user)
+        self.assertEqual(stored.token_hash, hash_reset_token(token))
+        self.assertFalse(PasswordResetToken.objects.filter(
+            token_hash=token
+        ).exists())
+
+    def test_token_is_single_use(self):
+        token = self.tokens.make_token(self.user)
+        grant = self.tokens.resolve(token)
+        self.assertEqual(grant.user, self.user)
+        self.assertTrue(grant.consume())
+        self.assertIsNone(self.tokens.resolve(token))
+
+    def test_new_token_invalidates_previous(self):
+        first = self.tokens.make_token(self.user)
+        self.tokens.make_token(self.user)
+        self.assertIsNone(self.tokens.resolve(first))
+
+    def test_expired_token_is_rejected(self):
+        token = self.tokens.make_token(self.user)
+        with self.settings(PASSWORD_RESET_TIMEOUT=0):
+            self.assertIsNone(self.tokens.resolve(token))
+
+    def test_confirm_view_uses_token_once(self):
+        token = self.tokens.make_token(self.user)
+        url = reverse('password_reset_confirm', args=[token])
+        data = {'password1': 'new-pass-123', 'password2': 'new-pass-123'}
+        self.assertRedirects(self.client.post(url, data), reverse('home'),
+                             fetch_redirect_response=False)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('new-pass-123'))
+        response = self.client.post(url, {**data, 'password1': 'x'})
+        self.assertRedirects(response, reverse('password_reset_request'),
+                             fetch_redirect_response=False)
+
+
+@FAST_HASHING
+@override_settings(PASSWORD_RESET_MODE='signed')
+class SignedResetTokenTests(AccountsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(
+            username='signed', email='signed@example.com',
+            password='old-pass',
+        )
+        self.tokens = SignedResetTokens()
+
+    def test_token_is_stateless(self):
+        with self.assertNumQueries(0):
+            token = self.tokens.make_token(self.user)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.tokens.resolve(token).user, self.user)
+        self.assertFalse(PasswordResetToken.objects.exists())
+
+    def test_password_change_invalidates_token(self):
+        token = self.tokens.make_token(self.user)
+        self.user.set_password('new-pass')
+        self.user.save(update_fields=['password'])
+        self.assertIsNone(self.tokens.resolve(token))
+
+    def test_tampered_token_is_rejected(self):
+        token = self.tokens.make_token(self.user)
+        other = User.objects.create(username='other',
+                                    email='other@example.com')
+        separator = SignedResetTokens.separator
+        signature = token.partition(separator)[2]
+        other_uid = self.tokens.make_token(other).partition(separator)[0]
+        self.assertIsNone(self.tokens.resolve(
+            f'{other_uid}{separator}{signature}'
+        ))
+        self.assertIsNone(self.tokens.resolve('garbage'))
+
+
+class SessionStoreTests(AccountsTestCase):
+    def test_cycle_key_defers_the_new_row_to_save(self):
+        store = SessionStore()
+        store['pre_2fa_user_id'] = 1
+        store.create()
+        old_key = store.session_key
+
+        with CaptureQueriesContext(connection) as captured:
+            store.cycle_key()
+        statements = [query['sql'].split()[0]
+                      for query in captured.captured_queries
+                      if 'django_session' in query['sql']]
+        # Só o DELETE da chave antiga; a nova linha vem com o save()
+        self.assertEqual(statements, ['DELETE'])
+        self.assertFalse(Session.objects.filter(session_key=old_key).exists())
+
+        store['_auth_user_id'] = '1'
+        store.save()
+        self.assertNotEqual(store.session_key, old_key)
+        saved = SessionStore(store.session_key)
+        self.assertEqual(saved['pre_2fa_user_id'], 1)
+        self.assertEqual(saved['_auth_user_id'], '1')
+
+    def test_unchanged_session_is_not_written(self):
+        store = SessionStore()
+        store['key'] = 'value'
+        store.create()
+        loaded = SessionStore(store.session_key)
+        loaded['key'] = 'value'
+        with self.assertNumQueries(0):
+            loaded.save()
+
+    @override_settings(SESSION_SAVE_EVERY_REQUEST=True)
+    def test_save_every_request_renews_the_expiry(self):
+        store = SessionStore()
+        store['key'] = 'value'
+        store.create()
+        stale = timezone.now() + timedelta(minutes=1)
+        Session.objects.filter(session_key=store.session_key).update(
+            expire_date=stale,
+        )
+        loaded = SessionStore(store.session_key)
+        loaded['key']
+        loaded.save()
+        session = Session.objects.get(session_key=store.session_key)
+        self.assertGreater(session.expire_date,
+                           stale + timedelta(seconds=60))
+
+    @FAST_HASHING
+    def test_login_writes_the_session_once(self):
+        User.objects.create_user(username='flow', email='flow@example.com',
+                                 password='flow-pass')
+        self.client.get(reverse('home'))
+        with CaptureQueriesContext(connection) as captured:
+            self.client.post(reverse('home'), {
+                'email': 'flow@example.com', 'password': 'flow-pass',
+            })
+        writes = [query['sql'].split()[0]
+                  for query in captured.captured_queries
+                  if 'django_session' in query['sql']
+                  and not query['sql'].startswith('SELECT')]
+        self.assertEqual(writes.count('INSERT'), 1)
+        self.assertNotIn('UPDATE', writes)
+
+
+class OTPDeviceTests(AccountsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.secret = pyotp.random_base32()
+        self.user = User.objects.create(
+            username='device', email='device@example.com',
+            otp_secret=self.secret, is_2fa_enabled=True,
+        )
+        self.codes = otp.generate_backup_codes(self.user)
+
+    def request(self, user, device=None):
+        request = RequestFactory().get('/')
+        request.session = SessionStore()
+        if device is not None:
+            request.session[otp.DEVICE_SESSION_KEY] = device
+        request.user = user
+
+        async def auser():
+            return user
+        request.auser = auser
+        return request
+
+    def test_middleware_resolves_the_verified_device_without_queries(self):
+        seen = []
+        middleware = OTPMiddleware(lambda request: seen.append(request.user))
+        with self.assertNumQueries(0):
+            middleware(self.request(self.user, device='totp'))
+            self.assertIsInstance(seen[0].otp_device, otp.TOTPDevice)
+            self.assertTrue(seen[0].is_verified())
+
+    def test_middleware_without_device_is_not_verified(self):
+        seen = []
+        middleware = OTPMiddleware(lambda request: seen.append(request.user))
+        middleware(self.request(self.user))
+        middleware(self.request(AnonymousUser(), device='totp'))
+        for user in seen:
+            self.assertIsNone(user.otp_device)
+            self.assertFalse(user.is_verified())
+
+    def test_async_middleware_wraps_auser(self):
+        async def get_response(request):
+            return await request.auser()
+
+        middleware = OTPMiddleware(get_response)
+        user = async_to_sync(middleware)(self.request(self.user,
+                                                      device='backup'))
+        self.assertIsInstance(user.otp_device, otp.BackupCodeDevice)
+        self.assertTrue(user.is_verified())
+
+    def test_verify_token_picks_the_device(self):
+        token = pyotp.TOTP(self.secret).now()
+        self.assertIsInstance(otp.verify_token(self.user, token),
+                              otp.TOTPDevice)
+        self.assertIsInstance(otp.verify_token(self.user, self.codes[0]),
+                              otp.BackupCodeDevice)
+        self.assertIsNone(otp.verify_token(self.user, 'nope'))
+
+    def test_no_devices_while_2fa_is_disabled(self):
+        self.user.is_2fa_enabled = False
+        self.assertEqual(otp.devices_for(self.user), [])
+        self.assertIsNone(otp.verify_token(self.user,
+                                           pyotp.TOTP(self.secret).now()))
+
+    def test_batch_accepts_each_code_once(self):
+        other = User.objects.create(username='other',
+                                    email='other@example.com',
+                                    otp_secret=self.secret,
+                                    is_2fa_enabled=True)
+        now = time.time()
+        token = pyotp.TOTP(self.secret).at(now)
+        results = otp.verify_totp_batch(
+            [(self.user, token), (self.user, token), (other, token),
+             (other, '000000' if token != '000000' else '111111')],
+            now=now,
+        )
+        self.assertEqual(results, [True, False, True, False])
+
+    def test_verified_login_records_the_device(self):
+        session = self.client.session
+        session['pre_2fa_user_id'] = self.user.pk
+        session.save()
+        self.client.post(reverse('verify_2fa'), {'token': self.codes[1]})
+        self.assertEqual(self.client.session[otp.DEVICE_SESSION_KEY],
+                         otp.BackupCodeDevice.name)
+
+
+class BackupCodeTests(AccountsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(username='backup',
+                                        email='backup@example.com',
+                                        is_2fa_enabled=True)
+        self.codes = otp.generate_backup_codes(self.user)
+
+    def test_only_digests_are_stored(self):
+        stored = User.objects.get(pk=self.user.pk).otp_backup_codes
+        for code in self.codes:
+            self.assertNotIn(otp.normalize_backup_code(code), stored)
+
+    def test_code_is_single_use(self):
+        code = self.codes[0]
+        self.assertTrue(otp.consume_backup_code(self.user, code))
+        self.assertFalse(otp.consume_backup_code(self.user, code))
+        fresh = User.objects.get(pk=self.user.pk)
+        self.assertFalse(otp.consume_backup_code(fresh, code))
+        self.assertEqual(otp.backup_codes_remaining(fresh),
+                         otp.BACKUP_CODE_COUNT - 1)
+
+    def test_consume_is_one_query(self):
+        with self.assertNumQueries(1):
+            self.assertTrue(otp.consume_backup_code(
+                self.user, self.codes[1].upper().replace('-', ' ')
+            ))
+
+    def test_regenerating_invalidates_old_codes(self):
+        otp.generate_backup_codes(self.user)
+        self.assertFalse(otp.consume_backup_code(self.user, self.codes[0]))
+
+
+class AsyncURLConf:
+    """URLs do projeto com ASYNC_AUTH_VIEWS habilitado"""
+    urlpatterns = project_urlpatterns(async_auth_views=True)
+
+
+@FAST_HASHING
+@override_settings(ROOT_URLCONF=AsyncURLConf, MAIL_QUEUE_ENABLED=False)
+class AsyncViewTests(AccountsTestCase):
+    password = 'Async-pass-2026!'
+
+    def setUp(self):
+        super().setUp()
+        self.secret = pyotp.random_base32()
+        self.user = User.objects.create_user(
+            username='async', email='async@example.com',
+            password=self.password,
+        )
+
+    def test_async_views_are_routed(self):
+        for name, view in (('home', async_views.alogin_view),
+                           ('verify_2fa', async_views.averify_2fa_view),
+                           ('logout', async_views.alogout_view)):
+            with self.subTest(name=name):
+                self.assertEqual(self.client.get(reverse(name))
+                                 .resolver_match.func, view)
+
+    async def test_login_and_logout(self):
+        response = await self.async_client.post(reverse('home'), {
+            'email': 'ASYNC@example.com', 'password': self.password,
+        })
+        self.assertRedirects(response, reverse(settings.LOGIN_REDIRECT_URL),
+                             fetch_redirect_response=False)
+        session = await self.async_client.asession()
+        self.assertEqual(await session.aget('_auth_user_id'),
+                         str(self.user.pk))
+        response = await self.async_client.get(reverse('logout'))
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(await Session.objects.aexists())
+
+    async def test_failed_login(self):
+        response = await self.async_client.post(reverse('home'), {
+            'email': 'async@example.com', 'password': 'wrong',
+        })
+        self.assertContains(response, 'E-mail ou senha inválidos')
+        session = await self.async_client.asession()
+        self.assertIsNone(await session.aget('_auth_user_id'))
+
+    async def test_login_with_2fa(self):
+        await User.objects.filter(pk=self.user.pk).aupdate(
+            otp_secret=self.secret, is_2fa_enabled=True,
+        )
+        response = await self.async_client.post(reverse('home'), {
+            'email': 'async@example.com', 'password': self.password,
+        })
+        self.assertRedirects(response, reverse('verify_2fa'),
+                             fetch_redirect_response=False)
+        response = await self.async_client.post(reverse('verify_2fa'),
+                                                {'token': '0000000'})
+        self.assertEqual(response.status_code, 200)
+        response = await self.async_client.post(
+            reverse('verify_2fa'), {'token': pyotp.TOTP(self.secret).now()},
+        )
+        self.assertRedirects(response, reverse('dashboard'),
+                             fetch_redirect_response=False)
+        session = await self.async_client.asession()
+        self.assertEqual(await session.aget(otp.DEVICE_SESSION_KEY),
+                         otp.TOTPDevice.name)
+        self.assertIsNone(await session.aget('pre_2fa_user_id'))
+
+    async def test_password_reset_request_sends_mail(self):
+        response = await self.async_client.post(
+            reverse('password_reset_request'),
+            {'email': 'async@example.com'},
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(django_mail.outbox), 1)
+        self.assertTrue(await PasswordResetToken.objects.filter(
+            user=self.user,
+        ).aexists())
+
+    @override_settings(RATELIMITS={'login:email_ip': '1/m'})
+    async def test_rate_limit_applies(self):
+        data = {'email': 'async@example.com', 'password': 'wrong'}
+        await self.async_client.post(reverse('home'), data)
+        response = await self.async_client.post(reverse('home'), data)
+        self.assertEqual(response.status_code, 429)
+
+
+class HashingPoolTests(TestCase):
+    def thread_pool(self, **options):
+        # Threads no lugar de processos: o teste é sobre as vagas do pool
+        pool = HashingPool(**options)
+        executor = ThreadPoolExecutor(max_workers=pool.workers)
+        self.addCleanup(executor.shutdown)
+        pool._get_executor = lambda: executor
+        return pool
+
+    def occupy(self, pool, slots):
+        """Ocupa `slots` vagas até o evento retornado ser disparado"""
+        release = threading.Event()
+        for _ in range(slots):
+            busy = threading.Thread(target=pool.run, args=(release.wait,))
+            busy.start()
+            self.addCleanup(busy.join)
+        self.addCleanup(release.set)
+        limit = pool.workers + pool.max_pending
+        while pool._slots._value > limit - slots:
+            time.sleep(0.001)
+        return release
+
+    def test_saturated_pool_fails_fast(self):
+        pool = self.thread_pool(workers=1, max_pending=0)
+        release = self.occupy(pool, 1)
+        start = time.monotonic()
+        with self.assertRaises(HashingPoolSaturated):
+            pool.run(sum, [1, 2])
+        self.assertLess(time.monotonic() - start, 0.5)
+        release.set()
+        while pool._slots._value < pool.workers + pool.max_pending:
+            time.sleep(0.001)
+        self.assertEqual(pool.run(sum, [1, 2]), 3)
+
+    def test_pending_calls_wait_for_a_slot(self):
+        pool = self.thread_pool(workers=1, max_pending=1)
+        release = self.occupy(pool, 1)
+        # Uma vaga de espera: a segunda chamada entra na fila
+        waiting = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(waiting.shutdown)
+        queued = waiting.submit(pool.run, sum, [1, 2])
+        release.set()
+        self.assertEqual(queued.result(timeout=5), 3)
+
+    @override_settings(PASSWORD_HASHER_OPTIONS={'iterations': 1000})
+    def test_pooled_hashes_match_in_process_hashes(self):
+        # Pool de processos real (spawn), como em produção
+        with self.settings(PASSWORD_HASHING_POOL={'ENABLED': True,
+                                                  'WORKERS': 1}):
+            pool = get_hashing_pool()
+            self.addCleanup(pool.shutdown)
+            pbkdf2 = PooledPBKDF2PasswordHasher().encode('senha', 'salt1234')
+            scrypt_hasher = ScryptPasswordHasher()
+            scrypt_hasher.work_factor = 2 ** 10
+            scrypt = scrypt_hasher.encode('senha', 'salt1234')
+            self.assertTrue(scrypt_hasher.verify('senha', scrypt))
+            self.assertFalse(scrypt_hasher.verify('outra', scrypt))
+            self.assertNotEqual(pool.run(os.getpid), os.getpid())
+        self.assertEqual(
+            PooledPBKDF2PasswordHasher().encode('senha', 'salt1234'), pbkdf2,
+        )
+        self.assertEqual(scrypt_hasher.encode('senha', 'salt1234'), scrypt)
+
+    @skipUnless(importlib.util.find_spec('argon2'), 'requer argon2-cffi')
+    def test_argon2_hashes_and_verifies_in_the_pool(self):
+        hasher = Argon2PasswordHasher()
+        hasher.memory_cost, hasher.parallelism = 1024, 1
+        with self.settings(PASSWORD_HASHING_POOL={'ENABLED': True,
+                                                  'WORKERS': 1}):
+            pool = get_hashing_pool()
+            self.addCleanup(pool.shutdown)
+            with mock.patch.object(pool, 'run', wraps=pool.run) as run:
+                encoded = hasher.encode('senha', 'salt1234salt')
+                self.assertTrue(hasher.verify('senha', encoded))
+                self.assertFalse(hasher.verify('outra', encoded))
+            self.assertEqual(run.call_count, 3)
+        self.assertEqual(hasher.encode('senha', 'salt1234salt'), encoded)
+
+    @FAST_HASHING
+    def test_saturated_login_gets_503(self):
+        User.objects.create_user(username='busy', email='busy@example.com',
+                                 password='senha')
+        pool = HashingPool(workers=1, max_pending=0)
+        pool._slots.acquire()
+        with mock.patch('accounts.hashers.get_hashing_pool',
+                        return_value=pool):
+            response = self.client.post(reverse('home'), {
+                'email': 'busy@example.com', 'password': 'senha',
+            })
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+
+
+@FAST_HASHING
+class HasherProfileTests(AccountsTestCase):
+    def test_options_apply_only_to_the_active_profile(self):
+        self.assertEqual(hasher_profile(), (
+            'accounts.hashers.PooledPBKDF2PasswordHasher',
+            {'iterations': 1000},
+        ))
+        self.assertEqual(hasher_profile('pbkdf2-fast')[1],
+                         {'iterations': 600_000})
+        self.assertEqual(PooledPBKDF2PasswordHasher().iterations, 1000)
+        # Outros hashers mantêm o custo padrão do Django
+        self.assertNotEqual(ScryptPasswordHasher().work_factor, 1000)
+
+    def test_outdated_hashes(self):
+        self.assertFalse(hash_is_outdated(make_password('senha')))
+        with self.settings(PASSWORD_HASHER_OPTIONS={'iterations': 2000}):
+            stronger = make_password('senha')
+        self.assertTrue(hash_is_outdated(stronger))
+        self.assertTrue(hash_is_outdated(make_password('senha',
+                                                       hasher='scrypt')))
+        self.assertFalse(hash_is_outdated('!unusable'))
+
+    def assert_rehashed_on_login(self, encoded):
+        user = User.objects.create(username='old', email='old@example.com',
+                                   password=encoded)
+        self.assertIsNone(authenticate(email='old@example.com',
+                                       password='errada'))
+        user.refresh_from_db()
+        self.assertEqual(user.password, encoded)
+
+        self.assertEqual(authenticate(email='old@example.com',
+                                      password='senha'), user)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$1000$'))
+        self.assertTrue(user.check_password('senha'))
+
+    def test_login_rehashes_with_the_active_cost(self):
+        with self.settings(PASSWORD_HASHER_OPTIONS={'iterations': 2000}):
+            encoded = make_password('senha')
+        self.assert_rehashed_on_login(encoded)
+
+    def test_login_rehashes_other_algorithms(self):
+        self.assert_rehashed_on_login(make_password('senha', hasher='scrypt'))
+
+    def test_calibrate_recommends_options_for_the_target(self):
+        stdout = StringIO()
+        call_command('calibrate_hasher', '--target-ms', '5', '--samples',
+                     '1', stdout=stdout)
+        output = stdout.getvalue()
+        self.assertIn('PASSWORD_HASHER_PROFILE=pbkdf2', output)
+        options = json.loads(
+            output.split("PASSWORD_HASHER_OPTIONS='")[1].split("'")[0]
+        )
+        self.assertEqual(list(options), ['iterations'])
+        self.assertEqual(options['iterations'] % 1000, 0)
+        self.assertGreaterEqual(options['iterations'], 1000)
+
+    def test_calibrate_rejects_unknown_profiles(self):
+        with self.assertRaisesMessage(CommandError, 'Perfil desconhecido'):
+            call_command('calibrate_hasher', '--profile', 'md5')
+
+    @skipUnless(importlib.util.find_spec('argon2') is None,
+                'argon2-cffi instalado')
+    def test_calibrate_reports_missing_library(self):
+        with self.assertRaises(CommandError):
+            call_command('calibrate_hasher', '--profile', 'argon2')
+
+
+class EmailUniquenessTests(AccountsTestCase):
+    def test_unique_ignores_case_even_without_normalization(self):
+        User.objects.create(username='first', email='case@example.com')
+        other = User.objects.create(username='second',
+                                    email='other@example.com')
+        # update() não passa por User.save() nem por normalize_email()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            User.objects.filter(pk=other.pk).update(email='CASE@example.com')
+
+    def test_save_normalizes_email(self):
+        user = User.objects.create(username='mixed',
+                                   email='  Mixed@Example.COM ')
+        self.assertEqual(user.email, 'mixed@example.com')
+        self.assertEqual(User.objects.with_email('MIXED@example.com').get(),
+                         user)
+
+
+class MetricsTests(AccountsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.counter = metrics.Counter('test_events_total', 'Eventos',
+                                       ('result',))
+        self.histogram = metrics.Histogram('test_duration_seconds', 'Tempo',
+                                           buckets=(0.1, 1.0))
+        self.addCleanup(metrics.REGISTRY.pop, self.counter.name)
+        self.addCleanup(metrics.REGISTRY.pop, self.histogram.name)
+
+    def test_render_exposition_format(self):
+        self.counter.inc(result='ok')
+        self.counter.inc(2, result='ok')
+        self.counter.inc(result='a"b')
+        for value in (0.05, 0.5, 3.0):
+            self.histogram.observe(value)
+        text = metrics.render()
+        self.assertIn('# TYPE test_events_total counter\n', text)
+        self.assertIn('test_events_total{result="ok"} 3\n', text)
+        self.assertIn('test_events_total{result="a\\"b"} 1\n', text)
+        self.assertIn('# TYPE test_duration_seconds histogram\n', text)
+        self.assertIn('test_duration_seconds_bucket{le="0.1"} 1\n', text)
+        self.assertIn('test_duration_seconds_bucket{le="1.0"} 2\n', text)
+        self.assertIn('test_duration_seconds_bucket{le="+Inf"} 3\n', text)
+        self.assertIn('test_duration_seconds_sum 3.55\n', text)
+        self.assertIn('test_duration_seconds_count 3\n', text)
+
+    def test_threads_are_summed(self):
+        def work():
+            for _ in range(100):
+                self.counter.inc(result='thread')
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(
+            metrics.collect_local()[(self.counter.name, 'thread')], 400)
+
+    def test_snapshots_of_dead_processes_are_pruned(self):
+        temp = tempfile.TemporaryDirectory()
+        self.addCleanup(temp.cleanup)
+        directory = temp.name
+        # Acima de qualquer pid_max: nenhum processo vivo tem esse pid
+        dead = os.path.join(directory, '999999999-deadbeef.json')
+        with open(dead, 'w') as stream:
+            json.dump([[[self.counter.name, 'snapshot'], 7]], stream)
+        self.counter.inc(result='snapshot')
+        with self.settings(METRICS_MULTIPROC_DIR=directory):
+            totals = metrics.collect()
+            self.assertEqual(totals[(self.counter.name, 'snapshot')], 1)
+            self.assertFalse(os.path.exists(dead))
+            own = metrics._snapshot_path(directory)
+            self.assertTrue(os.path.exists(own))
+            metrics._remove_at_exit()
+            self.assertFalse(os.path.exists(own))
+
+    def test_allowlist(self):
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(
+            self.client.get(url, REMOTE_ADDR='10.0.0.5').status_code, 404)
+        # O cabeçalho só vale atrás de um proxy confiável
+        response = self.client.get(url, REMOTE_ADDR='10.0.0.5',
+                                   HTTP_X_FORWARDED_FOR='127.0.0.1')
+        self.assertEqual(response.status_code, 404)
+        with self.settings(RATELIMIT_TRUST_X_FORWARDED_FOR=True):
+            response = self.client.get(
+                url, REMOTE_ADDR='10.0.0.5',
+                HTTP_X_FORWARDED_FOR='127.0.0.1, 203.0.113.7')
+            self.assertEqual(response.status_code, 404)
+        staff = User.objects.create(username='staff', is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(url, REMOTE_ADDR='10.0.0.5')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_disabled(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code,
+                         404)
+
+
+class CacheablePageTests(AccountsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('register')
+
+    def test_anonymous_page_is_public_and_revalidated_with_304(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('Cookie', response['Vary'])
+        # O token vem de /accounts/csrf/, não do HTML nem do cookie
+        self.assertContains(response, 'value="" data-csrf')
+        self.assertNotIn(settings.CSRF_COOKIE_NAME, response.cookies)
+        response = self.client.get(self.url,
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_authenticated_page_is_not_cached(self):
+        self.client.force_login(User.objects.create(username='member'))
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('ETag'))
+        self.assertNotIn('public', response.get('Cache-Control', ''))
+        self.assertNotContains(response, 'data-csrf')
+
+    @override_settings(CACHEABLE_PAGES=False)
+    def test_disabled(self):
+        response = self.client.get(self.url)
+        self.assertFalse(response.has_header('ETag'))
+        self.assertNotContains(response, 'data-csrf')
+
+    def test_csrf_endpoint_token_is_accepted(self):
+        client = self.client_class(enforce_csrf_checks=True)
+        client.get(self.url)
+        response = client.get(reverse('csrf_token'))
+        self.assertIn('no-cache', response['Cache-Control'])
+        token = response.json()['token']
+        self.assertIn(settings.CSRF_COOKIE_NAME, response.cookies)
+        data = {'email': 'nobody@example.com', 'password': 'wrong'}
+        self.assertEqual(client.post(reverse('home'), data).status_code,
+                         403)
+        data['csrfmiddlewaretoken'] = token
+        self.assertEqual(client.post(reverse('home'), data).status_code,
+                         200)
+
+    def test_gzip(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertTrue(response['ETag'].startswith('W/'))
+
+    @skipUnless(importlib.util.find_spec('brotli'), 'requer brotli')
+    def test_brotli_only_without_csrf_token_in_html(self):
+        response = self.client.get(self.url,
+                                   HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.client.force_login(User.objects.create(username='member'))
+        # Com o token no HTML fica o gzip, com a proteção contra o BREACH
+        response = self.client.get(self.url,
+                                   HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+
+class BulkActionTests(TestCase):
+    def setUp(self):
+        audit.flush()
+        self.users = User.objects.bulk_create([
+            User(username=f'bulk{index}', email=f'bulk{index}@example.com',
+                 is_2fa_enabled=index % 2 == 0, otp_backup_codes=',abc,')
+            for index in range(5)
+        ])
+        self.ids = [user.pk for user in self.users]
+        PasswordResetToken.objects.bulk_create([
+            PasswordResetToken(user=user, token_hash=f'bulk-{user.pk}')
+            for user in self.users
+        ])
+
+    def test_update_is_one_query_per_chunk(self):
+        # SAVEPOINT, um UPDATE por lote de 2 ids (3 lotes), RELEASE
+        with self.assertNumQueries(5):
+            self.assertEqual(bulk.deactivate(self.ids, chunk_size=2), 5)
+        self.assertFalse(User.objects.filter(is_active=True).exists())
+
+    def test_delete_queries_per_chunk(self):
+        # Por lote: SELECT dos ids, um DELETE para cada tabela relacionada
+        # (log do admin, grupos, permissões, tokens de redefinição) e o
+        # DELETE dos usuários; mais SAVEPOINT e RELEASE
+        with self.assertNumQueries(2 + 6 * 3):
+            self.assertEqual(bulk.delete(self.ids, chunk_size=2), 5)
+        self.assertFalse(User.objects.exists())
+        self.assertFalse(PasswordResetToken.objects.exists())
+
+    def test_delete_splits_users_in_groups_of_100(self):
+        # O Collector do ORM exclui as linhas carregadas em grupos de
+        # GET_ITERATOR_CHUNK_SIZE (100): 250 usuários em um lote são três
+        # DELETEs em accounts_user
+        users = User.objects.bulk_create([
+            User(username=f'many{index}', email=f'many{index}@example.com')
+            for index in range(250)
+        ])
+        with self.assertNumQueries(2 + 5 + 3):
+            self.assertEqual(bulk.delete([user.pk for user in users]), 250)
+
+    def test_disable_2fa_audits_only_changed_users(self):
+        enabled = [pk for pk, user in zip(self.ids, self.users)
+                   if user.is_2fa_enabled]
+        missing = max(self.ids) + 1
+        self.assertEqual(bulk.disable_2fa(self.ids + [missing]), len(enabled))
+        audit.flush()
+        self.assertCountEqual(
+            AuthEvent.objects.filter(event=AuthEvent.TWO_FACTOR_DISABLED)
+            .values_list('user_id', flat=True),
+            enabled,
+        )
+        self.assertFalse(User.objects.filter(is_2fa_enabled=True).exists())
+
+    def test_admin_actions_require_change_permission(self):
+        staff = User.objects.create(username='viewer', is_staff=True)
+        staff.user_permissions.add(
+            Permission.objects.get(codename='view_user'))
+        self.client.force_login(staff)
+        url = reverse('admin:accounts_user_changelist')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('bulk_deactivate', response.content.decode())
+        self.client.post(url, {'action': 'bulk_deactivate',
+                               '_selected_action': self.ids})
+        self.assertEqual(User.objects.filter(is_active=True).count(), 6)
+
+        staff.user_permissions.add(
+            Permission.objects.get(codename='change_user'))
+        self.client.post(url, {'action': 'bulk_deactivate',
+                               '_selected_action': self.ids})
+        # O próprio usuário fica de fora
+        self.assertEqual(
+            list(User.objects.filter(is_active=True)), [staff])
+
+
+class AuditLogTests(TransactionTestCase):
+    # TransactionTestCase: o teste precisa rodar fora de uma transação
+
+    def setUp(self):
+        audit.flush()
+        # Grava o buffer antes de as tabelas serem esvaziadas
+        self.addCleanup(audit.flush)
+
+    def test_record_does_not_flush_inside_callers_transaction(self):
+        with self.settings(AUDIT_LOG={**settings.AUDIT_LOG, 'BATCH_SIZE': 1}):
+            with transaction.atomic():
+                audit.record(AuthEvent.LOGIN_FAILED, email='a@example.com')
+                self.assertFalse(AuthEvent.objects.exists())
+            audit.record(AuthEvent.LOGIN_FAILED, email='b@example.com')
+        self.assertEqual(AuthEvent.objects.count(), 2)
+
+    def test_failed_flush_keeps_callers_transaction_usable(self):
+        audit.record(AuthEvent.LOGIN_FAILED, email='a@example.com')
+        # Coluna NOT NULL vazia: o INSERT do bulk_create falha
+        audit._buffer[-1].event = None
+        with transaction.atomic():
+            User.objects.create(username='a', email='a@example.com')
+            with self.assertLogs('accounts.audit', 'ERROR'):
+                self.assertEqual(audit.flush(), 0)
+            # A transação externa continua utilizável
+            self.assertEqual(User.objects.count(), 1)
+        self.assertEqual(User.objects.count(), 1)
+
+    def test_long_email_is_truncated_and_invalid_ip_dropped(self):
+        request = RequestFactory().post('/', REMOTE_ADDR='unix-socket')
+        audit.record(AuthEvent.LOGIN_FAILED, request,
+                     email='a' * 300 + '@example.com')
+        self.assertEqual(audit.flush(), 1)
+        event = AuthEvent.objects.get()
+        self.assertEqual(event.email, 'a' * 254)
+        self.assertIsNone(event.ip)
+
+    def test_exit_flush_skips_a_different_database(self):
+        audit.record(AuthEvent.LOGIN_FAILED, email='a@example.com')
+        # Ex.: o banco de teste foi destruído e o nome voltou ao do real
+        with mock.patch.dict(connection.settings_dict, NAME='other'), \
+                self.assertLogs('accounts.audit', 'WARNING'):
+            audit._flush_at_exit()
+        self.assertEqual(audit.flush(), 0)
+        audit.record(AuthEvent.LOGIN_FAILED, email='b@example.com')
+        audit._flush_at_exit()
+        self.assertEqual(list(AuthEvent.objects.values_list('email',
+                                                            flat=True)),
+                         ['b@example.com'])
+
+    def test_admin_cannot_delete_events(self):
+        superuser = User.objects.create(username='root', is_staff=True,
+                                        is_superuser=True)
+        audit.record(AuthEvent.LOGIN_FAILED, email='a@example.com')
+        audit.flush()
+        event = AuthEvent.objects.get()
+        self.client.force_login(superuser)
+        response = self.client.get(
+            reverse('admin:accounts_authevent_delete', args=[event.pk]))
+        self.assertEqual(response.status_code, 403)
+        self.assertTrue(AuthEvent.objects.exists())
+
+
+@FAST_HASHING
+class ViewQueryTests(AccountsTestCase):
+    """
+    Consultas por requisição das views principais, as mesmas medidas pelo
+    cenário `views` do benchmark. SAVEPOINT e RELEASE contam como consultas.
+    """
+    password = 'Query-pass-2026!'
+
+    def setUp(self):
+        super().setUp()
+        self.secret = pyotp.random_base32()
+        self.member = User.objects.create_user(
+            username='member', email='member@example.com',
+            password=self.password,
+        )
+        self.two_factor = User.objects.create_user(
+            username='twofactor', email='twofactor@example.com',
+            password=self.password, otp_secret=self.secret,
+            is_2fa_enabled=True,
+        )
+        self.staff = User.objects.create_user(
+            username='staff', email='staff@example.com',
+            password=self.password, is_staff=True,
+        )
+
+    def login(self, user):
+        return self.client.post(reverse('home'), {
+            'email': user.email, 'password': self.password,
+        })
+
+    def test_login(self):
+        # SELECT do usuário, UPDATE de last_login e o INSERT da sessão
+        with self.assertNumQueries(5):
+            response = self.login(self.member)
+        self.assertRedirects(response, reverse(settings.LOGIN_REDIRECT_URL),
+                             fetch_redirect_response=False)
+
+    def test_failed_login(self):
+        with self.assertNumQueries(1):
+            response = self.client.post(reverse('home'), {
+                'email': 'member@example.com', 'password': 'wrong',
+            })
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+    def test_login_with_2fa(self):
+        # Sem last_login: o login só termina em verify_2fa
+        with self.assertNumQueries(4):
+            response = self.login(self.two_factor)
+        self.assertRedirects(response, reverse('verify_2fa'),
+                             fetch_redirect_response=False)
+
+    def test_verify_2fa(self):
+        self.login(self.two_factor)
+        token = pyotp.TOTP(self.secret).now()
+        # SELECT do usuário, UPDATE condicional do passo TOTP, DELETE da
+        # sessão anterior, UPDATE de last_login e o INSERT da nova sessão
+        with self.assertNumQueries(7):
+            response = self.client.post(reverse('verify_2fa'),
+                                        {'token': token})
+        self.assertRedirects(response, reverse('dashboard'),
+                             fetch_redirect_response=False)
+        self.assertEqual(self.client.session['_auth_user_id'],
+                         str(self.two_factor.pk))
+
+    def test_dashboard(self):
+        self.login(self.member)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(USER_LIST_CACHE_TIMEOUT=300)
+    def test_user_list(self):
+        self.client.force_login(self.staff)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('user_list'))
+        self.assertContains(response, 'member@example.com')
+        # As linhas vêm do cache de fragmentos
+        with self.assertNumQueries(1):
+            self.client.get(reverse('user_list'))
+        # Alterar um usuário muda a versão e a chave do fragmento
+        self.member.first_name = 'Renamed'
+        self.member.save()
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('user_list'))
+        self.assertContains(response, 'Renamed')
+
+    @override_settings(USER_LIST_CACHE_TIMEOUT=0)
+    def test_user_list_without_shared_cache(self):
+        # Sem cache compartilhado a versão não chegaria aos outros workers:
+        # as linhas são sempre consultadas
+        self.client.force_login(self.staff)
+        for _ in range(2):
+            with self.assertNumQueries(2):
+                self.client.get(reverse('user_list'))
+
+    def test_logout(self):
+        self.login(self.member)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('logout'))
+        self.assertRedirects(response, reverse('home'),
+                             fetch_redirect_response=False)
+        self.assertFalse(Session.objects.exists())
+
+    def test_password_reset_request(self):
+        with self.assertNumQueries(5):
+            response = self.client.post(reverse('password_reset_request'),
+                                        {'email': 'member@example.com'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(PasswordResetToken.objects.filter(
+            user=self.member, is_used=False,
+        ).count(), 1)
+
+    def test_password_reset_confirm(self):
+        url = reverse('password_reset_confirm',
+                      args=[get_reset_tokens().make_token(self.member)])
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url).status_code, 200)
+        with self.assertNumQueries(3):
+            self.client.post(url, {'password1': 'New-pass-2026!',
+                                   'password2': 'New-pass-2026!'})
+        self.member.refresh_from_db()
+        self.assertTrue(self.member.check_password('New-pass-2026!'))
+
+
+class BenchmarkCommandTests(TestCase):
+    def test_compare_results_flags_regressions_above_threshold(self):
+        baseline = {'views': {'login': {
+            'p95_ms': 10.0, 'queries': 5, 'requests_per_sec': 100.0,
+            'count': 50,
+        }}}
+        current = {'views': {'login': {
+            'p95_ms': 10.5, 'queries': 6, 'requests_per_sec': 80.0,
+            'count': 10,
+        }}}
+        regressions = compare_results(baseline, current, threshold=10)
+        self.assertEqual(
+            [(label, key) for _, label, key, *_ in regressions],
+            [('login', 'queries'), ('login', 'requests_per_sec')],
+        )
+
+    def test_compare_results_ignores_improvements_and_new_measurements(self):
+        baseline = {'views': {'login': {'p95_ms': 10.0, 'queries': 5}}}
+        current = {
+            'views': {'login': {'p95_ms': 5.0, 'queries': 5},
+                      'logout': {'p95_ms': 50.0}},
+            'new-scenario': {'all': {'ms': 1.0}},
+        }
+        self.assertEqual(compare_results(baseline, current, 10), [])
+
+    def test_compare_results_from_zero(self):
+        baseline = {'views': {'dashboard': {'queries': 0}}}
+        current = {'views': {'dashboard': {'queries': 1}}}
+        (regression,) = compare_results(baseline, current, 10)
+        self.assertEqual(regression[-1], float('inf'))
+
+    @override_settings(BENCHMARK_LIVE_DATABASE=False)
+    def test_live_server_requires_disposable_database(self):
+        with self.assertRaisesMessage(CommandError,
+                                      'BENCHMARK_LIVE_DATABASE=True'):
+            call_command('benchmark', 'views',
+                         live_server='http://127.0.0.1:8000')
+        self.assertFalse(User.objects.exists())
@@ -0,0 +1,75 @@
+"""
+Modos de token de redefinição de senha (PASSWORD_RESET_MODE).
+
+- 'database': token aleatório guardado (como hash) em PasswordResetToken.
+- 'signed': token sem estado, assinado com HMAC e ligado ao hash de senha e
+  ao last_login do usuário, como o PasswordResetTokenGenerator do Django.
+  Emitir e validar não gravam nada; o token deixa de valer sozinho quando
+  a senha muda ou quando o usuário faz login.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.tokens import PasswordResetTokenGenerator
+from django.utils.encoding import force_bytes, force_str
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+from .models import PasswordResetToken, User
+
+
+class ResetGrant:
+    """Token válido: o usuário e como marcá-lo como usado"""
+
+    def __init__(self, user, consume):
+        self.user = user
+        self.consume = consume
+
+
+class DatabaseResetTokens:
+    def make_token(self, user):
+        return PasswordResetToken.objects.issue(user)
+
+    async def amake_token(self, user):
+        # issue() usa transaction.atomic, que não tem versão assíncrona
+        return await sync_to_async(self.make_token)(user)
+
+    def resolve(self, token):
+        reset_token = PasswordResetToken.objects.get_valid(token)
+        if reset_token is None:
+            return None
+        return ResetGrant(reset_token.user, reset_token.mark_used)
+
+
+class SignedResetTokens:
+    generator = PasswordResetTokenGenerator()
+    # '.' não aparece no base64 do id nem no token do gerador
+    separator = '.'
+
+    def make_token(self, user):
+        uidb64 = urlsafe_base64_encode(force_bytes(user.pk))
+        return f'{uidb64}{self.separator}{self.generator.make_token(user)}'
+
+    async def amake_token(self, user):
+        # Só HMAC, sem acesso ao banco
+        return self.make_token(user)
+
+    def resolve(self, token):
+        uidb64, _, signature = token.partition(self.separator)
+        try:
+            pk = int(force_str(urlsafe_base64_decode(uidb64)))
+        except (TypeError, ValueError, OverflowError):
+            return None
+        user = User.objects.filter(pk=pk).first()
+        if user is None or not self.generator.check_token(user, signature):
+            return None
+        # A troca de senha muda o hash e invalida o token
+        return ResetGrant(user, lambda: True)
+
+
+RESET_TOKEN_MODES = {
+    'database': DatabaseResetTokens,
+    'signed': SignedResetTokens,
+}
+
+
+def get_reset_tokens():
+    return RESET_TOKEN_MODES[settings.PASSWORD_RESET_MODE]()
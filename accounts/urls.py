@@ -1,29 +1,52 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
 
-urlpatterns = [
-    path('register/', views.register_view, name='register'),
-    path('logout/', views.logout_view, name='logout'),
-    path('verify-2fa/', views.verify_2fa_view, name='verify_2fa'),
-    path('dashboard/', views.dashboard_view, name='dashboard'),
-    path('setup-2fa/', views.setup_2fa_view, name='setup_2fa'),
-    path('disable-2fa/', views.disable_2fa_view, name='disable_2fa'),
-    path('users/', views.user_list_view, name='user_list'),
-    path('users/create/', views.user_create_view, name='user_create'),
-    path('users/<int:pk>/edit/', views.user_update_view, name='user_update'),
-    path(
-        'users/<int:pk>/delete/',
-        views.user_delete_view,
-        name='user_delete'
-    ),
-    path(
-        'password-reset/',
-        views.password_reset_request_view,
-        name='password_reset_request'
-    ),
-    path(
-        'password-reset/<str:token>/',
-        views.password_reset_confirm_view,
-        name='password_reset_confirm'
-    ),
-]
+
+def build_urlpatterns(async_auth_views=False):
+    """
+    URLs do app. Com `async_auth_views` logout, 2FA e redefinição de senha
+    usam as views de accounts.async_views (ver ASYNC_AUTH_VIEWS).
+    """
+    if async_auth_views:
+        logout_view = async_views.alogout_view
+        verify_2fa_view = async_views.averify_2fa_view
+        password_reset_request_view = async_views.apassword_reset_request_view
+    else:
+        logout_view = views.logout_view
+        verify_2fa_view = views.verify_2fa_view
+        password_reset_request_view = views.password_reset_request_view
+
+    return [
+        path('register/', views.register_view, name='register'),
+        path('csrf/', views.csrf_token_view, name='csrf_token'),
+        path('logout/', logout_view, name='logout'),
+        path('verify-2fa/', verify_2fa_view, name='verify_2fa'),
+        path('dashboard/', views.dashboard_view, name='dashboard'),
+        path('setup-2fa/', views.setup_2fa_view, name='setup_2fa'),
+        path('setup-2fa/qr/', views.qr_code_view, name='setup_2fa_qr'),
+        path('disable-2fa/', views.disable_2fa_view, name='disable_2fa'),
+        path('users/', views.user_list_view, name='user_list'),
+        path('users/create/', views.user_create_view, name='user_create'),
+        path('users/bulk/', views.user_bulk_action_view,
+             name='user_bulk_action'),
+        path('users/<int:pk>/edit/', views.user_update_view, name='user_update'),
+        path(
+            'users/<int:pk>/delete/',
+            views.user_delete_view,
+            name='user_delete'
+        ),
+        path(
+            'password-reset/',
+            password_reset_request_view,
+            name='password_reset_request'
+        ),
+        path(
+            'password-reset/<str:token>/',
+            views.password_reset_confirm_view,
+            name='password_reset_confirm'
+        ),
+    ]
+
+
+urlpatterns = build_urlpatterns(settings.ASYNC_AUTH_VIEWS)
@@ -0,0 +1,111 @@
+"""
+Cache dos usuários autenticados.
+
+EmailBackend.get_user() (chamado pelo AuthenticationMiddleware a cada
+requisição) e verify_2fa_view buscam o usuário aqui antes de ir ao banco.
+O usuário em cache já traz o estado do 2FA (is_2fa_enabled). As entradas
+são removidas pelos sinais post_save/post_delete de User, o que inclui
+trocas de senha e o last_login gravado no login.
+
+O cache guarda apenas as colunas sem credenciais e o HMAC da sessão já
+calculado (get_session_auth_hash), nunca o hash da senha nem os segredos
+do 2FA. No usuário reconstruído essas colunas ficam adiadas (deferred):
+as views que precisam delas chamam load_credentials().
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+
+# Colunas que não vão para o cache
+CREDENTIAL_FIELDS = frozenset({
+    'password', 'otp_secret', 'otp_last_timestep', 'otp_backup_codes',
+})
+
+
+def _cache():
+    return caches[settings.USER_CACHE_ALIAS]
+
+
+def cache_key(user_id):
+    return f'auth-user:{user_id}'
+
+
+def _to_cache(user):
+    return {
+        'fields': {
+            field.attname: getattr(user, field.attname)
+            for field in user._meta.concrete_fields
+            if field.attname not in CREDENTIAL_FIELDS
+        },
+        'session_auth_hash': user.get_session_auth_hash(),
+        'session_auth_fallback_hashes': list(
+            user.get_session_auth_fallback_hash()
+        ),
+    }
+
+
+def _from_cache(manager, data):
+    fields = data['fields']
+    user = manager.model.from_db(manager.db, list(fields),
+                                 list(fields.values()))
+    user.session_auth_hashes = (data['session_auth_hash'],
+                                data['session_auth_fallback_hashes'])
+    return user
+
+
+def get_cached_user(user_id):
+    """Retorna o usuário com o id informado, ou None se não existir"""
+    manager = get_user_model()._default_manager
+    if not settings.USER_CACHE_TIMEOUT:
+        return manager.filter(pk=user_id).first()
+    key = cache_key(user_id)
+    data = _cache().get(key)
+    if data is not None:
+        return _from_cache(manager, data)
+    user = manager.filter(pk=user_id).first()
+    if user is not None:
+        _cache().set(key, _to_cache(user), settings.USER_CACHE_TIMEOUT)
+    return user
+
+
+async def aget_cached_user(user_id):
+    """Versão assíncrona de get_cached_user()"""
+    manager = get_user_model()._default_manager
+    if not settings.USER_CACHE_TIMEOUT:
+        return await manager.filter(pk=user_id).afirst()
+    key = cache_key(user_id)
+    data = await _cache().aget(key)
+    if data is not None:
+        return _from_cache(manager, data)
+    user = await manager.filter(pk=user_id).afirst()
+    if user is not None:
+        await _cache().aset(key, _to_cache(user),
+                            settings.USER_CACHE_TIMEOUT)
+    return user
+
+
+def _deferred_credentials(user):
+    return sorted(CREDENTIAL_FIELDS & user.get_deferred_fields())
+
+
+def load_credentials(user):
+    """Carrega, em uma consulta, as colunas de credenciais adiadas"""
+    fields = _deferred_credentials(user)
+    if fields:
+        user.refresh_from_db(fields=fields)
+    return user
+
+
+async def aload_credentials(user):
+    fields = _deferred_credentials(user)
+    if fields:
+        await user.arefresh_from_db(fields=fields)
+    return user
+
+
+def invalidate_user(user_id):
+    _cache().delete(cache_key(user_id))
+
+
+def invalidate_users(user_ids):
+    _cache().delete_many([cache_key(user_id) for user_id in user_ids])
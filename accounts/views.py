@@ -1,15 +1,32 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
-from .decorators import staff_member_required, anonymous_required
+from .decorators import (
+    staff_member_required, anonymous_required, cacheable_page, ratelimit,
+)
+from . import audit, bulk, metrics, ratelimit as rate_limits
 from django.contrib import messages
-from django.core.mail import send_mail
 from django.conf import settings
+from django.http import Http404, HttpResponse, JsonResponse
+from django.middleware.csrf import get_token
 from django.urls import reverse
-from .models import User, PasswordResetToken
+from django.utils.cache import patch_cache_control
+from django.views.decorators.cache import never_cache
+from django.views.decorators.http import condition, require_GET, require_POST
+from .mail import dispatch_mail
+from .otp import (
+    DEVICE_SESSION_KEY, BackupCodeDevice, backup_codes_remaining,
+    generate_backup_codes, verify_token,
+)
+from .models import AuthEvent, User
 from .forms import *
-import secrets
+from .pagination import InvalidCursor, KeysetPage
+from .qr import CONTENT_TYPES as QR_CONTENT_TYPES, render_qr
+from .rendering import users_version
+from .tokens import get_reset_tokens
+from .user_cache import get_cached_user, load_credentials
 
+@cacheable_page
 def register_view(request):
     if request.method == 'POST':
         form = UserRegistrationForm(request.POST)
@@ -21,7 +38,10 @@ def register_view(request):
         form = UserRegistrationForm()
     return render(request, 'accounts/register.html', {'form': form})
 
+@ratelimit('login', key='ip')
+@ratelimit('login', key='email_ip')
 @anonymous_required
+@cacheable_page
 def login_view(request):
     if request.method == 'POST':
         form = LoginForm(request.POST)
@@ -32,40 +52,60 @@ def login_view(request):
             user = authenticate(request, email=email, password=password)
 
             if user is not None:
+                rate_limits.reset(request, 'login', 'email_ip')
                 if user.is_2fa_enabled:
+                    metrics.LOGIN_ATTEMPTS.inc(result='2fa_required')
                     request.session['pre_2fa_user_id'] = user.id
                     return redirect('verify_2fa')
                 else:
+                    metrics.LOGIN_ATTEMPTS.inc(result='success')
                     login(request, user)
                     return redirect(settings.LOGIN_REDIRECT_URL)
             else:
+                metrics.LOGIN_ATTEMPTS.inc(result='failure')
                 messages.error(request, 'E-mail ou senha inválidos. Por favor, tente novamente.')
     else:
         form = LoginForm()
     return render(request, 'accounts/login.html', {'form': form})
 
 
+@ratelimit('verify_2fa', key='ip')
+@ratelimit('verify_2fa', key='pre_2fa_user')
 def verify_2fa_view(request):
     user_id = request.session.get('pre_2fa_user_id')
     if not user_id:
         messages.error(request, 'Sessão de login inválida. Por favor, faça o login novamente.')
         return redirect('home')
 
-    user = get_object_or_404(User, id=user_id)
+    user = get_cached_user(user_id)
+    if user is None:
+        raise Http404
+    load_credentials(user)
 
     if request.method == 'POST':
-        form = TwoFactorForm(request.POST)
+        form = TwoFactorLoginForm(request.POST)
         if form.is_valid():
             token = form.cleaned_data['token']
-            if user.verify_totp(token):
+            device = verify_token(user, token)
+            metrics.TWO_FACTOR_VERIFICATIONS.inc(
+                result='success' if device is not None else 'failure'
+            )
+            if device is not None:
                 del request.session['pre_2fa_user_id']
-                login(request, user) # O backend já foi determinado na autenticação inicial
+                # O usuário foi carregado da sessão, não por authenticate()
+                login(request, user, backend='accounts.backends.EmailBackend')
+                request.session[DEVICE_SESSION_KEY] = device.name
                 messages.success(request, 'Login realizado com sucesso!')
+                if device.name == BackupCodeDevice.name:
+                    messages.info(request,
+                        f'Código de backup usado. Restam '
+                        f'{backup_codes_remaining(user)} código(s).')
                 return redirect('dashboard')
             else:
+                audit.record(AuthEvent.TWO_FACTOR_FAILED, request, user)
                 messages.error(request, 'Código inválido')
     else:
-        form = TwoFactorForm()
+        form = TwoFactorLoginForm()
 
     return render(request, 'accounts/verify_2fa.html', {'form': form})
 
@@ -77,7 +117,7 @@ def dashboard_view(request):
 
 @login_required
 def setup_2fa_view(request):
-    user = request.user
+    user = load_credentials(request.user)
 
     if not user.otp_secret:
         user.generate_otp_secret()
@@ -88,36 +128,105 @@ def setup_2fa_view(request):
             token = form.cleaned_data['token']
             if user.verify_totp(token):
                 user.is_2fa_enabled = True
-                user.save()
+                user.save(update_fields=['is_2fa_enabled'])
+                audit.record(AuthEvent.TWO_FACTOR_ENABLED, request, user)
+                # Exibidos uma única vez; só os hashes ficam no banco
+                backup_codes = generate_backup_codes(user)
                 messages.success(request, '2FA ativado com sucesso!')
-                return redirect('dashboard')
+                return render(request, 'accounts/backup_codes.html', {
+                    'backup_codes': backup_codes,
+                })
             else:
                 messages.error(request, 'Código inválido')
     else:
         form = TwoFactorForm()
 
-    qr_code = user.get_qr_code()
+    # A imagem é servida por qr_code_view; a versão invalida o cache do
+    # navegador quando o segredo muda
     return render(request, 'accounts/setup_2fa.html', {
         'form': form,
-        'qr_code': qr_code,
+        'qr_version': user.get_qr_code_version(),
         'secret': user.otp_secret
     })
 
 
+def _qr_etag(request):
+    # Mesmas condições da view: sem ETag não há 304, e a view responde 404
+    # depois que o 2FA é ativado
+    user = request.user
+    if user.is_authenticated and not user.is_2fa_enabled and \
+            load_credentials(user).otp_secret:
+        return user.get_qr_code_version()
+    return None
+
+
+@login_required
+@condition(etag_func=_qr_etag)
+def qr_code_view(request):
+    user = request.user
+    if not user.otp_secret or user.is_2fa_enabled:
+        raise Http404
+    image_format = settings.QR_CODE_FORMAT
+    response = HttpResponse(render_qr(user.get_totp_uri(), image_format),
+                            content_type=QR_CONTENT_TYPES[image_format])
+    # A imagem contém o segredo OTP: nunca em caches compartilhados
+    patch_cache_control(response, private=True, max_age=300)
+    return response
+
+
 @login_required
 def disable_2fa_view(request):
     if request.method == 'POST':
         request.user.is_2fa_enabled = False
-        request.user.save()
+        request.user.otp_backup_codes = ''
+        request.user.save(update_fields=['is_2fa_enabled',
+                                         'otp_backup_codes'])
+        audit.record(AuthEvent.TWO_FACTOR_DISABLED, request, request.user)
         messages.success(request, '2FA desativado')
         return redirect('dashboard')
     return render(request, 'accounts/disable_2fa.html')
 
 
+USER_LIST_PAGE_SIZE = 50
+
+# Apenas as colunas exibidas em user_list.html (mais a chave do cursor)
+USER_LIST_COLUMNS = ('id', 'email', 'first_name', 'last_name', 'is_active',
+                     'is_staff', 'is_2fa_enabled', 'date_joined')
+
+
 @staff_member_required
 def user_list_view(request):
-    users = User.objects.all().order_by('-date_joined')
-    return render(request, 'accounts/user_list.html', {'users': users})
+    form = UserFilterForm(request.GET or None)
+    users = User.objects.values(*USER_LIST_COLUMNS)
+    if form.is_valid():
+        users = form.filter_queryset(users)
+        descending = form.cleaned_data.get('order') != 'asc'
+    else:
+        descending = True
+
+    try:
+        page = KeysetPage(users, cursor=request.GET.get('cursor'),
+                          per_page=USER_LIST_PAGE_SIZE,
+                          descending=descending)
+    except InvalidCursor:
+        messages.error(request, 'Página inválida.')
+        return redirect('user_list')
+
+    # Preserva busca e filtros nos links de paginação
+    params = request.GET.copy()
+    params.pop('cursor', None)
+    # page.rows só é consultado se o fragmento das linhas não estiver em
+    # cache; a chave muda quando um usuário é alterado (users_version)
+    return render(request, 'accounts/user_list.html', {
+        'page': page,
+        'filter_form': form,
+        'query_string': params.urlencode(),
+        'page_key': request.GET.urlencode(),
+        'users_version': users_version(),
+        'bulk_form': UserBulkActionForm(initial={
+            'query': params.urlencode(),
+        }),
+    })
 
 
 @staff_member_required
@@ -157,6 +266,40 @@ def user_delete_view(request, pk):
     return render(request, 'accounts/user_confirm_delete.html', {'user': user})
 
 
+@staff_member_required
+@require_POST
+def user_bulk_action_view(request):
+    """
+    Aplica uma ação aos usuários marcados na lista (ou a todos os
+    resultados do filtro) com accounts.bulk. A exclusão pede confirmação.
+    """
+    form = UserBulkActionForm(request.POST)
+    list_url = reverse('user_list')
+    if request.POST.get('query'):
+        list_url += '?' + request.POST['query']
+    if not form.is_valid():
+        for error in form.non_field_errors() or ['Ação inválida.']:
+            messages.error(request, error)
+        return redirect(list_url)
+
+    # O próprio usuário nunca é desativado ou excluído por engano
+    ids = list(form.selected_ids().exclude(pk=request.user.pk))
+    action = form.cleaned_data['action']
+    if action == 'delete' and not request.POST.get('confirm'):
+        return render(request, 'accounts/user_bulk_confirm_delete.html', {
+            'form': form,
+            'ids': form.cleaned_data['ids'],
+            'count': len(ids),
+        })
+    count = bulk.ACTIONS[action](ids)
+    label = dict(UserBulkActionForm.ACTION_CHOICES)[action]
+    messages.success(request, f'{label}: {count} usuário(s).')
+    return redirect(list_url)
+
+
+@ratelimit('password_reset', key='ip')
+@ratelimit('password_reset', key='email_ip')
+@cacheable_page
 def password_reset_request_view(request):
     # Verifica se está usando console backend
     is_console_backend = 'console' in settings.EMAIL_BACKEND.lower()
@@ -166,22 +309,20 @@ def password_reset_request_view(request):
         if form.is_valid():
             email = form.cleaned_data['email']
             try:
-                user = User.objects.get(email=email)
-                token = secrets.token_urlsafe(32)
-
-                PasswordResetToken.objects.create(user=user, token=token)
+                user = User.objects.with_email(email).get()
+                token = get_reset_tokens().make_token(user)
+                audit.record(AuthEvent.PASSWORD_RESET_REQUESTED, request, user)
 
                 reset_url = request.build_absolute_uri(
                     reverse('password_reset_confirm', args=[token])
                 )
 
                 try:
-                    send_mail(
+                    dispatch_mail(
                         'Redefinição de Senha',
                         f'Clique no link para redefinir sua senha: {reset_url}',
                         settings.DEFAULT_FROM_EMAIL,
                         [email],
-                        fail_silently=False,
                     )
                     
                     # Se estiver usando console backend, mostra o link na página
@@ -226,25 +367,23 @@ def password_reset_request_view(request):
 
 
 def password_reset_confirm_view(request, token):
-    try:
-        reset_token = PasswordResetToken.objects.get(token=token)
-        if not reset_token.is_valid():
-            messages.error(request, 'Token inválido ou expirado')
-            return redirect('password_reset_request')
-    except PasswordResetToken.DoesNotExist:
-        messages.error(request, 'Token inválido')
+    grant = get_reset_tokens().resolve(token)
+    if grant is None:
+        messages.error(request, 'Token inválido ou expirado')
         return redirect('password_reset_request')
 
     if request.method == 'POST':
         form = PasswordResetConfirmForm(request.POST)
         if form.is_valid():
+            if not grant.consume():
+                messages.error(request, 'Token inválido ou expirado')
+                return redirect('password_reset_request')
+
             password = form.cleaned_data['password1']
-            user = reset_token.user
+            user = grant.user
             user.set_password(password)
-            user.save()
-
-            reset_token.is_used = True
-            reset_token.save()
+            user.save(update_fields=['password'])
+            audit.record(AuthEvent.PASSWORD_RESET_COMPLETED, request, user)
 
             messages.success(request, 'Senha redefinida com sucesso!')
             return redirect('home')
@@ -257,3 +396,24 @@ def password_reset_confirm_view(request, token):
 def logout_view(request):
     logout(request)
     return redirect('home')
+
+
+@never_cache
+@require_GET
+def csrf_token_view(request):
+    """
+    Token CSRF para os formulários das páginas em cache (@cacheable_page).
+    Também grava o cookie CSRF, que static/js/csrf.js reaproveita nas
+    próximas páginas.
+    """
+    return JsonResponse({'token': get_token(request)})
+
+
+def metrics_view(request):
+    """Métricas no formato de texto do Prometheus"""
+    allowed = rate_limits.client_ip(request) in settings.METRICS_ALLOWED_IPS \
+        or request.user.is_staff
+    if not settings.METRICS_ENABLED or not allowed:
+        raise Http404
+    return HttpResponse(metrics.render(),
+                        content_type='text/plain; version=0.0.4; charset=utf-8')
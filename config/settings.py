@@ -9,6 +9,7 @@ https://docs.djangoproject.com/en/5.2/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
+import json
 import os
 from pathlib import Path
 from decouple import config
@@ -39,19 +40,20 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'accounts',
-    'django_otp',
-    'django_otp.plugins.otp_totp',
-
 ]
 
 MIDDLEWARE = [
+    'accounts.middleware.MetricsMiddleware',
+    # gzip (ou brotli, se instalado); antes dos que alteram o corpo
+    'accounts.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'django_otp.middleware.OTPMiddleware',
+    'accounts.middleware.OTPMiddleware',
+    'accounts.middleware.HashingOverloadMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -65,34 +67,296 @@ AUTHENTICATION_BACKENDS = [
     'django.contrib.auth.backends.ModelBackend',  # Fallback para o admin e outros casos
 ]
 
+# Cache de verificação de credenciais: evita rodar o KDF novamente quando o
+# mesmo usuário repete o login com a mesma senha dentro de TIMEOUT segundos
+AUTH_CREDENTIAL_CACHE = {
+    'ENABLED': os.getenv('AUTH_CREDENTIAL_CACHE', 'False') == 'True',
+    'TIMEOUT': int(os.getenv('AUTH_CREDENTIAL_CACHE_TIMEOUT', 300)),
+    'MAX_ENTRIES': int(os.getenv('AUTH_CREDENTIAL_CACHE_MAX_ENTRIES', 10000)),
+    # Alias de CACHES compartilhado entre processos (opcional)
+    'CACHE_ALIAS': os.getenv('AUTH_CREDENTIAL_CACHE_ALIAS') or None,
+}
+
+# Métricas (accounts.metrics), expostas em /metrics/ no formato do Prometheus
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True') == 'True'
+# Com vários processos (gunicorn), diretório compartilhado pelos snapshots
+METRICS_MULTIPROC_DIR = os.getenv('METRICS_MULTIPROC_DIR') or None
+# Intervalo mínimo, em segundos, entre gravações do snapshot de um processo
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 5))
+# IPs que podem ler /metrics/ (além de usuários da equipe)
+METRICS_ALLOWED_IPS = os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+
+# Registro de eventos de autenticação (accounts.audit). Os eventos ficam em
+# buffer em cada processo e são gravados em lote
+AUDIT_LOG = {
+    'ENABLED': os.getenv('AUDIT_LOG_ENABLED', 'True') == 'True',
+    # 'database' (tabela AuthEvent) ou 'jsonl' (um arquivo por dia em PATH)
+    'BACKEND': os.getenv('AUDIT_LOG_BACKEND', 'database'),
+    'PATH': os.getenv('AUDIT_LOG_PATH', BASE_DIR / 'audit'),
+    # Eventos por gravação e intervalo máximo, em segundos, entre gravações
+    'BATCH_SIZE': int(os.getenv('AUDIT_LOG_BATCH_SIZE', 100)),
+    'FLUSH_INTERVAL': float(os.getenv('AUDIT_LOG_FLUSH_INTERVAL', 5)),
+    # Dias mantidos pelo comando prune_auth_events
+    'RETENTION_DAYS': int(os.getenv('AUDIT_LOG_RETENTION_DAYS', 180)),
+}
+
+# Pool de processos para o KDF (accounts.hashers). Com o pool cheio o login,
+# o cadastro e a troca de senha respondem 503 em vez de ocupar os workers.
+# Vale para os hashers dos perfis (PBKDF2, Argon2, scrypt); hashes antigos
+# de PBKDF2-SHA1 ou bcrypt são verificados no próprio worker
+PASSWORD_HASHING_POOL = {
+    'ENABLED': os.getenv('PASSWORD_HASHING_POOL', 'False') == 'True',
+    # Processos do pool (padrão: número de CPUs)
+    'WORKERS': int(os.getenv('PASSWORD_HASHING_WORKERS', 0)) or None,
+    # Cálculos aguardando um processo livre além dos em execução
+    'MAX_PENDING': int(os.getenv('PASSWORD_HASHING_MAX_PENDING', 16)),
+    # Segundos de espera por uma vaga antes de desistir (0 = imediato)
+    'TIMEOUT': float(os.getenv('PASSWORD_HASHING_TIMEOUT', 0)),
+    'RETRY_AFTER': 1,
+}
+
+# Perfis de custo do hash de senha (accounts.hashers). O perfil ativo define
+# o hasher preferido; os demais hashers continuam aceitos e os hashes antigos
+# são refeitos no próximo login. Use `manage.py calibrate_hasher` para ajustar
+# o custo à máquina e PASSWORD_HASHER_OPTIONS (JSON) para aplicá-lo.
+PASSWORD_HASHER_PROFILES = {
+    # Padrão do Django
+    'pbkdf2': {
+        'HASHER': 'accounts.hashers.PooledPBKDF2PasswordHasher',
+        'OPTIONS': {'iterations': 1_000_000},
+    },
+    # Mínimo recomendado pela OWASP para PBKDF2-HMAC-SHA256
+    'pbkdf2-fast': {
+        'HASHER': 'accounts.hashers.PooledPBKDF2PasswordHasher',
+        'OPTIONS': {'iterations': 600_000},
+    },
+    # Requer argon2-cffi
+    'argon2': {
+        'HASHER': 'accounts.hashers.Argon2PasswordHasher',
+        'OPTIONS': {'time_cost': 2, 'memory_cost': 102400, 'parallelism': 8},
+    },
+    'argon2-low-memory': {
+        'HASHER': 'accounts.hashers.Argon2PasswordHasher',
+        'OPTIONS': {'time_cost': 2, 'memory_cost': 19456, 'parallelism': 1},
+    },
+    'scrypt': {
+        'HASHER': 'accounts.hashers.ScryptPasswordHasher',
+        'OPTIONS': {'work_factor': 2 ** 14, 'block_size': 8, 'parallelism': 5},
+    },
+}
+PASSWORD_HASHER_PROFILE = os.getenv('PASSWORD_HASHER_PROFILE', 'pbkdf2')
+PASSWORD_HASHER_OPTIONS = json.loads(os.getenv('PASSWORD_HASHER_OPTIONS', '{}'))
+
+PASSWORD_HASHERS = [PASSWORD_HASHER_PROFILES[PASSWORD_HASHER_PROFILE]['HASHER']]
+PASSWORD_HASHERS += [
+    hasher for hasher in (
+        'accounts.hashers.PooledPBKDF2PasswordHasher',
+        'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+        'accounts.hashers.Argon2PasswordHasher',
+        'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+        'accounts.hashers.ScryptPasswordHasher',
+    ) if hasher not in PASSWORD_HASHERS
+]
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.template.context_processors.csrf',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'accounts.rendering.template_settings',
+            ],
+            # Templates compilados uma vez por processo. Em desenvolvimento
+            # o autoreload do Django esvazia o cache quando um template muda
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
             ],
         },
     },
 ]
 
+# Templates compilados ao iniciar o processo (accounts.rendering), para que
+# a primeira requisição de cada página não pague a compilação
+TEMPLATE_PRELOAD = [] if DEBUG else sorted(
+    path.relative_to(BASE_DIR / 'templates').as_posix()
+    for path in (BASE_DIR / 'templates').rglob('*.html')
+)
+# Segundos de vida dos fragmentos em {% cache %} (navegação; as linhas da
+# lista de usuários usam USER_LIST_CACHE_TIMEOUT)
+TEMPLATE_FRAGMENT_CACHE_TIMEOUT = int(os.getenv('TEMPLATE_FRAGMENT_CACHE_TIMEOUT', 300))
+
 WSGI_APPLICATION = 'config.wsgi.application'
 
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_ENGINE=postgresql usa o PostgreSQL (requer psycopg); o padrão é SQLite
+DB_ENGINE = os.getenv('DB_ENGINE', 'sqlite3')
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('DB_NAME', 'login_django'),
+            'USER': os.getenv('DB_USER', 'postgres'),
+            'PASSWORD': os.getenv('DB_PASSWORD', ''),
+            'HOST': os.getenv('DB_HOST', 'localhost'),
+            'PORT': os.getenv('DB_PORT', '5432'),
+            # Conexões persistentes, verificadas antes de serem reutilizadas
+            'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
     }
-}
+    if os.getenv('DB_POOL', 'False') == 'True':
+        # Pool nativo do psycopg (requer psycopg[pool]); é incompatível com
+        # conexões persistentes
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+            'timeout': int(os.getenv('DB_POOL_TIMEOUT', 10)),
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {
+                # Espera até `timeout` segundos por um lock em vez de falhar
+                # com "database is locked"
+                'timeout': int(os.getenv('SQLITE_TIMEOUT', 20)),
+                # Transações de escrita pegam o lock no BEGIN, evitando
+                # deadlocks ao promover uma leitura para escrita
+                'transaction_mode': 'IMMEDIATE',
+            },
+        }
+    }
+    if os.getenv('SQLITE_WAL', 'True') == 'True':
+        # WAL permite leituras durante uma escrita; synchronous=NORMAL é
+        # seguro em WAL e evita um fsync por transação
+        DATABASES['default']['OPTIONS']['init_command'] = (
+            'PRAGMA journal_mode=WAL;'
+            'PRAGMA synchronous=NORMAL;'
+        )
+
+# Nome do banco de teste (usado também pelo comando benchmark). Com SQLite
+# o padrão é um banco em memória; um arquivo permite medir concorrência.
+if os.getenv('DB_TEST_NAME'):
+    DATABASES['default']['TEST'] = {'NAME': os.getenv('DB_TEST_NAME')}
+
+# Declara que o banco configurado é descartável, só para benchmarks: o
+# `benchmark --live-server` semeia e exclui usuários nele e se recusa a
+# rodar sem esta setting
+BENCHMARK_LIVE_DATABASE = os.getenv('BENCHMARK_LIVE_DATABASE', 'False') == 'True'
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+REDIS_URL = os.getenv('REDIS_URL')
+# Diretório do cache de sessões em arquivo, usado sem Redis. O conteúdo é
+# lido com pickle: deve ser um diretório exclusivo do usuário do processo
+# (verificado por accounts.checks), nunca um caminho previsível em /tmp
+SESSION_CACHE_DIR = os.getenv('SESSION_CACHE_DIR')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        },
+        'sessions': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'sessions',
+        },
+    }
+elif SESSION_CACHE_DIR:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        # Compartilhado entre os workers da mesma máquina, ao contrário do
+        # locmem. Cada gravação lista o diretório para limitar o número de
+        # entradas, então com muitas sessões prefira o Redis
+        'sessions': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': SESSION_CACHE_DIR,
+            'OPTIONS': {'MAX_ENTRIES': int(
+                os.getenv('SESSION_CACHE_MAX_ENTRIES', 10000)
+            )},
+        },
+    }
+else:
+    # Sem cache compartilhado: cada processo tem o seu. As sessões continuam
+    # gravadas no banco (cached_db), mas o cache de usuários fica desligado
+    # (USER_CACHE_TIMEOUT), pois a invalidação não chegaria aos outros
+    # workers
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'sessions': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'sessions',
+        },
+    }
+SHARED_SESSION_CACHE = bool(REDIS_URL or SESSION_CACHE_DIR)
+
+
+# Sessões
+# https://docs.djangoproject.com/en/5.2/topics/http/sessions/
+
+# 'accounts.sessions' = cached_db que não regrava sessões inalteradas.
+# Outras opções: django.contrib.sessions.backends.db, .cache, .cached_db e
+# .signed_cookies
+SESSION_ENGINE = os.getenv('SESSION_ENGINE', 'accounts.sessions')
+SESSION_CACHE_ALIAS = 'sessions'
+
+# Cache do usuário autenticado (accounts.user_cache). Usa o mesmo cache
+# compartilhado das sessões para que a invalidação valha para todos os
+# workers; 0 desliga o cache.
+USER_CACHE_ALIAS = 'sessions'
+USER_CACHE_TIMEOUT = int(os.getenv(
+    'USER_CACHE_TIMEOUT', 300 if SHARED_SESSION_CACHE else 0
+))
+# Segundos de vida do fragmento com as linhas da lista de usuários. A
+# versão que invalida o fragmento (accounts.rendering.users_version) fica
+# no mesmo cache: sem cache compartilhado um worker não veria as alterações
+# feitas em outro, então o padrão desliga o fragmento (0).
+USER_LIST_CACHE_TIMEOUT = int(os.getenv(
+    'USER_LIST_CACHE_TIMEOUT',
+    TEMPLATE_FRAGMENT_CACHE_TIMEOUT if SHARED_SESSION_CACHE else 0
+))
+
+
+# Views de login, 2FA, redefinição de senha e logout em versão assíncrona
+# (accounts.async_views). Habilite ao servir com ASGI (uvicorn/daphne)
+ASYNC_AUTH_VIEWS = os.getenv('ASYNC_AUTH_VIEWS', 'False') == 'True'
+
+
+# Rate limiting de login, 2FA e redefinição de senha (accounts.ratelimit)
+RATELIMIT_ENABLED = os.getenv('RATELIMIT_ENABLED', 'True') == 'True'
+# accounts.ratelimit.MemoryStore mantém os contadores no próprio processo
+RATELIMIT_STORE = os.getenv('RATELIMIT_STORE', 'accounts.ratelimit.CacheStore')
+# Sobrescreve limites padrão, ex.: {'login:email_ip': '10/15m'}
+RATELIMITS = {}
+# Só habilite atrás de um proxy reverso confiável
+RATELIMIT_TRUST_X_FORWARDED_FOR = \
+    os.getenv('RATELIMIT_TRUST_X_FORWARDED_FOR', 'False') == 'True'
+# Quantos proxies confiáveis acrescentam ao X-Forwarded-For: o IP do cliente
+# é a entrada nessa posição a partir do fim (as anteriores são do cliente)
+RATELIMIT_TRUSTED_PROXY_COUNT = \
+    int(os.getenv('RATELIMIT_TRUSTED_PROXY_COUNT', 1))
 
 
 # Password validation
@@ -130,6 +394,29 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
 STATIC_URL = 'static/'
+STATICFILES_DIRS = [BASE_DIR / 'static']
+# Destino do `manage.py collectstatic`, servido pelo servidor web ou CDN
+STATIC_ROOT = os.getenv('STATIC_ROOT', BASE_DIR / 'staticfiles')
+
+# Em produção os arquivos estáticos ganham o hash do conteúdo no nome
+# (app.3f2a9c.css) e podem ser servidos com cache de longa duração
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'
+        if DEBUG else
+        'django.contrib.staticfiles.storage.ManifestStaticFilesStorage',
+    },
+}
+
+# Páginas anônimas (login, cadastro, redefinição de senha) com HTML igual
+# para todos, ETag e token CSRF entregue por /accounts/csrf/
+# (accounts.decorators.cacheable_page)
+CACHEABLE_PAGES = os.getenv('CACHEABLE_PAGES', 'True') == 'True'
+# max-age dessas páginas; com 0 o navegador sempre revalida (304)
+CACHEABLE_PAGE_MAX_AGE = int(os.getenv('CACHEABLE_PAGE_MAX_AGE', 0))
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -152,5 +439,35 @@ else:
     EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS', 'True') == 'True'
     DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 
+# Permite trocar o backend (ex.: filebased ou locmem) em testes locais
+if os.getenv('EMAIL_BACKEND'):
+    EMAIL_BACKEND = os.getenv('EMAIL_BACKEND')
+    EMAIL_FILE_PATH = os.getenv('EMAIL_FILE_PATH', BASE_DIR / 'sent_emails')
+
+# Fila de e-mails: as views gravam o e-mail e o comando send_queued_mail
+# faz o envio. Ligada por padrão quando há SMTP configurado.
+MAIL_QUEUE_ENABLED = os.getenv(
+    'MAIL_QUEUE_ENABLED', str(EMAIL_BACKEND.endswith('smtp.EmailBackend'))
+) == 'True'
+MAIL_QUEUE_MAX_ATTEMPTS = int(os.getenv('MAIL_QUEUE_MAX_ATTEMPTS', 5))
+# Atraso da primeira nova tentativa em segundos (dobra a cada falha)
+MAIL_QUEUE_RETRY_DELAY = int(os.getenv('MAIL_QUEUE_RETRY_DELAY', 60))
+# Tempo que um lote fica reservado para o worker que o pegou
+MAIL_QUEUE_LEASE = int(os.getenv('MAIL_QUEUE_LEASE', 300))
+# Segundos que os e-mails enviados ou que falharam ficam na fila antes de
+# serem removidos pelo send_queued_mail (o texto já é apagado no envio)
+MAIL_QUEUE_RETENTION = int(os.getenv('MAIL_QUEUE_RETENTION', 86400))
+
+# QR Code do 2FA: 'svg' dispensa o Pillow; 'png' mantém o formato antigo
+QR_CODE_FORMAT = os.getenv('QR_CODE_FORMAT', 'svg')
+# Alias de CACHES para compartilhar as imagens entre processos (opcional)
+QR_CODE_CACHE_ALIAS = os.getenv('QR_CODE_CACHE_ALIAS') or None
+QR_CODE_CACHE_TIMEOUT = int(os.getenv('QR_CODE_CACHE_TIMEOUT', 600))
+
+# Redefinição de senha: 'database' grava um PasswordResetToken por pedido;
+# 'signed' usa tokens assinados sem estado (nenhuma linha no banco)
+PASSWORD_RESET_MODE = os.getenv('PASSWORD_RESET_MODE', 'database')
+PASSWORD_RESET_TIMEOUT = int(os.getenv('PASSWORD_RESET_TIMEOUT', 60 * 60 * 24))
+
 LOGIN_URL = 'home'
 LOGIN_REDIRECT_URL = 'dashboard'
@@ -1,9 +1,18 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
-from accounts.views import login_view
+from accounts.async_views import alogin_view
+from accounts.urls import build_urlpatterns as accounts_urlpatterns
+from accounts.views import login_view, metrics_view
 
-urlpatterns = [
-    path('admin/', admin.site.urls),
-    path('', login_view, name='home'), # Define a view de login como a página inicial
-    path('accounts/', include('accounts.urls')), # Inclui as outras URLs de 'accounts'
-]
+
+def build_urlpatterns(async_auth_views=False):
+    return [
+        path('admin/', admin.site.urls),
+        path('metrics/', metrics_view, name='metrics'),
+        path('', alogin_view if async_auth_views else login_view, name='home'), # Define a view de login como a página inicial
+        path('accounts/', include(accounts_urlpatterns(async_auth_views))), # Inclui as outras URLs de 'accounts'
+    ]
+
+
+urlpatterns = build_urlpatterns(settings.ASYNC_AUTH_VIEWS)
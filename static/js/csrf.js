@@ -0,0 +1,52 @@
+/*
+ * Preenche o token CSRF dos formulários de páginas em cache
+ * (templates/accounts/csrf_field.html). Usa o cookie CSRF quando o
+ * navegador já o tem e, senão, busca o token em /accounts/csrf/.
+ */
+(function () {
+    var script = document.currentScript;
+    var fields = document.querySelectorAll('input[data-csrf]');
+    var pending = null;
+
+    function fill(token) {
+        fields.forEach(function (field) {
+            field.value = token;
+        });
+    }
+
+    function fromCookie(name) {
+        var match = document.cookie.match(
+            new RegExp('(?:^|; )' + name + '=([^;]*)')
+        );
+        return match ? decodeURIComponent(match[1]) : null;
+    }
+
+    function load() {
+        if (pending === null) {
+            var token = fromCookie(script.dataset.cookie);
+            pending = token ? Promise.resolve(token) : fetch(script.dataset.url, {
+                credentials: 'same-origin',
+            }).then(function (response) {
+                return response.json();
+            }).then(function (data) {
+                return data.token;
+            });
+            pending = pending.then(fill);
+        }
+        return pending;
+    }
+
+    fields.forEach(function (field) {
+        field.form.addEventListener('submit', function (event) {
+            if (field.value) {
+                return;
+            }
+            // Enviado antes do token chegar: aguarda e reenvia
+            event.preventDefault();
+            load().then(function () {
+                field.form.submit();
+            });
+        });
+    });
+    load();
+})();